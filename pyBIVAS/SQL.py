@@ -9,14 +9,27 @@ import pandas as pd
 import networkx as nx
 import sqlite3
 import numpy as np
+from scipy import sparse
 import logging
+import re
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from pyBIVAS.cache import QueryCache, DiskCache, is_select, copy_on_write, normalize_sql, sql_tables
+from pyBIVAS.dtypes import compact_dtypes, relabel
+from pyBIVAS.dialect import to_duckdb, to_mysql
+from pyBIVAS import mysql
+from pyBIVAS.lookup import LookupTables
+from pyBIVAS.network import RoutingGraph
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 try:
     from shapely.geometry import Point, LineString
+    import shapely
     import geopandas
 except:
     logger.warning('Loading of shapely/geopandas failed. Geometric functions will not work')
@@ -73,10 +86,77 @@ class pyBIVAS:
         'Upstream': 'Bovenstrooms'
     }
 
-    def __init__(self, databasefile=None):
+    # Indexes in the acceleration database, matching the queries in this class. Tables ending on _{} are created for
+    # all scenarios. Indexes of which not all columns exist in the table are skipped (differences in BIVAS versions),
+    # so a table can have an index per version of its columns
+    acceleration_indexes = {
+        'routes_{}': [('ArcID', 'TripID', 'OriginalArcDirection'), ('TripID', 'ArcID')],
+        'route_statistics_{}': [('TripID',)],
+        'infeasible_trips_{}': [('TripID',)],
+        'trips_{}': [('ID',)],
+        'trips': [('TrafficScenarioID', 'OriginTripEndPointNodeID'),
+                  ('TrafficScenarioID', 'DestinationTripEndPointNodeID')],
+        'arcs': [('FromNodeID',), ('ToNodeID',)],
+        'zone_node_mapping': [('NodeID', 'ZoneDefinitionID', 'ZoneID')],
+        'counting_point_arcs': [('ArcID', 'CountingPointID')],
+        'reference_trip_set': [
+            ('ReferenceTripSet', 'Arc', 'Trip'),  # Older versions of BIVAS
+            ('ReferenceSetID', 'CountingPointID', 'TripID'),
+        ],
+        'water_scenario_values': [('WaterScenarioID', 'ArcID')],
+    }
+
+    # Profiles of the connection to SQLite databases (see connectToSQLiteDatabase)
+    # - default: a normal connection that can read and write
+    # - readonly: read-only connection with a larger page cache and memory mapped I/O, for analysis of results
+    # - immutable: like readonly, but SQLite also assumes the file is not changed by another process (no locking).
+    #              Only use this when BIVAS is not running on the database.
+    connection_profiles = {
+        'default': {},
+        'readonly': {
+            'uri_parameters': {'mode': 'ro'},
+            'pragmas': {'query_only': 'ON', 'temp_store': 'MEMORY', 'cache_size': -256 * 1024,
+                        'mmap_size': 1024 ** 3},
+        },
+        'immutable': {
+            'uri_parameters': {'mode': 'ro', 'immutable': 1},
+            'pragmas': {'query_only': 'ON', 'temp_store': 'MEMORY', 'cache_size': -256 * 1024,
+                        'mmap_size': 1024 ** 3},
+        },
+    }
+
+    def __init__(self, databasefile=None, profile='default', engine='sqlite'):
         """
         Initialise class
-        """
+
+        profile: profile of the connection to the database, see connection_profiles
+        engine: 'sqlite', or 'duckdb' to execute queries on SQLite databases with DuckDB (see set_engine)
+        """
+        self.scenario_tables = None
+        self.incidence = None
+        self.query_cache = None
+        self.disk_cache = None
+        self.compact_dtypes = False
+        self.lookup_tables = None
+        self.cube = None
+
+        # Arcs and nodes (with geometries) per database and scenario, see network_arcs and network_nodes
+        self._network_tables = {}
+        # Origin-destination matrices per database, zone definition and traffic scenario, see zone_od_matrix
+        self._od_matrices = {}
+        self.profile = profile
+        self.engine = engine
+        self.duckdb = None
+        self._duckdb_fallbacks = set()  # Queries that DuckDB could not execute, see _read_sql_duckdb
+
+        # Pool of threads with their own connection to the database (see sql_parallel), only used by the statistics
+        # of nodes and zones after enable_parallel
+        self.parallel_workers = 1
+        self._pool = None
+        self._pool_connections = []
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
+
         if databasefile:
             self.connectToSQLiteDatabase(databasefile)
 
@@ -91,27 +171,177 @@ class pyBIVAS:
 
         import pymysql
 
-        self.connection = pymysql.connect(host=host,
-                                          user=user,
-                                          password=password,
-                                          db=db,
-                                          charset='utf8mb4',
-                                          cursorclass=pymysql.cursors.DictCursor)
+        self.close_connection_pool()
+        self.set_engine('sqlite')  # DuckDB can only attach SQLite databases
+        self._mysql_parameters = dict(host=host,
+                                      user=user,
+                                      password=password,
+                                      db=db,
+                                      charset='utf8mb4',
+                                      cursorclass=pymysql.cursors.DictCursor)
+        self.connection = pymysql.connect(**self._mysql_parameters)
+        self.database_identity = f'mysql://{user}@{host}/{db}'
+        if self.lookup_tables is not None:
+            self.lookup_tables.invalidate()
 
         return self.connection
 
-    def connectToSQLiteDatabase(self, databasefile):
+    def connectToSQLiteDatabase(self, databasefile, use_acceleration=True, profile=None):
         """
         Connect to sqlite3 databasefile (.db)
+
+        use_acceleration: connect to the acceleration database instead (see build_acceleration_database), if it exists
+                          and is newer than the database itself
+        profile: name of profile in connection_profiles (like 'readonly'), or a dictionary with uri_parameters and
+                 pragmas. By default the profile given to the constructor is used.
         """
         logger.info('Loading database: {}'.format(databasefile))
 
         self.databasefile = Path(databasefile)
         assert self.databasefile.exists(), 'Database does not exist'
 
-        self.connection = sqlite3.connect(self.databasefile)
+        connectfile = self.databasefile
+        accelerationfile = self.acceleration_databasefile()
+        if use_acceleration and accelerationfile.exists():
+            if accelerationfile.stat().st_mtime >= self.databasefile.stat().st_mtime:
+                logger.info('Using acceleration database: {}'.format(accelerationfile))
+                connectfile = accelerationfile
+            else:
+                logger.warning('Acceleration database is older than the database and is not used')
+
+        if profile is not None:
+            self.profile = profile
+        self.close_connection_pool()
+        self.connection = self._connect_sqlite(connectfile, self.profile)
+        self.connectfile = connectfile
+        self.database_identity = str(connectfile.resolve())
+        self._table_fingerprints = {}
+        if self.lookup_tables is not None:
+            self.lookup_tables.invalidate()
+        self.set_engine(self.engine)
         return self.connection
 
+    def _connect_sqlite(self, databasefile, profile, **kwargs):
+        """
+        Open connection to databasefile with the uri parameters and pragmas of the connection profile
+
+        kwargs are passed to sqlite3.connect
+        """
+        if isinstance(profile, str):
+            if profile not in self.connection_profiles:
+                raise ValueError(f'Unknown connection profile: {profile}. '
+                                 f'Choose from: {", ".join(self.connection_profiles)}')
+            profile = self.connection_profiles[profile]
+
+        uri_parameters = profile.get('uri_parameters')
+        if uri_parameters:
+            uri = Path(databasefile).resolve().as_uri() + '?' + '&'.join(f'{k}={v}' for k, v in uri_parameters.items())
+            connection = sqlite3.connect(uri, uri=True, **kwargs)
+        else:
+            connection = sqlite3.connect(databasefile, **kwargs)
+
+        for pragma, value in profile.get('pragmas', {}).items():
+            connection.execute(f'PRAGMA {pragma} = {value}')
+        return connection
+
+    def set_engine(self, engine='sqlite', threads=None):
+        """
+        Set the engine that executes the queries of sql() on a SQLite database
+
+        - sqlite: the connection to the database itself
+        - duckdb: DuckDB attaches the database read-only (with its sqlite extension) and executes the queries with
+                  multiple threads. The queries are translated to the dialect of DuckDB (see pyBIVAS.dialect).
+                  Queries that DuckDB does not support (like selecting columns that are not grouped or aggregated)
+                  are executed by SQLite. The extension is installed when it is not yet (this requires a
+                  connection to the internet); when that fails, the engine stays sqlite.
+
+        threads: number of threads of DuckDB, by default the number of cores
+        """
+        if engine not in ('sqlite', 'duckdb'):
+            raise ValueError(f'Unknown engine: {engine}. Choose from: sqlite, duckdb')
+        if engine == 'duckdb' and not isinstance(getattr(self, 'connection', None), sqlite3.Connection):
+            raise ValueError('The duckdb engine requires a connection to a SQLite database')
+
+        if self.duckdb is not None:
+            self.duckdb.close()
+            self.duckdb = None
+
+        self.engine = engine
+        if engine == 'duckdb':
+            import duckdb
+
+            self.duckdb = duckdb.connect()
+            if threads is not None:
+                self.duckdb.execute(f'SET threads = {int(threads)}')
+            try:
+                self.duckdb.execute('LOAD sqlite')
+            except duckdb.Error:
+                # Installing the extension requires a connection to the internet
+                logger.info('The sqlite extension of DuckDB is not installed yet, installing it')
+                try:
+                    self.duckdb.execute('INSTALL sqlite')
+                    self.duckdb.execute('LOAD sqlite')
+                except duckdb.Error as e:
+                    self.duckdb.close()
+                    self.duckdb = None
+                    self.engine = 'sqlite'
+                    logger.warning(f'The sqlite extension of DuckDB could not be installed, the queries are '
+                                   f'executed by SQLite: {e}')
+                    return
+            path = str(self.connectfile.resolve()).replace("'", "''")
+            self.duckdb.execute(f"ATTACH '{path}' AS bivas (TYPE sqlite, READ_ONLY)")
+            self.duckdb.execute('USE bivas')
+
+    def acceleration_databasefile(self):
+        """Path of the acceleration database that belongs to the database"""
+        return self.databasefile.with_suffix('.accelerated' + self.databasefile.suffix)
+
+    def build_acceleration_database(self, overwrite=False):
+        """
+        Create a copy of the database with indexes for the queries in this class (see acceleration_indexes)
+
+        The original database is never modified. The copy is stored next to the database (see
+        acceleration_databasefile) and is used automatically when connecting to the database. Statistics for the
+        query planner are computed with ANALYZE.
+        """
+        accelerationfile = self.acceleration_databasefile()
+        if accelerationfile.exists() and not overwrite:
+            logger.info('Acceleration database already exists: {}'.format(accelerationfile))
+        else:
+            logger.info('Creating acceleration database: {}'.format(accelerationfile))
+            tempfile = accelerationfile.with_name(accelerationfile.name + '.tmp')
+            if tempfile.exists():
+                tempfile.unlink()
+
+            source = sqlite3.connect(self.databasefile)
+            con = sqlite3.connect(tempfile)
+            source.backup(con)
+            source.close()
+
+            tables = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table'", con)['name']
+            for table_template, indexes in self.acceleration_indexes.items():
+                pattern = '^' + re.escape(table_template).replace(re.escape('{}'), r'\d+') + '$'
+                for table in tables[tables.str.match(pattern)]:
+                    columns = set(pd.read_sql(f'PRAGMA table_info("{table}")', con)['name'])
+                    for index_columns in indexes:
+                        if not columns.issuperset(index_columns):
+                            logger.debug('Skipping index on {} ({}): not all columns exist'.format(
+                                table, ', '.join(index_columns)))
+                            continue
+                        index_name = 'pyBIVAS_{}_{}'.format(table, '_'.join(index_columns))
+                        logger.info('Creating index {}'.format(index_name))
+                        con.execute('CREATE INDEX IF NOT EXISTS "{}" ON "{}" ({})'.format(
+                            index_name, table, ', '.join(f'"{c}"' for c in index_columns)))
+            con.execute('ANALYZE')
+            con.commit()
+            con.close()
+
+            tempfile.replace(accelerationfile)
+
+        self.connection.close()
+        self.connectToSQLiteDatabase(self.databasefile)
+        return accelerationfile
+
     def set_scenario(self, scenario=None):
         """
         Set scenario to perform analysis
@@ -145,6 +375,13 @@ class pyBIVAS:
         self.ReferenceTripSetID = scenarioOverview.loc[self.scenarioID,
                                                        'ReferenceTripSetID']
 
+        # Tables in memory belong to the previous scenario
+        self.incidence = None
+        if self.scenario_tables is not None:
+            self.load_scenario_tables()
+        if self.cube is not None:
+            self.enable_cube()
+
     # Basic lists
 
     def scenario_parameters(self):
@@ -165,7 +402,7 @@ class pyBIVAS:
         sql = """SELECT * FROM appearance_types ORDER BY Id"""
         appearance_types = self.sql(sql).set_index('ID')
         if rename_to_Leeg:
-            appearance_types.replace({'Description': self.appeareance_rename}, inplace=True)
+            appearance_types = relabel(appearance_types, {'Description': self.appeareance_rename})
         return appearance_types
 
     def CEMTclass(self):
@@ -178,7 +415,7 @@ class pyBIVAS:
         SELECT ship_types.*, cemt_class.Description
         FROM ship_types
         LEFT JOIN cemt_class ON CEMTTypeID=cemt_class.ID
-        ORDER BY CEMTTypeID, Id"""
+        ORDER BY ship_types.CEMTTypeID, ship_types.ID"""
         ship_types = self.sql(sql).set_index('ID')
         return ship_types
 
@@ -214,6 +451,19 @@ class pyBIVAS:
     def trips_timeseries(self):
         """Trips in scenario per date"""
 
+        if self.scenario_tables is not None:
+            trips = self.scenario_tables['trips']
+            df = pd.DataFrame({'date': trips['DateTime'].dt.normalize(),
+                               'TotalWeight__t': trips['TotalWeight__t'],
+                               'Weight': trips['TotalWeight__t'] * trips['NumberOfTrips'],
+                               'NumberOfTrips': trips['NumberOfTrips']})
+            gp = df.groupby('date', dropna=False)
+            df = pd.DataFrame({'nTrips': gp.size(),
+                               'AvgTotalWeight__t': gp['TotalWeight__t'].mean(),
+                               'SumTotalWeight__t': gp['Weight'].sum(min_count=1),
+                               'SumNumberOfTrips': gp['NumberOfTrips'].sum(min_count=1)})
+            return df
+
         sql = """
         SELECT DATE(DateTime) AS date,
                count(*) AS nTrips,
@@ -230,6 +480,17 @@ class pyBIVAS:
 
     def trips_details(self):
         """Get all trip properties"""
+        df = self.sql(self._trips_details_sql())
+        return self._format_trips_details(df)
+
+    def trips_details_chunks(self, chunksize=100000):
+        """
+        Get all trip properties like trips_details, as a generator of dataframes of at most chunksize trips
+        """
+        for df in self.sql_chunks(self._trips_details_sql(), chunksize=chunksize):
+            yield self._format_trips_details(df)
+
+    def _trips_details_sql(self):
         sql = """
         SELECT trips.*,
                ship_types.Label,
@@ -243,12 +504,13 @@ class pyBIVAS:
         LEFT JOIN appearance_types ON trips.AppearanceTypeID = appearance_types.ID
         LEFT JOIN dangerous_goods_levels ON trips.DangerousGoodsLevelID = dangerous_goods_levels.ID
         """.format(self.scenarioID)
+        return sql
 
-        df = self.sql(sql)
+    @staticmethod
+    def _format_trips_details(df):
         df = df.set_index('ID')
         df['DateTime'] = pd.to_datetime(df['DateTime'])
         df = df.drop(['SeasonID', 'ShipTypeID', 'DangerousGoodsLevelID', 'LoadTypeID'], axis=1)
-
         return df
 
     def trips_statistics(self, tripsArray: list):
@@ -256,6 +518,12 @@ class pyBIVAS:
         Get route statistics for an array of given trips
         """
 
+        if self.scenario_tables is not None:
+            trips = self.scenario_tables['trips']
+            trips = trips.loc[trips['ID'].isin(tripsArray), ['ID'] + self._trips_measure_columns]
+            df = trips.join(self.scenario_tables['route_statistics'][self._route_statistics_measure_columns])
+            return self._aggregate_route_statistics(df, by='ID')
+
         listOfTrips = ",".join(str(t) for t in tripsArray)
 
         sql = f"""
@@ -282,8 +550,36 @@ class pyBIVAS:
         - Destination_Node: Group by node of destination port
         - Origin_Zone: Group by Zone area of origins
         - Destination_Zone: Group by Zone area of destinations
+
+        When the scenario tables are loaded in memory (see load_scenario_tables) or the aggregate cube is enabled
+        (see enable_cube), groupings on Days, NSTR and Vorm are computed from memory or from the cube.
+        """
+
+        if self.scenario_tables is not None and self._memory_groupby(group_by):
+            df = self._routestatistics_advanced_memory(group_by)
+            return self._format_routestatistics_advanced(df, group_by, include_all_columns=False)
+
+        if self._cube_available() and self._memory_groupby(group_by):
+            df = self._cube_query(group_by or []).drop(columns='Aantal')
+            return self._format_routestatistics_advanced(df, group_by, include_all_columns=False)
+
+        sql, include_all_columns = self._routestatistics_advanced_sql(group_by)
+        df = self.sql(sql)
+        return self._format_routestatistics_advanced(df, group_by, include_all_columns)
+
+    def routestatistics_advanced_chunks(self, group_by=['TripsID'], chunksize=100000):
+        """
+        Results of routestatistics_advanced as a generator of dataframes of at most chunksize rows. Use this for
+        groupings with many rows (like TripsID) to limit the memory usage.
+
+        Every group is contained in a single chunk, but the chunks are only sorted within themselves.
         """
+        sql, include_all_columns = self._routestatistics_advanced_sql(group_by)
+        for df in self.sql_chunks(sql, chunksize=chunksize):
+            yield self._format_routestatistics_advanced(df, group_by, include_all_columns)
 
+    def _routestatistics_advanced_sql(self, group_by):
+        """Query of routestatistics_advanced, and whether it includes all columns of the trips"""
         sql_select = ''
         sql_groupby = ''
         sql_leftjoin = ''
@@ -291,9 +587,8 @@ class pyBIVAS:
 
         include_all_columns = False
 
-        if not group_by:
-            sql_groupby = 'Null'
-        else:
+        # Without group_by, the statistics of all trips are returned in a single row (no GROUP BY)
+        if group_by:
             if 'TripsID' in group_by:
                 sql_select += 'trips.ID AS "TripsID",'
                 sql_groupby += 'trips.ID, '
@@ -306,38 +601,39 @@ class pyBIVAS:
 
             if 'NSTR' in group_by or include_all_columns:
                 sql_select += 'nstr_mapping.GroupCode AS "NSTR",'
-                sql_groupby += 'NstrGoodsClassification, '
+                sql_groupby += 'nstr_mapping.GroupCode, '
                 sql_leftjoin += 'LEFT JOIN nstr_mapping ON trips.NstrGoodsClassification = nstr_mapping.GroupCode '
 
             if 'NST2007' in group_by or include_all_columns:
                 sql_select += 'nst2007_mapping.Id || "] " || nst2007_mapping.GroupCode || " - " || nst2007_mapping.Description AS "NST2007",'
-                sql_groupby += 'Nst2007GoodsClassification, '
+                sql_groupby += 'nst2007_mapping.Id, nst2007_mapping.GroupCode, nst2007_mapping.Description, '
                 sql_leftjoin += 'LEFT JOIN nst2007_mapping ON trips.Nst2007GoodsClassification = nst2007_mapping.Id '
 
             if 'Vorm' in group_by or include_all_columns:
                 sql_select += 'appearance_types.Description AS "Vorm",'
-                sql_groupby += 'trips.AppearanceTypeID, '
+                sql_groupby += 'appearance_types.ID, appearance_types.Description, '
                 sql_leftjoin += 'LEFT JOIN appearance_types ON trips.AppearanceTypeID = appearance_types.ID '
 
             if 'Origin_Node' in group_by or include_all_columns:
                 sql_select += 'trips.OriginTripEndPointNodeID AS "Origin_Node",'
                 sql_select += 'nodes_origin.XCoordinate AS "Origin_X",'
                 sql_select += 'nodes_origin.YCoordinate AS "Origin_Y",'
-                sql_groupby += 'trips.OriginTripEndPointNodeID, '
+                sql_groupby += 'trips.OriginTripEndPointNodeID, nodes_origin.XCoordinate, nodes_origin.YCoordinate, '
                 sql_leftjoin += 'LEFT JOIN nodes AS nodes_origin ON trips.OriginTripEndPointNodeID = nodes_origin.ID '
 
             if 'Destination_Node' in group_by or include_all_columns:
                 sql_select += 'trips.DestinationTripEndPointNodeID AS "Destination_Node",'
                 sql_select += 'nodes_destination.XCoordinate AS "Destination_X",'
                 sql_select += 'nodes_destination.YCoordinate AS "Destination_Y",'
-                sql_groupby += 'trips.DestinationTripEndPointNodeID, '
+                sql_groupby += ('trips.DestinationTripEndPointNodeID, nodes_destination.XCoordinate, '
+                                'nodes_destination.YCoordinate, ')
                 sql_leftjoin += 'LEFT JOIN nodes AS nodes_destination ON trips.DestinationTripEndPointNodeID = nodes_destination.ID '
 
             if 'Origin_Zone' in group_by or include_all_columns:
                 zone_definition_id = 9
                 sql_leftjoin += 'LEFT JOIN zone_node_mapping AS znm_Origin ON trips.OriginTripEndPointNodeID = znm_Origin.NodeID '
                 sql_leftjoin += 'LEFT JOIN zones AS zones_origin ON znm_Origin.ZoneID = zones_origin.ID '
-                sql_groupby += 'zones_origin.ID, '
+                sql_groupby += 'zones_origin.ID, zones_origin.Name, '
                 sql_select += 'zones_origin.Name AS Origin_Zone, '
                 sql_where += f' zones_origin.ZoneDefinitionID = {zone_definition_id} AND znm_Origin.ZoneDefinitionID = {zone_definition_id} AND '
 
@@ -345,7 +641,7 @@ class pyBIVAS:
                 zone_definition_id = 9
                 sql_leftjoin += 'LEFT JOIN zone_node_mapping AS znm_Destination ON trips.DestinationTripEndPointNodeID = znm_Destination.NodeID '
                 sql_leftjoin += 'LEFT JOIN zones AS zones_destination ON znm_Destination.ZoneID = zones_destination.ID '
-                sql_groupby += 'zones_destination.ID, '
+                sql_groupby += 'zones_destination.ID, zones_destination.Name, '
                 sql_select += 'zones_destination.Name AS Destination_Zone, '
                 sql_where += f' zones_destination.ZoneDefinitionID = {zone_definition_id} AND znm_Destination.ZoneDefinitionID = {zone_definition_id} AND '
 
@@ -367,7 +663,9 @@ class pyBIVAS:
                     LEFT JOIN cemt_class ON ship_types.CEMTTypeID = cemt_class.Id
                     LEFT JOIN dangerous_goods_levels ON trips.DangerousGoodsLevelID = dangerous_goods_levels.ID
                     LEFT JOIN load_types ON trips.LoadTypeID = load_types.ID"""
-                sql_groupby = 'Trips.ID'
+                sql_groupby = 'trips.ID'
+
+            sql_groupby = f'GROUP BY {sql_groupby}'
 
         if not sql_where:
             sql_where = '1'
@@ -379,24 +677,19 @@ class pyBIVAS:
         LEFT JOIN trips_{self.scenarioID} AS trips ON route_statistics.TripID = trips.ID
         {sql_leftjoin}
         WHERE {sql_where} AND trips.NumberOfTrips > 0
-        GROUP BY {sql_groupby}
+        {sql_groupby}
         """
+        return sql, include_all_columns
 
-        df = self.sql(sql)
+    def _format_routestatistics_advanced(self, df, group_by, include_all_columns):
+        """Apply the formatting of routestatistics_advanced to the raw results"""
 
         # Use short strings for NSTR classes
-        df = df.replace({'NSTR': self.NSTR_shortnames})
-        df = df.replace({'Vorm': self.appeareance_rename})
+        df = relabel(df, {'NSTR': self.NSTR_shortnames, 'Vorm': self.appeareance_rename})
 
         # Extra kolommen:
         if include_all_columns:
-            df['Beladingsgraad'] = df['TotalWeight__t'] / df['LoadCapacity__t']
-            C_w = 0.9 # could also be received from database, but it's constant anyway
-            df['TPCMI'] = 0.01 * df['Length__m'] * df['Width__m'] * C_w
-            df['Ledige_diepgang'] = df['Depth__m'] - df['TotalWeight__t'] / (df['TPCMI']*100)
-            df['Maximale_diepgang'] = df['Depth__m'] + (df['LoadCapacity__t'] - df['TotalWeight__t']) / (df['TPCMI']*100)
-            df['Totale Vaarkosten per TonKM'] = df['Totale Vaarkosten (EUR)'] / df['Totale TonKM (TONKM)']
-
+            df = self._add_trip_derived_columns(df)
 
         # Format dates
         if 'Days' in df.columns:
@@ -407,9 +700,32 @@ class pyBIVAS:
             df = df.set_index(group_by).sort_index()
         return df
 
+    @staticmethod
+    def _add_trip_derived_columns(df):
+        """Add columns that are derived from the properties of the trips (like Beladingsgraad and the drafts)"""
+        # Compute in double precision, also when the columns are float32 (see enable_compact_dtypes)
+        c = {column: df[column].astype('float64') for column in
+             ['TotalWeight__t', 'LoadCapacity__t', 'Length__m', 'Width__m', 'Depth__m']}
+
+        df['Beladingsgraad'] = c['TotalWeight__t'] / c['LoadCapacity__t']
+        C_w = 0.9 # could also be received from database, but it's constant anyway
+        df['TPCMI'] = 0.01 * c['Length__m'] * c['Width__m'] * C_w
+        df['Ledige_diepgang'] = c['Depth__m'] - c['TotalWeight__t'] / (df['TPCMI']*100)
+        df['Maximale_diepgang'] = c['Depth__m'] + (c['LoadCapacity__t'] - c['TotalWeight__t']) / (df['TPCMI']*100)
+        df['Totale Vaarkosten per TonKM'] = df['Totale Vaarkosten (EUR)'] / df['Totale TonKM (TONKM)']
+        return df
+
     def routestatistics_timeseries(self):
         """Routes in scenario per date"""
 
+        if self.scenario_tables is not None:
+            df = self.scenario_tables['route_statistics_trips']
+            df = df.assign(date=df['DateTime'].dt.normalize())
+            count = df.groupby('date', dropna=False).size().rename('count')
+            df = self._aggregate_route_statistics(df, by='date')
+            df.insert(0, 'count', count)
+            return df
+
         if self.sql_tableexists(f'route_statistics_{self.scenarioID}'):
             sql = f"""
             SELECT DATE(trips.DateTime) AS date,
@@ -455,27 +771,45 @@ class pyBIVAS:
         """
         Load advanced route and shipstats for specified RouteID
         """
-        sql = """
-        SELECT  trips.*,
-                route.*,
-                nstr_mapping.Description AS nstr_description,
-                nst2007_mapping.Description AS nst2007_description,
-                appearance_types.Description AS appear_description,
-                ship_types.Label AS ship_label,
-                ship_types.Description as ship_description,
-                cemt_class.Description as cemt_class,
-                dangerous_goods_levels.Description AS dangerous_description
-        FROM route_statistics_{0} AS route
-        LEFT JOIN trips_{0} AS trips ON route.TripID = trips.ID
-        LEFT JOIN nstr_mapping ON trips.NstrGoodsClassification = nstr_mapping.GroupCode
-        LEFT JOIN nst2007_mapping ON trips.Nst2007GoodsClassification = nst2007_mapping.Id
-        LEFT JOIN appearance_types ON trips.AppearanceTypeID = appearance_types.ID
-        LEFT JOIN ship_types ON trips.ShipTypeID = ship_types.ID
-        LEFT JOIN cemt_class ON ship_types.CEMTTypeID = cemt_class.Id
-        LEFT JOIN dangerous_goods_levels ON trips.DangerousGoodsLevelID = dangerous_goods_levels.ID
-        WHERE TripID = {1}
-        """.format(self.scenarioID, routeID)
-        routestats = self.sql(sql)
+        if self.lookup_tables is not None:
+            sql = f"""
+            SELECT trips.*,
+                   route.*
+            FROM route_statistics_{self.scenarioID} AS route
+            LEFT JOIN trips_{self.scenarioID} AS trips ON route.TripID = trips.ID
+            WHERE TripID = {routeID}
+            """
+            routestats = self.lookup_tables.join(self.sql(sql), {
+                'nstr_description': ('nstr_mapping', 'Description'),
+                'nst2007_description': ('nst2007_mapping', 'Description'),
+                'appear_description': ('appearance_types', 'Description'),
+                'ship_label': ('ship_types', 'Label'),
+                'ship_description': ('ship_types', 'Description'),
+                'cemt_class': ('cemt_class', 'Description'),
+                'dangerous_description': ('dangerous_goods_levels', 'Description'),
+            }, categorical=self.compact_dtypes)
+        else:
+            sql = """
+            SELECT  trips.*,
+                    route.*,
+                    nstr_mapping.Description AS nstr_description,
+                    nst2007_mapping.Description AS nst2007_description,
+                    appearance_types.Description AS appear_description,
+                    ship_types.Label AS ship_label,
+                    ship_types.Description as ship_description,
+                    cemt_class.Description as cemt_class,
+                    dangerous_goods_levels.Description AS dangerous_description
+            FROM route_statistics_{0} AS route
+            LEFT JOIN trips_{0} AS trips ON route.TripID = trips.ID
+            LEFT JOIN nstr_mapping ON trips.NstrGoodsClassification = nstr_mapping.GroupCode
+            LEFT JOIN nst2007_mapping ON trips.Nst2007GoodsClassification = nst2007_mapping.Id
+            LEFT JOIN appearance_types ON trips.AppearanceTypeID = appearance_types.ID
+            LEFT JOIN ship_types ON trips.ShipTypeID = ship_types.ID
+            LEFT JOIN cemt_class ON ship_types.CEMTTypeID = cemt_class.Id
+            LEFT JOIN dangerous_goods_levels ON trips.DangerousGoodsLevelID = dangerous_goods_levels.ID
+            WHERE TripID = {1}
+            """.format(self.scenarioID, routeID)
+            routestats = self.sql(sql)
 
         routestats['Beladingsgraad'] = routestats['TotalWeight__t'] / routestats['LoadCapacity__t']
         # C_w = 0.9 # could also be received from database, but it's constant anyway
@@ -535,8 +869,8 @@ class pyBIVAS:
 
         if (LengthPenalty is None) or (WidthPenalty is None):
             LengthPenalty, WidthPenalty = \
-            self.scenario_parameters()[['RestrictionRelaxationLengthPenalty__min_m_km',
-                                        'RestrictionRelaxationWidthPenalty__min_dm_km']].values[0]
+            self.scenario_parameters().loc[[self.scenarioID], ['RestrictionRelaxationLengthPenalty__min_m_km',
+                                                               'RestrictionRelaxationWidthPenalty__min_dm_km']].values[0]
 
         # Get parameters of ship
         routestats = self.route_stats(tripID)
@@ -568,6 +902,57 @@ class pyBIVAS:
 
         return penalty_per_arc, penalty_total
 
+    def scenario_relaxation(self, LengthPenalty=None, WidthPenalty=None):
+        """
+        Compute the relaxation penalties of all trips in the scenario, like route_computerelaxation, in one pass over
+        the incidence matrix of trips and arcs (see routes_incidence)
+
+        Returns two dataframes with the columns Relaxation_penalty_length, Relaxation_penalty_width and
+        Relaxation_penalty: the total per trip (index TripID), and the sum over all trips per arc (index ArcID)
+        """
+        if (LengthPenalty is None) or (WidthPenalty is None):
+            LengthPenalty, WidthPenalty = \
+            self.scenario_parameters().loc[[self.scenarioID], ['RestrictionRelaxationLengthPenalty__min_m_km',
+                                                               'RestrictionRelaxationWidthPenalty__min_dm_km']].values[0]
+
+        incidence = self.routes_incidence()
+        matrix = incidence['matrix']
+        rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        columns = matrix.indices
+
+        sql = f"""
+        SELECT arcs.ID, arcs.MaximumLength__m, arcs.MaximumWidth__m, arcs.Length__m
+        FROM arcs
+        LEFT JOIN `branching$branch_sets` AS BS ON arcs.BranchSetID = BS.Id
+        WHERE BS.BranchID = {self.scenarioID}
+        """
+        arcs = self.sql(sql).set_index('ID').reindex(incidence['ArcID']).astype(np.float64)
+        arcs = arcs.replace({0: np.nan})
+
+        if self.scenario_tables is not None:
+            trips = self.scenario_tables['trips'][['Length__m', 'Width__m']]
+        else:
+            trips = self.sql(f'SELECT ID, Length__m, Width__m FROM trips_{self.scenarioID}').set_index('ID')
+        trips = trips.reindex(incidence['TripID']).astype(np.float64)
+
+        # Penalty of each passage of a trip over an arc, zero where the arc has no restriction
+        km = arcs['Length__m'].to_numpy()[columns] / 1000
+        relaxation_length = trips['Length__m'].to_numpy()[rows] - arcs['MaximumLength__m'].to_numpy()[columns]
+        relaxation_width = trips['Width__m'].to_numpy()[rows] - arcs['MaximumWidth__m'].to_numpy()[columns]
+        penalties = {
+            'Relaxation_penalty_length': np.where(relaxation_length > 0, relaxation_length * km * LengthPenalty, 0),
+            'Relaxation_penalty_width': np.where(relaxation_width > 0, relaxation_width * 10 * km * WidthPenalty, 0),
+        }
+        penalties = {k: np.nan_to_num(v) * matrix.data for k, v in penalties.items()}
+
+        per_trip = pd.DataFrame({k: np.bincount(rows, weights=v, minlength=matrix.shape[0])
+                                 for k, v in penalties.items()}, index=pd.Index(incidence['TripID'], name='TripID'))
+        per_arc = pd.DataFrame({k: np.bincount(columns, weights=v, minlength=matrix.shape[1])
+                                for k, v in penalties.items()}, index=pd.Index(incidence['ArcID'], name='ArcID'))
+        for df in [per_trip, per_arc]:
+            df['Relaxation_penalty'] = df['Relaxation_penalty_length'] + df['Relaxation_penalty_width']
+        return per_trip, per_arc
+
     def infeasibletrips_timeseries(self):
         """Infeasible Trips in scenario per date"""
         sql = """
@@ -601,7 +986,7 @@ class pyBIVAS:
 
         df = self.sql(sql)
         df['Days'] = pd.to_datetime(df['Days'])
-        df = df.replace({'NSTR': self.NSTR_shortnames})
+        df = relabel(df, {'NSTR': self.NSTR_shortnames})
         df = df.set_index('ID')
         return df
 
@@ -644,14 +1029,63 @@ class pyBIVAS:
 
         NOTE: Not all columns give proper info when using groupby
 
-        TODO: Add functionality to add multiple arcID and to include an exclude_ardID like with route_stats
+        TODO: Include an exclude_ardID like with route_stats
+        """
+        df = self.arcs_tripdetails([arcID], extended=extended, group_by=group_by)
+        return df.droplevel('ArcID')
+
+    def arcs_tripdetails(self, arcIDs, extended=True, group_by=None):
+        """
+        All vessels passing any of the given arcs, like arc_tripdetails, but for a list of arcs in one query.
+
+        Returns a dataframe with an extra index level ArcID
+        """
+        if not extended and self.scenario_tables is not None:
+            dfs = []
+            for arcID in arcIDs:
+                routes = self._scenario_tables_arc(arcID)
+                df = self.scenario_tables['trips'].reindex(routes['TripID'].values).reset_index(drop=True)
+                df.insert(0, 'ArcID', arcID)
+                df['OriginalArcDirection'] = routes['OriginalArcDirection'].values
+                dfs.append(df)
+            df = pd.concat(dfs, ignore_index=True)
+        else:
+            df = self.sql(self._arcs_tripdetails_sql(arcIDs, extended, group_by))
+        return self._format_arcs_tripdetails(df, extended, group_by)
+
+    def arc_tripdetails_chunks(self, arcID, extended=True, group_by=None, chunksize=100000):
         """
+        Vessels passing a specified arc like arc_tripdetails, as a generator of dataframes of at most chunksize rows
+        """
+        sql = self._arcs_tripdetails_sql([arcID], extended, group_by)
+        for df in self.sql_chunks(sql, chunksize=chunksize):
+            yield self._format_arcs_tripdetails(df, extended, group_by).droplevel('ArcID')
+
+    def _arcs_tripdetails_sql(self, arcIDs, extended, group_by):
+        arcIDsStr = ', '.join(str(a) for a in arcIDs)
+
+        if self._tripdetails_with_lookup_tables(extended, group_by):
+            # The descriptions are added by _format_arcs_tripdetails
+            return f"""
+            SELECT routes.ArcID AS ArcID,
+                   trips.*,
+                   routes.OriginalArcDirection,
+                   route_statistics.*,
+                   {self.compute_route_statistics}
+            FROM routes_{self.scenarioID} AS routes
+            LEFT JOIN trips_{self.scenarioID} AS trips ON routes.TripID = trips.ID
+            LEFT JOIN route_statistics_{self.scenarioID} AS route_statistics ON route_statistics.TripID = routes.TripID
+            WHERE routes.ArcID IN ({arcIDsStr}) AND trips.NumberOfTrips > 0
+            GROUP BY routes.ArcID, trips.ID
+            """
+
         if not group_by:
             group_by = 'trips.ID'
 
         if extended:
             sql = f"""
-            SELECT trips.*,
+            SELECT routes.ArcID AS ArcID,
+                   trips.*,
                    routes.OriginalArcDirection,
                    route_statistics.*,
                    ship_types.Label AS ship_types_Label,
@@ -674,36 +1108,55 @@ class pyBIVAS:
             LEFT JOIN dangerous_goods_levels ON trips.DangerousGoodsLevelID = dangerous_goods_levels.ID
             LEFT JOIN route_statistics_{self.scenarioID} AS route_statistics ON route_statistics.TripID = routes.TripID
             LEFT JOIN load_types ON trips.LoadTypeID = load_types.ID
-            WHERE ArcID = {arcID} AND trips.NumberOfTrips > 0
-            GROUP BY {group_by}
+            WHERE routes.ArcID IN ({arcIDsStr}) AND trips.NumberOfTrips > 0
+            GROUP BY routes.ArcID, {group_by}
             """
         else:
             sql = f"""
-            SELECT trips.*,
+            SELECT routes.ArcID AS ArcID,
+                   trips.*,
                    routes.OriginalArcDirection
             FROM routes_{self.scenarioID} AS routes
             LEFT JOIN trips_{self.scenarioID} AS trips ON routes.TripID = trips.ID
-            WHERE ArcID = {arcID}
+            WHERE routes.ArcID IN ({arcIDsStr})
             """
-
-        df = self.sql(sql)
-
-        df = df.replace({'NSTR': self.NSTR_shortnames})
-        df = df.replace({'appearance_types_Description': self.appeareance_rename})
+        return sql
+
+    def _tripdetails_with_lookup_tables(self, extended, group_by):
+        """Whether the descriptions in arc_tripdetails are added from the lookup tables (see enable_lookup_tables)"""
+        # When grouped, the query can group on the descriptions
+        return self.lookup_tables is not None and extended and (not group_by or group_by == 'trips.ID')
+
+    def _tripdetails_lookup_columns(self):
+        """Columns of the lookup tables in the results of arc_tripdetails"""
+        columns = {
+            'ship_types_Label': ('ship_types', 'Label'),
+            'ship_types_Description': ('ship_types', 'Description'),
+            'cemt_class_ID': ('cemt_class', 'Id'),
+            'cemt_class_Description': ('cemt_class', 'Description'),
+            'NSTR': ('nstr_mapping', 'GroupCode'),
+            'nstr_Description': ('nstr_mapping', 'Description'),
+        }
+        for column in self.lookup_tables.columns('nst2007_mapping'):
+            columns[column] = ('nst2007_mapping', column)
+        columns['appearance_types_Description'] = ('appearance_types', 'Description')
+        columns['dangerous_goods_levels_Description'] = ('dangerous_goods_levels', 'Description')
+        return columns
+
+    def _format_arcs_tripdetails(self, df, extended, group_by):
+        if self._tripdetails_with_lookup_tables(extended, group_by):
+            df = self.lookup_tables.join(df, self._tripdetails_lookup_columns(), categorical=self.compact_dtypes)
+
+        df = relabel(df, {'NSTR': self.NSTR_shortnames, 'appearance_types_Description': self.appeareance_rename})
 
         # Extra kolommen:
         if extended:
-            df['Beladingsgraad'] = df['TotalWeight__t'] / df['LoadCapacity__t']
-            C_w = 0.9 # could also be received from database, but it's constant anyway
-            df['TPCMI'] = 0.01 * df['Length__m'] * df['Width__m'] * C_w
-            df['Ledige_diepgang'] = df['Depth__m'] - df['TotalWeight__t'] / (df['TPCMI']*100)
-            df['Maximale_diepgang'] = df['Depth__m'] + (df['LoadCapacity__t'] - df['TotalWeight__t']) / (df['TPCMI']*100)
-            df['Totale Vaarkosten per TonKM'] = df['Totale Vaarkosten (EUR)'] / df['Totale TonKM (TONKM)']
-
-        if group_by == 'trips.ID':
-            df = df.set_index('ID')
+            df = self._add_trip_derived_columns(df)
+
+        if not group_by or group_by == 'trips.ID':
+            df = df.set_index(['ArcID', 'ID'])
         else:
-            df = df.set_index(group_by)
+            df = df.set_index(['ArcID', group_by])
 
         df['DateTime'] = pd.to_datetime(df['DateTime'])
         df = df.drop(['SeasonID', 'ShipTypeID', 'DangerousGoodsLevelID', 'LoadTypeID'], axis=1)
@@ -729,6 +1182,31 @@ class pyBIVAS:
         df = df.set_index('ID')
         return df
 
+    def arcs_routestatistics(self, arcIDs):
+        """
+        Compute route statistics for a list of ArcIDs in one query, like arc_routestatistics
+
+        Returns a dataframe with one row per ArcID
+        """
+        arcIDsStr = ', '.join(str(a) for a in arcIDs)
+        sql = f"""
+        SELECT routes.ArcID AS ArcID,
+               trips.ID,
+               (trips.NumberOfTrips) AS "Aantal Vaarbewegingen (-)",
+               (trips.TotalWeight__t * trips.NumberOfTrips) AS "Totale Vracht (ton)",
+               (trips.TwentyFeetEquivalentUnits * trips.NumberOfTrips) AS "Totale TEU (-)",
+               {self.compute_route_statistics}
+        FROM routes_{self.scenarioID} AS routes
+        LEFT JOIN trips_{self.scenarioID} AS trips ON routes.TripID = trips.ID
+        LEFT JOIN route_statistics_{self.scenarioID} AS route_statistics ON route_statistics.TripID = routes.TripID
+        WHERE routes.ArcID IN ({arcIDsStr}) AND trips.NumberOfTrips > 0
+        GROUP BY routes.ArcID
+        """
+
+        df = self.sql(sql)
+        df = df.set_index('ArcID')
+        return df
+
     def arc_usagestatistics(self):
         sql = """
         SELECT ArcID,
@@ -749,7 +1227,13 @@ class pyBIVAS:
 
         NOTE: It can happen that multiple ArcID are given, and one should expect that all have equal (maximum) trip count.
         However, in BIVAS/IVS it can happen that a ship passes and arc multiple times. This can result in irregularities.
+
+        When the incidence matrix of the scenario is available (see routes_incidence), it is used instead of the
+        database.
         """
+        if self.incidence is not None:
+            return self._arc_routes_on_network_incidence(arcID, not_passing_arcID)
+
         if not not_passing_arcID and isinstance(arcID, int):
             # All routes of ships passing 1 point
             sql = f"""
@@ -821,12 +1305,147 @@ class pyBIVAS:
         df = df.set_index('ArcID')
         return df
 
+    def routes_incidence(self):
+        """
+        Sparse incidence matrix of trips and arcs of the scenario.
+
+        Returns a dictionary with:
+            matrix: scipy.sparse CSR matrix (trips x arcs) with the number of times a trip passes an arc
+            TripID: TripID of each row
+            ArcID: ArcID of each column
+            NumberOfTrips: NumberOfTrips of each row
+
+        The matrix is computed once per scenario, and used by select_link and arc_routes_on_network. Without routes
+        (like a scenario that is not computed yet) the matrix is 0 x 0.
+        """
+        if self.incidence is not None:
+            return self.incidence
+
+        logger.info(f'Computing incidence matrix of trips and arcs for scenario {self.scenarioID}')
+        if self.scenario_tables is not None:
+            routes = self.scenario_tables['routes'][['TripID', 'ArcID']]
+        else:
+            routes = self.sql(f'SELECT TripID, ArcID FROM routes_{self.scenarioID}')
+
+        tripIDs, rows = np.unique(routes['TripID'].to_numpy(dtype=np.int64), return_inverse=True)
+        arcIDs, columns = np.unique(routes['ArcID'].to_numpy(dtype=np.int64), return_inverse=True)
+        matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows.ravel(), columns.ravel())),
+                                   shape=(len(tripIDs), len(arcIDs)))
+        matrix.sum_duplicates()
+
+        trips = self.sql(f'SELECT ID, NumberOfTrips FROM trips_{self.scenarioID}').set_index('ID')
+        numberoftrips = trips['NumberOfTrips'].reindex(tripIDs).fillna(0).values
+
+        self.incidence = {
+            'matrix': matrix,
+            'matrix_csc': matrix.tocsc(),
+            'TripID': tripIDs,
+            'ArcID': arcIDs,
+            'NumberOfTrips': numberoftrips,
+        }
+        return self.incidence
+
+    def _incidence_columns(self, arcIDs):
+        """Dense (trips x len(arcIDs)) array with the number of passages of each trip over the arcs"""
+        incidence = self.routes_incidence()
+        arcIDs = np.atleast_1d(arcIDs)
+        columns = np.minimum(np.searchsorted(incidence['ArcID'], arcIDs), max(len(incidence['ArcID']) - 1, 0))
+        # Arcs without any trip are not in the matrix
+        exists = (incidence['ArcID'][columns] == arcIDs) if len(incidence['ArcID']) else np.zeros(len(arcIDs), bool)
+
+        passages = np.zeros((len(incidence['TripID']), len(arcIDs)), dtype=np.int32)
+        if exists.any():
+            passages[:, exists] = incidence['matrix_csc'][:, columns[exists]].toarray()
+        return passages
+
+    def select_link(self, passing_all=None, passing_none=None, passing_any=None):
+        """
+        Select trips on their route (select link analysis), using the incidence matrix of the scenario
+
+        passing_all: list of ArcIDs that are all passed by the trip
+        passing_none: list of ArcIDs that are not passed by the trip
+        passing_any: list of ArcIDs of which at least one is passed by the trip
+
+        Returns boolean array with the selection of rows of the incidence matrix (see routes_incidence)
+        """
+        incidence = self.routes_incidence()
+        selection = np.ones(len(incidence['TripID']), dtype=bool)
+
+        if passing_all:
+            selection &= (self._incidence_columns(passing_all) > 0).all(axis=1)
+        if passing_none:
+            selection &= ~(self._incidence_columns(passing_none) > 0).any(axis=1)
+        if passing_any:
+            selection &= (self._incidence_columns(passing_any) > 0).any(axis=1)
+        return selection
+
+    def select_link_trips(self, passing_all=None, passing_none=None, passing_any=None):
+        """TripIDs of the trips in the select link analysis (see select_link)"""
+        selection = self.select_link(passing_all, passing_none, passing_any)
+        return self.routes_incidence()['TripID'][selection]
+
+    def select_link_network(self, passing_all=None, passing_none=None, passing_any=None):
+        """
+        Distribution over the network of the trips in the select link analysis (see select_link)
+
+        Returns per ArcID the number of selected trips passing the arc (each trip counted once), and the sum of the
+        NumberOfTrips of these trips.
+        """
+        incidence = self.routes_incidence()
+        selection = self.select_link(passing_all, passing_none, passing_any)
+
+        passed = incidence['matrix'][selection] > 0
+        df = pd.DataFrame({
+            'ArcID': incidence['ArcID'],
+            'Aantal': np.asarray(passed.sum(axis=0)).ravel(),
+            'Aantal Vaarbewegingen (-)': passed.T.dot(incidence['NumberOfTrips'][selection]),
+        })
+        df = df[df['Aantal'] > 0].set_index('ArcID')
+        return df
+
+    def _arc_routes_on_network_incidence(self, arcID, not_passing_arcID=None):
+        """
+        Equivalent of the query in arc_routes_on_network using the incidence matrix
+
+        The query counts a trip once for every combination of passages of the arcs in arcID, this is reproduced by
+        weighing the trips with the product of their passages.
+        """
+        if not isinstance(arcID, list):
+            arcID = [arcID]
+        if not isinstance(not_passing_arcID, list):
+            not_passing_arcID = [not_passing_arcID] if isinstance(not_passing_arcID, int) else []
+
+        incidence = self.routes_incidence()
+        weight = self._incidence_columns(arcID).prod(axis=1)
+        if not_passing_arcID:
+            weight[(self._incidence_columns(not_passing_arcID) > 0).any(axis=1)] = 0
+
+        selection = weight > 0
+        aantal = incidence['matrix'][selection].T.dot(weight[selection])
+        df = pd.DataFrame({'ArcID': incidence['ArcID'], 'Aantal': aantal})
+        df = df[df['Aantal'] > 0].set_index('ArcID')
+        return df
+
     def arcs_timeseries(self, ArcIDs):
         """
         For a list of ArcIDs give the number of daily routes
         """
 
         ArcIDsStr = str(ArcIDs).strip('[]')
+        if self._cube_available():
+            sql = f"""
+            SELECT Days AS date,
+                   SUM(Aantal) AS SumNumberOfTrips,
+                   ArcID
+            FROM cube_arcs_{self.scenarioID}
+            WHERE ArcID IN ({ArcIDsStr})
+            GROUP BY Days, ArcID
+            ORDER BY Days, ArcID
+            """
+            df = pd.read_sql(sql, self.cube)
+        else:
+            df = None
+
         sql = """
         SELECT DATE(trips_{0}.DateTime) AS date,
                COUNT(trips_{0}.NumberOfTrips ) AS SumNumberOfTrips,
@@ -836,7 +1455,8 @@ class pyBIVAS:
         WHERE ArcID IN ({1})
         GROUP BY DATE(trips_{0}.DateTime), ARCID
         """.format(self.scenarioID, ArcIDsStr)
-        df = self.sql(sql)
+        if df is None:
+            df = self.sql(sql)
         df['date'] = pd.to_datetime(df['date'])
         df = df.set_index('date')
 
@@ -857,9 +1477,25 @@ class pyBIVAS:
         groupby_sort: can be identical to groupby_field, or a different field in the table
         directions: can be either ['Origin', 'Destination'], ['Origin'] or ['Destination']
         """
-        dfs = {}
+        lookup = self._statistics_lookup(groupby_field, groupby_sort)
+
+        sqls = {}
         for d in directions:
-            sql = f"""
+            if lookup is not None:
+                key = self.lookup_tables.trips_key(lookup[0])
+                sqls[d] = f"""
+                     SELECT
+                     trips.{key} AS {key},
+                     count(*) AS nTrips
+                     FROM trips
+                     WHERE TrafficScenarioID={trafficScenarioId}
+                         AND {d}TripEndPointNodeID={NodeID}
+                         AND trips.NumberOfTrips > 0
+                     GROUP BY trips.{key}
+                     """
+                continue
+
+            sqls[d] = f"""
                      SELECT
                      {groupby_field} AS groupby,
                      count(*) AS nTrips
@@ -877,9 +1513,13 @@ class pyBIVAS:
                      GROUP BY {groupby_field}
                      ORDER BY {groupby_sort}
                      """
-            df = self.sql(sql)
 
+        dfs = {}
+        for d, df in self.sql_parallel(sqls, max_workers=self.parallel_workers).items():
             # Format data
+            if lookup is not None:
+                dfs[d] = self._count_per_lookup_label(df, lookup)
+                continue
             df = df.set_index('groupby')
             dfs[d] = df['nTrips']
 
@@ -889,6 +1529,24 @@ class pyBIVAS:
             df.rename(self.NSTR_shortnames, inplace=True)
         return df
 
+    def _statistics_lookup(self, groupby_field, groupby_sort):
+        """
+        Lookup table, column and sort columns of the groupby_field of node_statistics and zone_statistics, or None
+        if the statistics are grouped in the query (see enable_lookup_tables)
+        """
+        if self.lookup_tables is None:
+            return None
+        return self.lookup_tables.groupby_field(groupby_field, groupby_sort)
+
+    def _count_per_lookup_label(self, df, lookup):
+        """Number of trips per label of a lookup table, from the number of trips per key, sorted like ORDER BY"""
+        table, column, sort_columns = lookup
+        labels = self.lookup_tables.map(table, column, df[self.lookup_tables.trips_key(table)].to_numpy())
+        s = df['nTrips'].groupby(labels, dropna=False, sort=False).sum()
+        s = s.reindex(self.lookup_tables.sorted_labels(table, column, sort_columns, s.index))
+        s.index.name = 'groupby'
+        return s
+
     def node_statistics_all(self, trafficScenarioId):
         directions = ['Origin', 'Destination']
         dfs = {}
@@ -907,10 +1565,10 @@ class pyBIVAS:
 
     def node_timeseries(self, NodeID, trafficScenarioId):
 
-        dfs = {}
+        sqls = {}
         for d in ['Origin', 'Destination']:
 
-            sql = f"""
+            sqls[d] = f"""
                     SELECT
                     DATE(trips.DateTime) AS "Days",
                     count(*) AS nTrips
@@ -920,8 +1578,8 @@ class pyBIVAS:
                     GROUP BY "Days"
                     """
 
-            df = self.sql(sql)
-
+        dfs = {}
+        for d, df in self.sql_parallel(sqls, max_workers=self.parallel_workers).items():
             # Format data
             df['Days'] = pd.to_datetime(df['Days'])
             df = df.set_index('Days')
@@ -937,26 +1595,170 @@ class pyBIVAS:
             df = None
         return df
 
-    def node_label(self, NodeID):
+    def nodes_timeseries(self, trafficScenarioId, directions=['Origin', 'Destination']):
+        """
+        Timeseries of all nodes at once (see node_timeseries), with one query per direction
+
+        Returns a dictionary with per direction a dataframe of the number of trips per NodeID (rows) and day (columns),
+        for the full years of all nodes. Use nodes_timeseries_slice to get the timeseries of one node, which (like
+        node_timeseries) only covers the year of the first day of the node.
         """
-        Guess a label for a node, based on neighbouring arcs
+        sqls = {}
+        for d in directions:
+            sqls[d] = f"""
+                    SELECT
+                    {d}TripEndPointNodeID AS NodeID,
+                    DATE(trips.DateTime) AS "Days",
+                    count(*) AS nTrips
+                    FROM trips
+                    WHERE TrafficScenarioID={trafficScenarioId}
+                    GROUP BY {d}TripEndPointNodeID, "Days"
+                    """
+        dfs = {d: df for d, df in self.sql_parallel(sqls, max_workers=self.parallel_workers).items()}
+
+        days = pd.to_datetime(pd.concat([df['Days'] for df in dfs.values()]).dropna())
+        if len(days):
+            fullyear = pd.date_range('01-01-{}'.format(days.min().year), '31-12-{}'.format(days.max().year))
+        else:
+            fullyear = pd.DatetimeIndex([])
+
+        result = {}
+        for d, df in dfs.items():
+            df = df[df['Days'].notna()]
+            nodes = pd.Index(df['NodeID'].unique()).sort_values()
+            counts = np.zeros((len(nodes), len(fullyear)), dtype=np.int64)
+            np.add.at(counts, (nodes.get_indexer(df['NodeID']), fullyear.get_indexer(pd.to_datetime(df['Days']))),
+                      df['nTrips'].to_numpy())
+            result[d] = pd.DataFrame(counts, index=nodes.rename('NodeID'), columns=fullyear)
+        return result
+
+    @staticmethod
+    def nodes_timeseries_slice(dfs, NodeID):
+        """Timeseries of one node from the result of nodes_timeseries, in the format of node_timeseries"""
+        series = {}
+        for d, df in dfs.items():
+            if NodeID not in df.index:
+                continue
+            s = df.loc[NodeID].rename(None)
+            # Full year of the first day of the node per direction, like node_timeseries
+            year = s.index[s.to_numpy() > 0][0].year
+            series[d] = s.reindex(pd.date_range('01-01-{}'.format(year), '31-12-{}'.format(year)), fill_value=0)
+        if not series:
+            return None
+        return pd.concat(series, axis=1)
+
+    def nodes_statistics(self, trafficScenarioId, groupby_field, groupby_sort, directions):
         """
+        Statistics of all nodes at once (see node_statistics), with one query per direction
 
-        sql = f"""
-                SELECT
-                arcs.Name
-                FROM arcs
-                WHERE (FromNodeID={NodeID} OR ToNodeID={NodeID})
-                GROUP BY "Days"
-                LIMIT 0, 1
-                """
-        label = self.sql(sql)
-        if len(label) == 0:
-            label = ''
+        Returns a dataframe with the number of trips per NodeID (rows) and groupby label (columns, sorted by
+        groupby_sort), summed over the directions. Use nodes_statistics_slice to get the statistics of one node.
+        """
+        lookup = self._statistics_lookup(groupby_field, groupby_sort)
+
+        sqls = {}
+        for d in directions:
+            if lookup is not None:
+                key = self.lookup_tables.trips_key(lookup[0])
+                sqls[d] = f"""
+                     SELECT
+                     {d}TripEndPointNodeID AS NodeID,
+                     trips.{key} AS {key},
+                     count(*) AS nTrips
+                     FROM trips
+                     WHERE TrafficScenarioID={trafficScenarioId}
+                         AND trips.NumberOfTrips > 0
+                     GROUP BY {d}TripEndPointNodeID, trips.{key}
+                     """
+                continue
+
+            sqls[d] = f"""
+                     SELECT
+                     {d}TripEndPointNodeID AS NodeID,
+                     {groupby_field} AS groupby,
+                     count(*) AS nTrips
+                     FROM trips
+
+                     LEFT JOIN ship_types ON trips.ShipTypeID = ship_types.ID
+                     LEFT JOIN nstr_mapping ON trips.NstrGoodsClassification = nstr_mapping.GroupCode
+                     LEFT JOIN cemt_class ON ship_types.CEMTTypeID = cemt_class.Id
+                     LEFT JOIN appearance_types ON trips.AppearanceTypeID = appearance_types.ID
+                     LEFT JOIN dangerous_goods_levels ON trips.DangerousGoodsLevelID = dangerous_goods_levels.ID
+                     LEFT JOIN load_types ON trips.LoadTypeID = load_types.ID
+                     WHERE TrafficScenarioID={trafficScenarioId}
+                         AND trips.NumberOfTrips > 0
+                     GROUP BY {d}TripEndPointNodeID, {groupby_field}
+                     ORDER BY {groupby_sort}
+                     """
+
+        dfs = []
+        for d, df in self.sql_parallel(sqls, max_workers=self.parallel_workers).items():
+            if lookup is not None:
+                table, column, _ = lookup
+                labels = self.lookup_tables.map(table, column, df[self.lookup_tables.trips_key(table)].to_numpy())
+                df = pd.DataFrame({'NodeID': df['NodeID'], 'groupby': labels, 'nTrips': df['nTrips']})
+            dfs.append(df)
+        df = pd.concat(dfs, ignore_index=True)
+
+        # Labels in the order of the query (ORDER BY), or of the lookup table
+        if lookup is not None:
+            labels = self.lookup_tables.sorted_labels(*lookup, df['groupby'].unique())
         else:
-            label = label.iloc[0, 0]
-            label = label.replace('/', '-')
-        return label
+            labels = df['groupby'].unique()
+        labels = pd.Index(labels)
+        nodes = pd.Index(df['NodeID'].unique()).sort_values()
+
+        counts = np.zeros((len(nodes), len(labels)), dtype=np.int64)
+        np.add.at(counts, (nodes.get_indexer(df['NodeID']), labels.get_indexer(df['groupby'])),
+                  df['nTrips'].to_numpy())
+        df = pd.DataFrame(counts, index=nodes.rename('NodeID'), columns=labels.rename('groupby'))
+
+        if groupby_field == 'nstr_mapping.GroupCode':
+            df.rename(self.NSTR_shortnames, inplace=True, axis=1)
+        return df
+
+    @staticmethod
+    def nodes_statistics_slice(df, NodeID):
+        """Statistics of one node from the result of nodes_statistics, in the format of node_statistics"""
+        if NodeID not in df.index:
+            return pd.Series(dtype=float)
+        s = df.loc[NodeID]
+        return s[s > 0].rename(None)
+
+    def node_label(self, NodeID):
+        """
+        Guess a label for a node, based on neighbouring arcs (see node_labels)
+        """
+        return self.node_labels().get(NodeID, '')
+
+    def node_labels(self):
+        """
+        Labels of all nodes, based on neighbouring arcs: the name of the arc with the lowest ID that starts or ends at
+        the node. Arcs without a name (NULL or empty) are skipped, nodes without named arcs get an empty label.
+
+        Returns a series with the label per NodeID
+        """
+        key = ('node_labels', self.database_identity)
+        if key not in self._network_tables:
+            sql = """
+                    SELECT arcs.ID, arcs.FromNodeID, arcs.ToNodeID, arcs.Name
+                    FROM arcs
+                    WHERE arcs.Name IS NOT NULL AND TRIM(arcs.Name) != ''
+                    """
+            self._network_tables[key] = self._node_labels(self.sql(sql))
+        return self._network_tables[key]
+
+    @staticmethod
+    def _node_labels(arcs):
+        """Label per NodeID from a dataframe of arcs with ID, FromNodeID, ToNodeID and Name (see node_labels)"""
+        arcs = arcs[arcs['Name'].notna()]
+        arcs = arcs[arcs['Name'].astype(str).str.strip() != '']
+        ends = pd.concat([arcs[['ID', 'FromNodeID', 'Name']].set_axis(['ID', 'NodeID', 'Name'], axis=1),
+                          arcs[['ID', 'ToNodeID', 'Name']].set_axis(['ID', 'NodeID', 'Name'], axis=1)])
+        ends = ends.sort_values(['ID'], kind='stable').drop_duplicates('NodeID')
+        labels = ends.set_index('NodeID')['Name'].astype(str).str.replace('/', '-', regex=False)
+        labels.name = 'node_label'
+        return labels.sort_index()
 
     """
     Export to file
@@ -965,39 +1767,45 @@ class pyBIVAS:
     def network_arcs(self, outputfileshape=None, outputfilecsv=None):
         """Export all Arcs in BIVAS to geojsonfile"""
 
-        sql = """
-        SELECT arcs.*,
-               arc_types.Label,
-               arc_types.Description,
-               cemt_class.Description,
-               cemt_class.MinimumAbsoluteUkc__m,
-               cemt_class.MinimumRelativeUkc__m,
-               N1.XCoordinate AS X1,
-               N1.YCoordinate AS Y1,
-               N2.XCoordinate AS X2,
-               N2.YCoordinate AS Y2
-        FROM arcs
-        LEFT JOIN nodes AS N1 ON FromNodeID = N1.ID
-        LEFT JOIN nodes AS N2 ON ToNodeID = N2.ID
-        LEFT JOIN `branching$branch_sets` AS BS ON arcs.BranchSetID = BS.Id
-        LEFT JOIN arc_types ON arcs.ArcTypeID = arc_types.ID
-        LEFT JOIN cemt_class ON arcs.CemtClassId = cemt_class.ID
-        WHERE BS.BranchID = {0}
-        ORDER BY arcs.ID
-        """.format(self.scenarioID)
-        arcs = self.sql(sql).set_index('ID')
+        key = ('arcs', self.database_identity, self.scenarioID)
+        if key not in self._network_tables:
+            sql = """
+            SELECT arcs.*,
+                   arc_types.Label,
+                   arc_types.Description,
+                   cemt_class.Description,
+                   cemt_class.MinimumAbsoluteUkc__m,
+                   cemt_class.MinimumRelativeUkc__m,
+                   N1.XCoordinate AS X1,
+                   N1.YCoordinate AS Y1,
+                   N2.XCoordinate AS X2,
+                   N2.YCoordinate AS Y2
+            FROM arcs
+            LEFT JOIN nodes AS N1 ON FromNodeID = N1.ID
+            LEFT JOIN nodes AS N2 ON ToNodeID = N2.ID
+            LEFT JOIN `branching$branch_sets` AS BS ON arcs.BranchSetID = BS.Id
+            LEFT JOIN arc_types ON arcs.ArcTypeID = arc_types.ID
+            LEFT JOIN cemt_class ON arcs.CemtClassId = cemt_class.ID
+            WHERE BS.BranchID = {0}
+            ORDER BY arcs.ID
+            """.format(self.scenarioID)
+            arcs = self.sql(sql).set_index('ID')
 
-        arcs['XM'] = (arcs['X1'] + arcs['X2']) / 2
-        arcs['YM'] = (arcs['Y1'] + arcs['Y2']) / 2
+            arcs['XM'] = (arcs['X1'] + arcs['X2']) / 2
+            arcs['YM'] = (arcs['Y1'] + arcs['Y2']) / 2
+            self._network_tables[key] = arcs
+        arcs = self._network_tables[key]
 
         if outputfilecsv:
             arcs.to_csv(outputfilecsv)
 
-        try: 
-            arcs['geometry'] = arcs.apply(lambda z: LineString(
-                [(z.X1, z.Y1), (z.X2, z.Y2)]), axis=1)
-            arcsgpd = geopandas.GeoDataFrame(arcs)
-            arcsgpd.drop(['BranchSetId'], axis=1, inplace=True)
+        try:
+            if key + ('geometry',) not in self._network_tables:
+                coordinates = np.stack([arcs[['X1', 'Y1']].to_numpy(dtype=float),
+                                        arcs[['X2', 'Y2']].to_numpy(dtype=float)], axis=1)
+                self._network_tables[key + ('geometry',)] = geopandas.GeoDataFrame(
+                    arcs.drop(['BranchSetId'], axis=1), geometry=shapely.linestrings(coordinates))
+            arcsgpd = copy_on_write(self._network_tables[key + ('geometry',)])
 
             if outputfileshape:
                 arcsgpd.reset_index().to_file(outputfileshape, driver='GeoJSON')
@@ -1011,25 +1819,28 @@ class pyBIVAS:
     def network_nodes(self, outputfile=None, include_names=False):
         """Export all Nodes in BIVAS to geojsonfile"""
 
-        sql = """
-        SELECT *
-        FROM nodes
-        LEFT JOIN `branching$branch_sets` AS BS ON nodes.BranchSetID = BS.Id
-        WHERE BS.BranchID = {0}
-        """.format(self.scenarioID)
-        nodes = self.sql(sql).set_index('ID')
-        nodes['geometry'] = nodes.apply(
-            lambda z: Point(z.XCoordinate, z.YCoordinate), axis=1)
+        key = ('nodes', self.database_identity, self.scenarioID)
+        if key not in self._network_tables:
+            sql = """
+            SELECT *
+            FROM nodes
+            LEFT JOIN `branching$branch_sets` AS BS ON nodes.BranchSetID = BS.Id
+            WHERE BS.BranchID = {0}
+            """.format(self.scenarioID)
+            nodes = self.sql(sql).set_index('ID')
+            nodes = nodes.drop(['BranchSetId', 'Id', 'BranchID'], axis=1)
 
-        try:
-            nodes = geopandas.GeoDataFrame(nodes)
-        except:
-            nodes = pd.DataFrame(nodes)
-        nodes.drop(['BranchSetId', 'Id', 'BranchID'], axis=1, inplace=True)
+            try:
+                nodes = geopandas.GeoDataFrame(
+                    nodes, geometry=geopandas.points_from_xy(nodes['XCoordinate'], nodes['YCoordinate']))
+            except:
+                nodes = pd.DataFrame(nodes)
+            self._network_tables[key] = nodes
+        nodes = copy_on_write(self._network_tables[key])
 
         if include_names:
-            labels = ['{}_{}'.format(nodeID, self.node_label(nodeID)) for nodeID in nodes.index]
-            nodes['node_label'] = labels
+            labels = self.node_labels().reindex(nodes.index).fillna('')
+            nodes['node_label'] = nodes.index.astype(str) + '_' + labels.to_numpy()
 
         if outputfile:
             nodes.reset_index().to_file(outputfile, driver='GeoJSON')
@@ -1037,7 +1848,33 @@ class pyBIVAS:
         self.nodes = nodes
         return self.nodes
 
-    def zone_list(self, zone_definition='BasGoed 2018'):
+    def arcs_spatial_index(self):
+        """
+        Spatial index over the geometries of the arcs (see network_arcs), to find arcs by location:
+
+        BIVAS.arcs_spatial_index().nearest(x, y)  # Nearest arc
+        BIVAS.arcs_spatial_index().within(polygon)  # Arcs (partly) in polygon
+        BIVAS.arcs_spatial_index().snap(X, Y)  # Nearest arc of many points
+        """
+        from pyBIVAS.spatial import SpatialIndex
+
+        key = ('arcs', self.database_identity, self.scenarioID, 'spatial_index')
+        if key not in self._network_tables:
+            arcs = self.network_arcs()
+            self._network_tables[key] = SpatialIndex(arcs.index.to_numpy(), arcs.geometry.to_numpy())
+        return self._network_tables[key]
+
+    def nodes_spatial_index(self):
+        """Spatial index over the geometries of the nodes (see network_nodes and arcs_spatial_index)"""
+        from pyBIVAS.spatial import SpatialIndex
+
+        key = ('nodes', self.database_identity, self.scenarioID, 'spatial_index')
+        if key not in self._network_tables:
+            nodes = self.network_nodes()
+            self._network_tables[key] = SpatialIndex(nodes.index.to_numpy(), nodes.geometry.to_numpy())
+        return self._network_tables[key]
+
+    def zone_list(self, zone_definition='BasGoed 2018'):
         """
         Return list of all zones for given definitionID
         :return:
@@ -1068,13 +1905,13 @@ class pyBIVAS:
 
     def zone_timeseries(self, zone_name, trafficScenarioId, zone_definition='BasGoed 2018'):
 
-        dfs = {}
-        for d in ['Origin', 'Destination']:
+        sql = f"""SELECT ID FROM zone_definitions WHERE Name = "{zone_definition}" """
+        zone_definition_id = self.sql(sql).iloc[0, 0]
 
-            sql = f"""SELECT ID FROM zone_definitions WHERE Name = "{zone_definition}" """
-            zone_definition_id = self.sql(sql).iloc[0, 0]
+        sqls = {}
+        for d in ['Origin', 'Destination']:
 
-            sql = f"""
+            sqls[d] = f"""
                     SELECT
                     DATE(trips.DateTime) AS "Days",
                     count(*) AS nTrips
@@ -1089,8 +1926,9 @@ class pyBIVAS:
                     AND trips.NumberOfTrips > 0
                     GROUP BY "Days"
             """
-            df = self.sql(sql)
 
+        dfs = {}
+        for d, df in self.sql_parallel(sqls, max_workers=self.parallel_workers).items():
             # Format data
             df['Days'] = pd.to_datetime(df['Days'])
             df = df.set_index('Days')
@@ -1121,9 +1959,29 @@ class pyBIVAS:
         sql = f"""SELECT ID FROM zone_definitions WHERE Name = "{zone_definition}" """
         zone_definition_id = self.sql(sql).iloc[0, 0]
 
-        dfs = {}
+        lookup = self._statistics_lookup(groupby_field, groupby_sort)
+
+        sqls = {}
         for d in directions:
-            sql = f"""
+            if lookup is not None:
+                key = self.lookup_tables.trips_key(lookup[0])
+                sqls[d] = f"""
+                     SELECT
+                     trips.{key} AS {key},
+                     count(*) AS nTrips
+                     FROM trips
+                     LEFT JOIN zone_node_mapping ON trips.{d}TripEndPointNodeID = zone_node_mapping.NodeID
+                     LEFT JOIN zones ON zone_node_mapping.ZoneID = zones.ID
+                     WHERE TrafficScenarioID={trafficScenarioId}
+                     AND zones.ZoneDefinitionID={zone_definition_id}
+                     AND zone_node_mapping.ZoneDefinitionID={zone_definition_id}
+                     AND zones.Name = "{zone_name}"
+                     AND trips.NumberOfTrips > 0
+                     GROUP BY trips.{key}
+                     """
+                continue
+
+            sqls[d] = f"""
                      SELECT
                      {groupby_field} AS groupby,
                      count(*) AS nTrips
@@ -1146,9 +2004,13 @@ class pyBIVAS:
                      GROUP BY {groupby_field}
                      ORDER BY {groupby_sort}
                      """
-            df = self.sql(sql)
 
+        dfs = {}
+        for d, df in self.sql_parallel(sqls, max_workers=self.parallel_workers).items():
             # Format data
+            if lookup is not None:
+                dfs[d] = self._count_per_lookup_label(df, lookup)
+                continue
             df = df.set_index('groupby')
             dfs[d] = df['nTrips']
 
@@ -1158,6 +2020,118 @@ class pyBIVAS:
             df.rename(self.NSTR_shortnames, inplace=True)
         return df
 
+    od_dimensions = {
+        'Days': 'DATE(trips.DateTime)',
+        'NSTR': 'trips.NstrGoodsClassification',
+        'CEMT-klasse': 'ship_types.CEMTTypeID',
+    }
+
+    def zone_od_matrix(self, trafficScenarioId=None, zone_definition='BasGoed 2018', by=None):
+        """
+        Origin-destination matrices of the trips in a traffic scenario between all zones of a zone definition, from
+        one query on trips. The result is kept per traffic scenario.
+
+        by: None, or one of od_dimensions ('Days', 'NSTR' or 'CEMT-klasse') to get a matrix per category
+
+        Returns an ODMatrix with the measures "Aantal Vaarbewegingen (-)", "Totale Vracht (ton)" and (if the route
+        statistics of the scenario are available and trafficScenarioId is the traffic scenario of the scenario)
+        "Totale Vaarkosten (EUR)":
+
+        od = BIVAS.zone_od_matrix(by='NSTR')
+        od.frame("Totale Vracht (ton)")  # Dataframe of all zones
+        od.sparse("Aantal Vaarbewegingen (-)", category='2 - Mineralen')  # csr_matrix of one category
+        od.cube("Aantal Vaarbewegingen (-)")  # Array of categories x zones x zones
+
+        Trips from or to a node that is not in a zone are left out.
+        """
+        from pyBIVAS.od import ODMatrix
+
+        if trafficScenarioId is None:
+            trafficScenarioId = self.trafficScenario
+        if by is not None and by not in self.od_dimensions:
+            raise ValueError(f'Unknown dimension: {by}. Choose from: {", ".join(self.od_dimensions)}')
+
+        # The route statistics of the scenario only belong to the trips of its own traffic scenario
+        with_costs = (self.scenarioID is not None and trafficScenarioId == self.trafficScenario
+                      and self.sql_tableexists(f'route_statistics_{self.scenarioID}'))
+        key = (self.database_identity, zone_definition, trafficScenarioId, by,
+               self.scenarioID if with_costs else None)
+        if key in self._od_matrices:
+            return self._od_matrices[key]
+
+        sql = f"""SELECT ID FROM zone_definitions WHERE Name = "{zone_definition}" """
+        zone_definition_id = self.sql(sql).iloc[0, 0]
+
+        sql = f"""SELECT ID, Name FROM zones WHERE ZoneDefinitionID={zone_definition_id} ORDER BY ID"""
+        zones = self.sql(sql)
+
+        sql = f"""
+        SELECT NodeID, ZoneID
+        FROM zone_node_mapping
+        WHERE ZoneDefinitionID={zone_definition_id}
+        """
+        zone_node_mapping = self.sql(sql).drop_duplicates('NodeID')
+        node_zones = pd.Series(pd.Index(zones['ID']).get_indexer(zone_node_mapping['ZoneID']),
+                               index=zone_node_mapping['NodeID'].to_numpy())
+
+        sql_select = ''
+        sql_leftjoin = ''
+        sql_groupby = ''
+        if by is not None:
+            sql_select += f', {self.od_dimensions[by]} AS "{by}"'
+            sql_groupby += f', "{by}"'
+            if by == 'CEMT-klasse':
+                sql_leftjoin += 'LEFT JOIN ship_types ON trips.ShipTypeID = ship_types.ID '
+        if with_costs:
+            costs = self._diff_measures['Totale Vaarkosten (EUR)'].format('route_statistics', 'trips')
+            sql_select += f', SUM({costs}) AS "Totale Vaarkosten (EUR)"'
+            sql_leftjoin += (f'LEFT JOIN route_statistics_{self.scenarioID} AS route_statistics '
+                             f'ON route_statistics.TripID = trips.ID ')
+
+        sql = f"""
+        SELECT
+        trips.OriginTripEndPointNodeID AS Origin,
+        trips.DestinationTripEndPointNodeID AS Destination,
+        SUM(trips.NumberOfTrips) AS "Aantal Vaarbewegingen (-)",
+        SUM(trips.TotalWeight__t * trips.NumberOfTrips) AS "Totale Vracht (ton)"
+        {sql_select}
+        FROM trips
+        {sql_leftjoin}
+        WHERE trips.TrafficScenarioID={trafficScenarioId}
+        AND trips.NumberOfTrips > 0
+        GROUP BY Origin, Destination{sql_groupby}
+        """
+        df = self.sql(sql)
+
+        # Zones of the nodes, with one lookup for all node pairs
+        origins = node_zones.reindex(df['Origin'].to_numpy()).fillna(-1).to_numpy(dtype=np.int64)
+        destinations = node_zones.reindex(df['Destination'].to_numpy()).fillna(-1).to_numpy(dtype=np.int64)
+        in_zones = (origins >= 0) & (destinations >= 0)
+        df = df[in_zones].drop(columns=['Origin', 'Destination'])
+        df.insert(0, 'Origin', origins[in_zones])
+        df.insert(1, 'Destination', destinations[in_zones])
+
+        group_by = ['Origin', 'Destination'] + ([by] if by is not None else [])
+        df = df.groupby(group_by, sort=True, dropna=False).sum().reset_index()
+
+        categories = codes = None
+        if by is not None:
+            categories = pd.Index(df[by].unique()).sort_values()  # Missing category last
+            codes = categories.get_indexer(df[by])
+            if by == 'Days':
+                categories = pd.to_datetime(categories)
+            elif by == 'NSTR':
+                categories = categories.map(lambda c: self.NSTR_shortnames.get(c, c))
+            elif by == 'CEMT-klasse':
+                descriptions = self.CEMTclass()['Description']
+                categories = categories.map(lambda c: descriptions.get(c, c))
+            df = df.drop(columns=[by])
+
+        od = ODMatrix(zones['Name'], df.pop('Origin').to_numpy(), df.pop('Destination').to_numpy(), df,
+                      categories=categories, codes=codes)
+        self._od_matrices[key] = od
+        return od
+
     def countingpoint_list(self):
         """
         Returns list of all counting points including coordinates
@@ -1226,7 +2200,7 @@ class pyBIVAS:
         df.set_index('ID', inplace=True)
 
         df['DateTime'] = pd.to_datetime(df['DateTime'])
-        df['Vaarrichting'] = df['Vaarrichting'].replace(to_replace=self.directions_dutch)
+        df = relabel(df, {'Vaarrichting': self.directions_dutch})
 
         return df
 
@@ -1246,15 +2220,115 @@ class pyBIVAS:
         if trafficScenarioId is None:
             trafficScenarioId = self.trafficScenario
 
-        sql_select = 'DATE(trips.DateTime) AS "Days"'
+        sql_from, referenceSetColumn = self._countingpoint_trips_sql()
+        sql_select, sql_leftjoin, sql_groupby, sql_where = self._countingpoint_pivot_sql(pivot)
+
+        sql = f"""
+        SELECT
+        DATE(trips.DateTime) AS "Days"{sql_select},
+        SUM(trips.NumberOfTrips) AS "Aantal Vaarbewegingen (-)",
+        SUM(trips.TotalWeight__t * trips.NumberOfTrips) AS "Totale Vracht (ton)"
+        {sql_from}
+        {sql_leftjoin}
+        WHERE {referenceSetColumn} = {referenceSetId}
+        AND counting_points.Name = "{countingPointName}"
+        AND trips.TrafficScenarioID = {trafficScenarioId}
+        AND trips.NumberOfTrips > 0
+        {sql_where}
+        GROUP BY "Days"{sql_groupby}
+        """
+        df = self.sql(sql)
+
+        df['Days'] = pd.to_datetime(df['Days'])
+        df = df.set_index('Days')
+        return self._format_countingpoint_timeseries(df, pivot, param)
+
+    def countingpoints_timeseries(self, pivot='Vaarrichting', scenarios=None):
+        """
+        Timeseries of all counting points at once, with one query for all counting points and scenarios
+        (see countingpoint_timeseries for one counting point)
+
+        pivot: None, "Vaarrichting", "Bestemming", "Herkomst", "Scheepvaartklasse", "CEMT-klasse"
+        scenarios: list of (referenceSetId, trafficScenarioId), by default the reference set and traffic scenario of
+                   the current scenario
+
+        Returns a dataframe in long format with the number of trips and the total weight, indexed by Telpunt,
+        ReferenceSetID, TrafficScenarioID, the value of the pivot and Days. Use countingpoints_timeseries_slice to get
+        the timeseries of one counting point.
+        """
+        if scenarios is None:
+            scenarios = [(self.ReferenceTripSetID, self.trafficScenario)]
+
+        sql_from, referenceSetColumn = self._countingpoint_trips_sql()
+        sql_select, sql_leftjoin, sql_groupby, sql_where = self._countingpoint_pivot_sql(pivot)
+        sql_scenarios = ' OR '.join(f'({referenceSetColumn} = {referenceSetId} '
+                                    f'AND trips.TrafficScenarioID = {trafficScenarioId})'
+                                    for referenceSetId, trafficScenarioId in scenarios)
+
+        sql = f"""
+        SELECT
+        counting_points.Name AS Telpunt,
+        {referenceSetColumn} AS ReferenceSetID,
+        trips.TrafficScenarioID AS TrafficScenarioID,
+        DATE(trips.DateTime) AS "Days"{sql_select},
+        SUM(trips.NumberOfTrips) AS "Aantal Vaarbewegingen (-)",
+        SUM(trips.TotalWeight__t * trips.NumberOfTrips) AS "Totale Vracht (ton)"
+        {sql_from}
+        {sql_leftjoin}
+        WHERE ({sql_scenarios})
+        AND counting_points.Name IS NOT NULL
+        AND trips.NumberOfTrips > 0
+        {sql_where}
+        GROUP BY counting_points.Name, {referenceSetColumn}, trips.TrafficScenarioID, "Days"{sql_groupby}
+        """
+        df = self.sql(sql)
+
+        df['Days'] = pd.to_datetime(df['Days'])
+        index = ['Telpunt', 'ReferenceSetID', 'TrafficScenarioID'] + ([pivot] if pivot is not None else []) + ['Days']
+        return df.set_index(index).sort_index()
+
+    def countingpoints_timeseries_slice(self, df, countingPointName, referenceSetId=None, trafficScenarioId=None,
+                                        pivot='Vaarrichting', param="Aantal Vaarbewegingen (-)"):
+        """
+        Timeseries of one counting point from the result of countingpoints_timeseries (with the same pivot), in the
+        same format as countingpoint_timeseries
+        """
+        if referenceSetId is None:
+            referenceSetId = self.ReferenceTripSetID
+
+        if trafficScenarioId is None:
+            trafficScenarioId = self.trafficScenario
+
+        try:
+            df = df.loc[(countingPointName, referenceSetId, trafficScenarioId)]
+        except KeyError:
+            return None
+        if pivot is not None:
+            df = df.reset_index(pivot)
+        return self._format_countingpoint_timeseries(df, pivot, param)
+
+    @staticmethod
+    def _countingpoint_trips_sql():
+        """FROM clause of the trips in the reference set with their counting points, and the reference set column"""
+        sql = """
+        FROM reference_trip_set
+        LEFT JOIN trips ON reference_trip_set.Trip == trips.ID
+        LEFT JOIN counting_point_arcs ON reference_trip_set.Arc == counting_point_arcs.ArcID
+        LEFT JOIN counting_points ON counting_points.ID = counting_point_arcs.CountingPointID
+        """
+        return sql, 'ReferenceTripSet'
+
+    @staticmethod
+    def _countingpoint_pivot_sql(pivot):
+        """SELECT, LEFT JOIN, GROUP BY and WHERE clauses of the pivot of the counting point timeseries"""
+        sql_select = ''
         sql_leftjoin = ''
-        sql_groupby = '"Days"'
+        sql_groupby = ''
         sql_where = ''
 
-
         if pivot == 'Vaarrichting':
             sql_select += ', directions.Label AS Vaarrichting'
-            sql_groupby += ', counting_points.DirectionID'
+            sql_groupby += ', counting_points.DirectionID, directions.Label'
             sql_leftjoin += 'LEFT JOIN directions on counting_points.DirectionID == directions.ID'
         elif pivot == 'Bestemming':
             zone_definition_id = 9
@@ -1288,32 +2362,10 @@ class pyBIVAS:
                  LEFT JOIN cemt_class ON ship_types.CEMTTypeID = cemt_class.Id
                  """
             sql_groupby += ', "CEMT-klasse"'
-        else:
-            pass
-
-
-        sql = f"""
-        SELECT
-        {sql_select},
-        SUM(trips.NumberOfTrips) AS "Aantal Vaarbewegingen (-)",
-        SUM(trips.TotalWeight__t * trips.NumberOfTrips) AS "Totale Vracht (ton)"
-        FROM reference_trip_set
-        LEFT JOIN trips ON reference_trip_set.Trip == trips.ID
-        LEFT JOIN counting_point_arcs ON reference_trip_set.Arc == counting_point_arcs.ArcID
-        LEFT JOIN counting_points ON counting_points.ID = counting_point_arcs.CountingPointID
-        {sql_leftjoin}
-        WHERE ReferenceTripSet = {referenceSetId}
-        AND counting_points.Name = "{countingPointName}"
-        AND trips.TrafficScenarioID = {trafficScenarioId}
-        AND trips.NumberOfTrips > 0
-        {sql_where}
-        GROUP BY {sql_groupby}
-        """
-        df = self.sql(sql)
-
-        df['Days'] = pd.to_datetime(df['Days'])
-        df = df.set_index('Days')
+        return sql_select, sql_leftjoin, sql_groupby, sql_where
 
+    def _format_countingpoint_timeseries(self, df, pivot, param):
+        """Pivot the counting point timeseries (indexed by Days) and reindex it to the full year"""
         # If not returning here, it will crash
         if df.shape[0] == 0:
             return None
@@ -1417,21 +2469,747 @@ class pyBIVAS:
 
         sql = """
         SELECT trips_{0}.NumberOfTrips - trips_{1}.NumberOfTrips AS ExtraTrips
-        FROM trips_{0}
-        RIGHT JOIN route_statistics_{0} ON route_statistics_{0}.TripID = trips_{0}.ID
+        FROM route_statistics_{0}
+        LEFT JOIN trips_{0} ON route_statistics_{0}.TripID = trips_{0}.ID
         LEFT JOIN trips_{1} ON trips_{0}.ID = trips_{1}.ID
         """.format(casescenario, self.scenarioID)
         df = self.sql(sql)
         return df
 
+    # Measures per trip in scenario_diff, like compute_route_statistics
+    _diff_measures = {
+        'Totale Reistijd (min)': '{0}.TravelTime__min * {1}.NumberOfTrips',
+        'Totale Vaarkosten (EUR)': '({0}.VariableTimeCosts__Eur + {0}.VariableDistanceCosts__Eur + {0}.FixedCosts__Eur)'
+                                   ' * {1}.NumberOfTrips',
+        'Totale Afstand (km)': '{0}.Distance__km * {1}.NumberOfTrips',
+    }
+
+    def scenario_diff(self, cases, sort_by='Totale Vaarkosten (EUR)', limit=None, route_change=True):
+        """
+        Difference per trip between the scenario of this database and the scenarios of other databases
+
+        The databases of the cases are attached to a read-only connection to this database, and the differences are
+        computed by SQLite. Only the resulting table is loaded in memory.
+
+        cases: dictionary with per name a pyBIVAS connection to a SQLite database, with its scenario set
+        sort_by: the table is sorted by the absolute value of this difference, largest first
+        limit: only return this number of trips (in total), with the largest differences
+        route_change: include whether the route changed (the arcs or their order). This requires a comparison of
+                      the routes tables.
+
+        Returns a dataframe with per case and TripID the difference (case - reference) of the total travel time, costs
+        and distance. Trips that are only in the reference or only in a case have missing differences.
+        """
+        if sort_by not in self._diff_measures:
+            raise ValueError(f'Unknown measure: {sort_by}. Choose from: {", ".join(self._diff_measures)}')
+
+        connection = self._connect_sqlite(self.connectfile, 'readonly')
+        try:
+            sqls = []
+            for i, (name, case) in enumerate(cases.items()):
+                schema = f'case{i}'
+                path = str(Path(case.connectfile).resolve()).replace("'", "''")
+                connection.execute(f"ATTACH DATABASE '{path}' AS {schema}")
+
+                sql_select = ''.join(
+                    f',\n({m.format("case_rs", "case_trips")}) - ({m.format("rs", "trips")}) AS "{label}"'
+                    for label, m in self._diff_measures.items())
+                sql_leftjoin = ''
+                if route_change:
+                    # Trips with an arc at a position in the route of one scenario, that is not in the other
+                    routes = 'SELECT TripID, RouteIndex, ArcID FROM {0}.routes_{1}'
+                    reference_routes = routes.format('main', self.scenarioID)
+                    case_routes = routes.format(schema, case.scenarioID)
+                    sql_select += """,
+                        CASE WHEN case_rs.TripID IS NULL THEN NULL
+                             ELSE changed.TripID IS NOT NULL
+                        END AS "Route gewijzigd" """
+                    sql_leftjoin = f"""
+                        LEFT JOIN (SELECT TripID FROM ({reference_routes} EXCEPT {case_routes})
+                                   UNION
+                                   SELECT TripID FROM ({case_routes} EXCEPT {reference_routes})) AS changed
+                            ON changed.TripID = rs.TripID"""
+
+                case_name = str(name).replace("'", "''")
+                sqls.append(f"""
+                    SELECT '{case_name}' AS "Case",
+                           rs.TripID AS TripID{sql_select}
+                    FROM main.route_statistics_{self.scenarioID} AS rs
+                    LEFT JOIN main.trips_{self.scenarioID} AS trips ON rs.TripID = trips.ID
+                    LEFT JOIN {schema}.route_statistics_{case.scenarioID} AS case_rs ON case_rs.TripID = rs.TripID
+                    LEFT JOIN {schema}.trips_{case.scenarioID} AS case_trips ON case_trips.ID = rs.TripID
+                    {sql_leftjoin}
+                    """)
+
+                # Trips that are only in the case
+                sql_missing = ''.join(f',\nNULL AS "{label}"' for label in self._diff_measures)
+                if route_change:
+                    sql_missing += ',\nNULL AS "Route gewijzigd"'
+                sqls.append(f"""
+                    SELECT '{case_name}' AS "Case",
+                           case_rs.TripID AS TripID{sql_missing}
+                    FROM {schema}.route_statistics_{case.scenarioID} AS case_rs
+                    WHERE case_rs.TripID NOT IN (SELECT TripID FROM main.route_statistics_{self.scenarioID})
+                    """)
+
+            sql = 'SELECT * FROM (' + '\nUNION ALL\n'.join(sqls) + ')'
+            sql += f'\nORDER BY ABS("{sort_by}") IS NULL, ABS("{sort_by}") DESC'
+            if limit is not None:
+                sql += f'\nLIMIT {int(limit)}'
+            logger.debug(f'Executing sql syntax: {sql}')
+            df = pd.read_sql(sql, connection)
+        finally:
+            connection.close()
+
+        if route_change:
+            df['Route gewijzigd'] = df['Route gewijzigd'].astype('boolean')
+        return df.set_index(['Case', 'TripID'])
+
+    """
+    In-memory scenario tables
+    """
+
+    # Columns of trips and route_statistics that are required for compute_route_statistics
+    _trips_measure_columns = ['NumberOfTrips', 'TotalWeight__t', 'TwentyFeetEquivalentUnits']
+    _route_statistics_measure_columns = ['TravelTime__min', 'VariableTimeCosts__Eur', 'VariableDistanceCosts__Eur',
+                                         'FixedCosts__Eur', 'Distance__km']
+
+    def load_scenario_tables(self):
+        """
+        Load the tables trips, route_statistics and routes of the current scenario into memory
+
+        Afterwards trips_timeseries, trips_statistics, routestatistics_timeseries, routestatistics_advanced (grouped
+        by Days, NSTR and/or Vorm) and arc_tripdetails(extended=False) are computed from memory instead of the
+        database. This costs memory, but saves a lot of time when these functions are called many times.
+        Use unload_scenario_tables() to release the memory.
+        """
+        logger.info(f'Loading tables of scenario {self.scenarioID} into memory')
+
+        # Without compact dtypes, products of downcast columns (like TEU * NumberOfTrips) would overflow
+        trips = self._read_sql(f'SELECT * FROM trips_{self.scenarioID}', compact=False)
+        trips['DateTime'] = pd.to_datetime(trips['DateTime'])
+        trips = trips.set_index('ID', drop=False)
+
+        route_statistics = self._read_sql(f'SELECT * FROM route_statistics_{self.scenarioID}', compact=False)
+        route_statistics = route_statistics.set_index('TripID', drop=False)
+
+        # Sorted by ArcID to find all routes passing an arc by bisection
+        routes = self._read_sql(f'SELECT TripID, RouteIndex, ArcID, OriginalArcDirection FROM routes_{self.scenarioID}',
+                                compact=False)
+        routes = routes.astype({'TripID': np.int64, 'RouteIndex': np.int32, 'ArcID': np.int32,
+                                'OriginalArcDirection': np.int8})
+        routes = routes.sort_values('ArcID', kind='mergesort').reset_index(drop=True)
+
+        # Route statistics joined with the trip properties used for grouping
+        route_statistics_trips = route_statistics[self._route_statistics_measure_columns].join(
+            trips[self._trips_measure_columns + ['DateTime', 'NstrGoodsClassification', 'AppearanceTypeID']])
+
+        self.scenario_tables = {
+            'trips': trips,
+            'route_statistics': route_statistics,
+            'routes': routes,
+            'route_statistics_trips': route_statistics_trips,
+            'nstr_groupcodes': self.sql('SELECT GroupCode FROM nstr_mapping')['GroupCode'].values,
+            'appearance_types': self.appearancetypes(rename_to_Leeg=False)['Description'],
+        }
+        return self.scenario_tables
+
+    def unload_scenario_tables(self):
+        """Release the in-memory scenario tables, all queries will be executed on the database again"""
+        self.scenario_tables = None
+
+    def _scenario_tables_arc(self, arcID):
+        """All rows of the in-memory routes table passing arcID"""
+        routes = self.scenario_tables['routes']
+        arcs = routes['ArcID'].values
+        start, end = np.searchsorted(arcs, arcID, side='left'), np.searchsorted(arcs, arcID, side='right')
+        return routes.iloc[start:end]
+
+    @staticmethod
+    def _memory_groupby(group_by):
+        """Check if routestatistics_advanced can be computed with the in-memory tables for this group_by"""
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        return set(group_by or []) <= {'Days', 'NSTR', 'Vorm'}
+
+    def _routestatistics_advanced_memory(self, group_by):
+        """In-memory equivalent of the query in routestatistics_advanced"""
+        df = self.scenario_tables['route_statistics_trips']
+        df = df[df['NumberOfTrips'] > 0]
+
+        if isinstance(group_by, str):
+            group_by = [group_by]
+
+        by = []
+        if group_by:
+            group_columns = {}
+            if 'Days' in group_by:
+                group_columns['Days'] = df['DateTime'].dt.normalize()
+            if 'NSTR' in group_by:
+                nstr = df['NstrGoodsClassification']
+                known = nstr.isin(self.scenario_tables['nstr_groupcodes'])
+                group_columns['NSTR'] = nstr if known.all() else nstr.where(known)
+            if 'Vorm' in group_by:
+                group_columns['Vorm'] = df['AppearanceTypeID'].map(self.scenario_tables['appearance_types'])
+            df = df.assign(**group_columns)
+            by = list(group_columns.keys())
+
+        df = self._aggregate_route_statistics(df, by=by)
+        if by:
+            df = df.reset_index()
+        return df
+
+    _aggregate_columns = {'NumberOfTrips', 'TotalWeight__t', 'TwentyFeetEquivalentUnits', 'TravelTime__min',
+                          'VariableTimeCosts__Eur', 'VariableDistanceCosts__Eur', 'FixedCosts__Eur', 'Distance__km'}
+
+    @classmethod
+    def _aggregate_route_statistics(cls, df, by=None):
+        """
+        Pandas equivalent of compute_route_statistics
+
+        df contains the columns of trips and route_statistics that are used in compute_route_statistics
+        by: column(s) to group by. Without grouping a single row is returned
+        """
+        # In 64 bit like SQLite, columns with compact dtypes (int8, float32) would overflow or lose precision
+        df = df.astype({c: np.int64 if pd.api.types.is_integer_dtype(t) and not df[c].hasnans else np.float64
+                        for c, t in df.dtypes.items() if c in cls._aggregate_columns})
+        n = df['NumberOfTrips']
+        measures = pd.DataFrame({
+            'Aantal Vaarbewegingen (-)': n,
+            'Totale Vracht (ton)': df['TotalWeight__t'] * n,
+            'Totale TEU (-)': df['TwentyFeetEquivalentUnits'] * n,
+            'Totale Reistijd (min)': df['TravelTime__min'] * n,
+            'VariableTimeCosts': df['VariableTimeCosts__Eur'] * n,
+            'VariableDistanceCosts': df['VariableDistanceCosts__Eur'] * n,
+            'FixedCosts': df['FixedCosts__Eur'] * n,
+            'Totale Afstand (km)': df['Distance__km'] * n,
+            'Totale TonKM (TONKM)': (df['TotalWeight__t'] * df['Distance__km']) * n,
+        })
+
+        if by:
+            if isinstance(by, str):
+                by = [by]
+            measures = measures.reset_index(drop=True)
+            for b in by:
+                measures[b] = df[b].values
+            sums = measures.groupby(by, dropna=False).sum(min_count=1)
+        else:
+            sums = measures.sum(min_count=1).to_frame().T
+
+        return pd.DataFrame({
+            'Aantal Vaarbewegingen (-)': sums['Aantal Vaarbewegingen (-)'],
+            'Totale Vracht (ton)': sums['Totale Vracht (ton)'],
+            'Totale TEU (-)': sums['Totale TEU (-)'],
+            'Totale Reistijd (min)': sums['Totale Reistijd (min)'],
+            'Totale Vaarkosten (EUR)': sums['VariableTimeCosts'] + sums['VariableDistanceCosts'] + sums['FixedCosts'],
+            'Totale Variabele Vaarkosten (EUR)': sums['VariableTimeCosts'] + sums['VariableDistanceCosts'],
+            'Totale Variabele-Tijd Vaarkosten (EUR)': sums['VariableTimeCosts'],
+            'Totale Variabele-Afstand Vaarkosten (EUR)': sums['VariableDistanceCosts'],
+            'Totale Vaste Vaarkosten (EUR)': sums['FixedCosts'],
+            'Totale Afstand (km)': sums['Totale Afstand (km)'],
+            'Totale TonKM (TONKM)': sums['Totale TonKM (TONKM)'],
+        })
+
+    """
+    Aggregate cube
+    """
+
+    # Dimensions of the cube, and the columns in which they are stored
+    cube_dimensions = {
+        'Days': 'Days',
+        'ArcID': 'ArcID',
+        'NSTR': 'NSTR',
+        'Vorm': 'AppearanceTypeID',
+        'CEMT-klasse': 'CEMTTypeID',
+        'Scheepvaartklasse': 'ShipTypeID',
+    }
+
+    def cube_databasefile(self):
+        """Path of the sidecar database with the aggregate cubes of the database"""
+        return self.databasefile.with_suffix('.cube' + self.databasefile.suffix)
+
+    def build_cube(self, chunksize=1000000):
+        """
+        Compute the aggregate cube of the current scenario and store it in the sidecar database (see
+        cube_databasefile). An existing cube of the scenario is replaced.
+
+        The cube contains the measures of compute_route_statistics and the number of trips (Aantal) per combination
+        of day, NSTR class, CEMT class, ship type and appearance type (table cube_trips_{scenario}), and also per
+        arc (table cube_arcs_{scenario}). Any subset of these dimensions can be requested with cube_rollup.
+        """
+        dimensions = """
+            DATE(trips.DateTime) AS Days,
+            trips.NstrGoodsClassification AS NSTR,
+            ship_types.CEMTTypeID AS CEMTTypeID,
+            trips.ShipTypeID AS ShipTypeID,
+            trips.AppearanceTypeID AS AppearanceTypeID,"""
+        dimensions_groupby = """DATE(trips.DateTime), trips.NstrGoodsClassification, ship_types.CEMTTypeID,
+            trips.ShipTypeID, trips.AppearanceTypeID"""
+
+        # Same selection of trips as routestatistics_advanced
+        sql_trips = f"""
+        SELECT {dimensions}
+               COUNT(trips.ID) AS Aantal,
+               {self.compute_route_statistics}
+        FROM route_statistics_{self.scenarioID} AS route_statistics
+        LEFT JOIN trips_{self.scenarioID} AS trips ON route_statistics.TripID = trips.ID
+        LEFT JOIN ship_types ON trips.ShipTypeID = ship_types.ID
+        WHERE trips.NumberOfTrips > 0
+        GROUP BY {dimensions_groupby}
+        """
+
+        # Trips without NumberOfTrips are kept (with HasTrips = 0) for arcs_timeseries
+        sql_arcs = f"""
+        SELECT routes.ArcID AS ArcID,
+               {dimensions}
+               trips.NumberOfTrips > 0 AS HasTrips,
+               COUNT(trips.ID) AS Aantal,
+               {self.compute_route_statistics}
+        FROM routes_{self.scenarioID} AS routes
+        LEFT JOIN trips_{self.scenarioID} AS trips ON routes.TripID = trips.ID
+        LEFT JOIN ship_types ON trips.ShipTypeID = ship_types.ID
+        LEFT JOIN route_statistics_{self.scenarioID} AS route_statistics ON route_statistics.TripID = routes.TripID
+        GROUP BY routes.ArcID, {dimensions_groupby}, trips.NumberOfTrips > 0
+        """
+
+        cubefile = self.cube_databasefile()
+        logger.info('Building aggregate cube of scenario {} in: {}'.format(self.scenarioID, cubefile))
+        con = sqlite3.connect(cubefile)
+        for name, sql in [('trips', sql_trips), ('arcs', sql_arcs)]:
+            table = f'cube_{name}_{self.scenarioID}'
+            con.execute(f'DROP TABLE IF EXISTS "{table}"')
+            for df in self.sql_chunks(sql, chunksize=chunksize):
+                df.to_sql(table, con, index=False, if_exists='append')
+        con.execute(f'CREATE INDEX IF NOT EXISTS "cube_arcs_{self.scenarioID}_ArcID" '
+                    f'ON "cube_arcs_{self.scenarioID}" (ArcID)')
+
+        con.execute('CREATE TABLE IF NOT EXISTS cube_info '
+                    '(ScenarioID INTEGER PRIMARY KEY, DatabaseSize INTEGER, DatabaseModified INTEGER, Measures TEXT)')
+        con.execute('INSERT OR REPLACE INTO cube_info VALUES (?, ?, ?, ?)', self._cube_info())
+        con.commit()
+        con.close()
+
+        if self.cube is not None:
+            self.enable_cube(build=False)
+        return cubefile
+
+    def enable_cube(self, build=True):
+        """
+        Use the aggregate cube of the current scenario (see build_cube) for roll-ups and for routestatistics_advanced
+        and arcs_timeseries
+
+        build: build the cube if it does not exist or is outdated
+        """
+        if self.cube is not None:
+            self.cube.close()
+        self.cube = None
+        if build and not self._cube_is_current():
+            self.build_cube()
+        self.cube = sqlite3.connect(self.cube_databasefile(), check_same_thread=False)
+        if not self._cube_is_current():
+            logger.warning('Aggregate cube of scenario {} is missing or outdated'.format(self.scenarioID))
+        return self.cube
+
+    def disable_cube(self):
+        if self.cube is not None:
+            self.cube.close()
+        self.cube = None
+
+    def _cube_info(self):
+        """Properties of the database and measures that determine the content of the cube"""
+        stat = self.databasefile.stat()
+        return int(self.scenarioID), stat.st_size, stat.st_mtime_ns, normalize_sql(self.compute_route_statistics)
+
+    def _cube_is_current(self):
+        cubefile = self.cube_databasefile()
+        if not cubefile.exists():
+            return False
+        con = self.cube if self.cube is not None else sqlite3.connect(cubefile)
+        try:
+            row = con.execute('SELECT * FROM cube_info WHERE ScenarioID = ?', (int(self.scenarioID),)).fetchone()
+        except sqlite3.Error:
+            row = None
+        finally:
+            if con is not self.cube:
+                con.close()
+        return row == self._cube_info()
+
+    def _cube_available(self):
+        """Whether the cube is enabled and matches the scenario and compute_route_statistics"""
+        return self.cube is not None and self._cube_is_current()
+
+    def _cube_measure_columns(self):
+        return ['Aantal'] + re.findall(r'AS "([^"]+)"', self.compute_route_statistics)
+
+    def _cube_query(self, dimensions, arcIDs=None, include_empty=False):
+        """
+        Sum the measures of the cube over all dimensions that are not given. Descriptions of the dimensions are not
+        formatted yet (like in the SQL of routestatistics_advanced).
+        """
+        unknown = set(dimensions) - set(self.cube_dimensions)
+        if unknown:
+            raise ValueError(f'Unknown dimensions: {", ".join(unknown)}. '
+                             f'Choose from: {", ".join(self.cube_dimensions)}')
+
+        if 'ArcID' in dimensions or arcIDs is not None:
+            table = f'cube_arcs_{self.scenarioID}'
+            where = '1' if include_empty else 'HasTrips = 1'
+            if arcIDs is not None:
+                where += ' AND ArcID IN ({})'.format(', '.join(str(a) for a in arcIDs))
+        else:
+            table = f'cube_trips_{self.scenarioID}'
+            where = '1'
+
+        columns = [self.cube_dimensions[d] for d in dimensions]
+        sql_select = ''.join(f'{c} AS "{d}", ' for d, c in zip(dimensions, columns))
+        sql_measures = ', '.join(f'SUM("{m}") AS "{m}"' for m in self._cube_measure_columns())
+        sql_groupby = 'GROUP BY ' + ', '.join(columns) if columns else ''
+        sql = f"""
+        SELECT {sql_select}{sql_measures}
+        FROM {table}
+        WHERE {where}
+        {sql_groupby}
+        """
+        logger.debug(f'Executing sql syntax on cube: {sql}')
+        df = pd.read_sql(sql, self.cube)
+        if not columns and df['Aantal'].isna().all():
+            df = df.iloc[:0]
+
+        if 'NSTR' in dimensions:
+            nstr = df['NSTR']
+            known = nstr.isin(self.sql('SELECT GroupCode FROM nstr_mapping')['GroupCode'])
+            if not known.all():
+                df['NSTR'] = nstr.where(known)
+        if 'Vorm' in dimensions:
+            df['Vorm'] = df['Vorm'].map(self.appearancetypes(rename_to_Leeg=False)['Description'])
+        if 'CEMT-klasse' in dimensions:
+            df['CEMT-klasse'] = df['CEMT-klasse'].map(self.CEMTclass()['Description'])
+        if 'Scheepvaartklasse' in dimensions:
+            df['Scheepvaartklasse'] = df['Scheepvaartklasse'].map(self.shiptypes()['Label'])
+        return df
+
+    def cube_rollup(self, dimensions=['NSTR'], arcIDs=None):
+        """
+        Measures of compute_route_statistics (and the number of trips: Aantal) for any combination of the
+        dimensions of the aggregate cube: Days, ArcID, NSTR, Vorm, CEMT-klasse and Scheepvaartklasse.
+
+        arcIDs: only include trips that pass one of the arcs. Note that trips passing multiple of these arcs are
+                counted multiple times, unless ArcID is one of the dimensions.
+
+        The cube should be enabled first, see enable_cube
+        """
+        if self.cube is None:
+            raise ValueError('The aggregate cube is not enabled, use enable_cube first')
+        if isinstance(dimensions, str):
+            dimensions = [dimensions]
+
+        df = self._cube_query(dimensions, arcIDs=arcIDs)
+        df = relabel(df, {'NSTR': self.NSTR_shortnames, 'Vorm': self.appeareance_rename})
+        if 'Days' in df.columns:
+            df['Days'] = pd.to_datetime(df['Days'])
+        if dimensions:
+            df = df.set_index(dimensions).sort_index()
+        return df
+
+    def enable_query_cache(self, max_bytes=512 * 1024 ** 2):
+        """
+        Keep the results of queries in memory, so repeating a query does not hit the database
+
+        max_bytes: memory budget of the cache, least recently used results are removed first
+
+        Use self.query_cache.invalidate() when the database has been modified.
+        """
+        self.query_cache = QueryCache(max_bytes=max_bytes)
+        return self.query_cache
+
+    def disable_query_cache(self):
+        self.query_cache = None
+
+    def enable_disk_cache(self, cachedir=None, min_seconds=1.0):
+        """
+        Store results of slow queries on disk, so they are available in later sessions (sqlite only)
+
+        cachedir: directory of the cache. Default is the directory pyBIVAS_cache next to the database
+        min_seconds: only results of queries that take longer than this are stored
+
+        Results are stored per query and fingerprint of the tables in the query (number of rows, maximum rowid) and
+        the modification time of the database. When the database changes, the stored results are not used anymore.
+        """
+        if cachedir is None:
+            cachedir = self.databasefile.parent / 'pyBIVAS_cache'
+        self.disk_cache = DiskCache(cachedir)
+        self.disk_cache_min_seconds = min_seconds
+        return self.disk_cache
+
+    def disable_disk_cache(self):
+        self.disk_cache = None
+
+    def enable_compact_dtypes(self):
+        """
+        Convert results of queries to memory-compact dtypes: lookup strings (like descriptions of ship types) become
+        categoricals, integers are downcast and floats become float32 when this is exact. See pyBIVAS.dtypes
+
+        Results of sql_chunks are not converted, because the dtypes could differ between chunks.
+        """
+        self.compact_dtypes = True
+
+    def disable_compact_dtypes(self):
+        self.compact_dtypes = False
+
+    def enable_lookup_tables(self):
+        """
+        Read the lookup tables (like ship_types, cemt_class and nstr_mapping) once, and add their descriptions to the
+        results of arc_tripdetails (per trip), route_stats, node_statistics and zone_statistics in pandas. The queries
+        then only return the keys of the trips. See pyBIVAS.lookup
+
+        The columns of the lookup tables are added after the other columns.
+        """
+        self.lookup_tables = LookupTables(lambda sql: self._read_sql(sql, compact=False))
+        return self.lookup_tables
+
+    def disable_lookup_tables(self):
+        self.lookup_tables = None
+
+    def _table_fingerprint(self, table):
+        """Cheap fingerprint of the content of a table, computed once per session"""
+        if table not in self._table_fingerprints:
+            try:
+                fingerprint = tuple(self._thread_connection().execute(
+                    f'SELECT COUNT(*), MAX(rowid) FROM "{table}"').fetchone())
+            except sqlite3.Error:
+                fingerprint = None  # Not a table, like a subquery alias
+            # setdefault is atomic, threads of sql_parallel may compute the same fingerprint
+            self._table_fingerprints.setdefault(table, fingerprint)
+        return self._table_fingerprints[table]
+
+    def _disk_cache_key(self, sql):
+        """Key of query in the disk cache"""
+        stat = Path(self.database_identity).stat()
+        tables = tuple((t, self._table_fingerprint(t)) for t in sql_tables(sql))
+        return normalize_sql(sql), tables, stat.st_size, stat.st_mtime_ns, self.compact_dtypes
+
     def sql(self, sql):
         """ Execute sql on loaded database"""
-        logger.debug(f'Executing sql syntax: {sql}')
-        return pd.read_sql(sql, self.connection)
+        cacheable = is_select(sql)
+
+        if self.query_cache is not None and cacheable:
+            key = self.query_cache.key(sql, self.database_identity) + (self.compact_dtypes,)
+            df = self.query_cache.get(key)
+            if df is not None:
+                logger.debug(f'Using cached result of sql syntax: {sql}')
+                return df
+
+        if self.disk_cache is not None and cacheable and isinstance(self.connection, sqlite3.Connection):
+            disk_key = self._disk_cache_key(sql)
+            df = self.disk_cache.get(disk_key)
+            if df is None:
+                start = time.perf_counter()
+                df = self._read_sql(sql)
+                if time.perf_counter() - start >= self.disk_cache_min_seconds:
+                    self.disk_cache.put(disk_key, df)
+            else:
+                logger.debug(f'Using result of sql syntax from disk: {sql}')
+        else:
+            df = self._read_sql(sql)
+
+        if self.query_cache is not None and cacheable:
+            self.query_cache.put(key, df)
+            return copy_on_write(df)
+        return df
+
+    def sql_chunks(self, sql, chunksize=100000):
+        """
+        Execute sql on loaded database, and yield the result as dataframes of at most chunksize rows.
+
+        The results are not cached. The dtypes of the first chunk are also used for the next chunks when possible
+        (a chunk with only missing values would otherwise get another dtype).
+        """
+        logger.debug(f'Executing sql syntax in chunks of {chunksize} rows: {sql}')
+        connection = self._thread_connection()
+        if isinstance(connection, sqlite3.Connection):
+            chunks = pd.read_sql(sql, connection, chunksize=chunksize)
+        else:
+            chunks = mysql.read_sql_chunks(connection, to_mysql(sql), chunksize=chunksize)
+
+        dtypes = None
+        for df in chunks:
+            if dtypes is None:
+                dtypes = df.dtypes
+            else:
+                for column in df.columns[(df.dtypes != dtypes).values]:
+                    try:
+                        df[column] = df[column].astype(dtypes[column])
+                    except (ValueError, TypeError):
+                        pass
+            yield df
+
+    def _read_sql(self, sql, compact=True):
+        """Execute sql on the database connection, compact: convert to compact dtypes if enabled"""
+        df = None
+        if self.duckdb is not None:
+            df = self._read_sql_duckdb(sql)
+        if df is None:
+            logger.debug(f'Executing sql syntax: {sql}')
+            connection = self._thread_connection()
+            if isinstance(connection, sqlite3.Connection):
+                df = pd.read_sql(sql, connection)
+            else:
+                df = mysql.read_sql(connection, to_mysql(sql))
+        if compact and self.compact_dtypes:
+            df = compact_dtypes(df)
+        return df
+
+    def _read_sql_duckdb(self, sql):
+        """Execute sql with DuckDB, or return None if DuckDB does not support the query"""
+        import duckdb
+
+        duckdb_sql = to_duckdb(sql)
+        logger.debug(f'Executing sql syntax with DuckDB: {duckdb_sql}')
+        cursor = self.duckdb.cursor()  # A cursor per call, because the connection is shared between threads
+        try:
+            cursor.execute('USE bivas')  # A cursor starts in the default database, not the attached one
+            # The types of the columns with SUM instead of FSUM (see to_duckdb), so sums of integers stay integers
+            types = [str(t) for _, t, *_ in cursor.execute(f'DESCRIBE {to_duckdb(sql, compensated=False)}').fetchall()]
+            result = cursor.execute(duckdb_sql)
+            names = [name for name, *_ in result.description]
+            df = result.df()
+        except duckdb.Error as e:
+            # Once per query that only differs in its values, so the log shows which queries are not accelerated
+            shape = re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", '?', normalize_sql(sql))
+            if shape not in self._duckdb_fallbacks:
+                self._duckdb_fallbacks.add(shape)
+                logger.warning(f'Query is executed by SQLite, because DuckDB failed: {e}\n{sql}')
+            return None
+        finally:
+            cursor.close()
+
+        # Make the names and types identical to the result of SQLite
+        df.columns = names  # DuckDB renames duplicate columns (like ID of trips.* and route_statistics.*)
+        if len(df) == 0:
+            return df.astype(object)
+        for i, t in enumerate(types):
+            column = df.iloc[:, i]
+            if column.isna().all():
+                df.isetitem(i, pd.Series([None] * len(df), index=df.index, dtype=object))
+            elif t in ('HUGEINT', 'DECIMAL') or t.startswith('DECIMAL'):
+                # Sums of integers (computed by FSUM as float)
+                if column.notna().all() and (column == column.round()).all():
+                    df.isetitem(i, column.astype('int64'))
+                else:
+                    df.isetitem(i, column.astype('float64'))
+            elif t == 'BOOLEAN' or pd.api.types.is_integer_dtype(column.dtype):
+                # Integers with NULL values are floats, like in SQLite
+                df.isetitem(i, column.astype('float64') if column.isna().any() else column.astype('int64'))
+        return df
+
+    def sql_parallel(self, queries, max_workers=4):
+        """
+        Execute independent queries concurrently, each thread with its own read-only connection to the database.
+
+        queries: list or dictionary of sql queries
+        max_workers: number of threads. The threads and their connections are kept for next calls, until
+                     close_connection_pool is called or the database is reconnected.
+
+        Returns a list or dictionary (with the same keys) of the results of sql()
+        """
+        keys = list(queries.keys()) if isinstance(queries, dict) else list(range(len(queries)))
+        sqls = [queries[k] for k in keys]
+
+        if max_workers <= 1 or len(sqls) <= 1 or getattr(self._local, 'connection', None) is not None:
+            # Serial execution, also when called from one of the threads of the pool itself
+            results = [self.sql(sql) for sql in sqls]
+        else:
+            results = list(self._connection_pool(max_workers).map(self.sql, sqls))
+
+        if isinstance(queries, dict):
+            return dict(zip(keys, results))
+        return results
+
+    def _connection_pool(self, max_workers):
+        """Pool of threads which all have their own connection"""
+        with self._pool_lock:
+            if self._pool is not None and self._pool_max_workers != max_workers:
+                self._shutdown_pool()
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pyBIVAS',
+                                                initializer=self._open_thread_connection)
+                self._pool_max_workers = max_workers
+        return self._pool
+
+    def _open_thread_connection(self):
+        """Open connection for the current thread of the pool"""
+        if isinstance(self.connection, sqlite3.Connection):
+            # A normal connection is only needed for writing, which is not done in parallel
+            profile = 'readonly' if self.profile == 'default' else self.profile
+            connection = self._connect_sqlite(self.connectfile, profile, check_same_thread=False)
+        else:
+            import pymysql
+            connection = pymysql.connect(**self._mysql_parameters)
+        self._local.connection = connection
+        with self._pool_lock:
+            self._pool_connections.append(connection)
+
+    @contextmanager
+    def thread_connection(self):
+        """
+        Use a connection of its own in the current thread, for other threads than the one that connected to the
+        database (like in pyBIVAS_plot_compare). The connection is closed afterwards.
+
+        with BIVAS.thread_connection():
+            df = BIVAS.arc_tripdetails(arcID)
+        """
+        if getattr(self._local, 'connection', None) is not None:
+            yield
+            return
+
+        self._open_thread_connection()
+        try:
+            yield
+        finally:
+            connection = self._local.connection
+            self._local.connection = None
+            with self._pool_lock:
+                if connection in self._pool_connections:
+                    self._pool_connections.remove(connection)
+            connection.close()
+
+    def _thread_connection(self):
+        """Connection of the current thread in the pool, or the main connection"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            return self.connection
+        return connection
+
+    def enable_parallel(self, max_workers=4):
+        """
+        Execute the queries for origins and destinations in node_statistics, node_timeseries, zone_statistics,
+        zone_timeseries, nodes_statistics and nodes_timeseries concurrently (see sql_parallel)
+        """
+        self.parallel_workers = max_workers
+
+    def disable_parallel(self):
+        self.parallel_workers = 1
+        self.close_connection_pool()
+
+    def close_connection_pool(self):
+        """Stop the threads of sql_parallel and close their connections"""
+        with self._pool_lock:
+            self._shutdown_pool()
+
+    def _shutdown_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for connection in self._pool_connections:
+            connection.close()
+        self._pool_connections = []
 
     def sql_tableexists(self, table):
         """ Check if table exists in database"""
-        sql = f"""SELECT count(*) FROM sqlite_master WHERE type='table' AND name='{table}'"""
+        if isinstance(self.connection, sqlite3.Connection):
+            sql = f"""SELECT count(*) FROM sqlite_master WHERE type='table' AND name='{table}'"""
+        else:
+            sql = f"""SELECT count(*) FROM information_schema.tables WHERE table_schema=DATABASE() AND table_name='{table}'"""
         df = self.sql(sql)
         return df.iloc[0, 0] > 0
 
@@ -1455,10 +3233,10 @@ class pyBIVAS:
             if not v['Label'] == f'M{v["CEMTTypeID"] - 1}':
                 replace_label[v['Label']] = f'M{v["CEMTTypeID"] - 1}'
 
-        ordered_ship_types = ship_types['Label'].replace(replace_label).drop_duplicates()
+        ordered_ship_types = relabel(ship_types, {'Label': replace_label})['Label'].drop_duplicates()
 
         data_merge_small_ships = df.copy()
-        data_merge_small_ships = data_merge_small_ships.replace({'ship_types_Label': replace_label})
+        data_merge_small_ships = relabel(data_merge_small_ships, {'ship_types_Label': replace_label})
         return ordered_ship_types, data_merge_small_ships
 
     @staticmethod
@@ -1475,56 +3253,97 @@ class pyBIVAS:
     """
 
     def networkx_generate(self):
-        """Create Networkx from arcs and nodes"""
+        """
+        Create Networkx from arcs and nodes, and a RoutingGraph (scipy.sparse.csgraph) for shortest paths
 
-        arcs = self.network_arcs().reset_index()
-        nodes = self.network_nodes()
+        When the disk cache is enabled (see enable_disk_cache), both are stored in the cache directory, and reused
+        for the same database and scenario
+        """
+        key = None
+        if self.disk_cache is not None and isinstance(self.connection, sqlite3.Connection):
+            stat = Path(self.database_identity).stat()
+            key = ('networkx', self.database_identity, stat.st_size, stat.st_mtime_ns, self.scenarioID)
+            cached = self.disk_cache.get_object(key)
+            if cached is not None:
+                self.NetworkX, self.routing = cached
+                return self.NetworkX
 
-        arcs = arcs[['ID', 'FromNodeID', 'ToNodeID', 'Name', 'Length__m']]
+        sql = f"""
+        SELECT arcs.ID, arcs.FromNodeID, arcs.ToNodeID, arcs.Name, arcs.Length__m
+        FROM arcs
+        LEFT JOIN `branching$branch_sets` AS BS ON arcs.BranchSetID = BS.Id
+        WHERE BS.BranchID = {self.scenarioID}
+        ORDER BY arcs.ID
+        """
+        arcs = self.sql(sql)
+
+        sql = f"""
+        SELECT nodes.ID, nodes.XCoordinate, nodes.YCoordinate
+        FROM nodes
+        LEFT JOIN `branching$branch_sets` AS BS ON nodes.BranchSetID = BS.Id
+        WHERE BS.BranchID = {self.scenarioID}
+        """
+        nodes = self.sql(sql)
+
+        G = nx.from_pandas_edgelist(arcs, 'FromNodeID', 'ToNodeID', edge_attr=True)
+        connected = nodes['ID'].isin(list(G.nodes)).to_numpy()
+        if not connected.all():
+            logger.info('Nodes not connected to any edge: {}'.format(', '.join(str(n) for n in nodes['ID'][~connected])))
+        nodes = nodes[connected]
+        nx.set_node_attributes(G, dict(zip(nodes['ID'], nodes['XCoordinate'])), 'X')
+        nx.set_node_attributes(G, dict(zip(nodes['ID'], nodes['YCoordinate'])), 'Y')
 
-        G = nx.from_pandas_edgelist(
-            arcs, 'FromNodeID', 'ToNodeID', edge_attr=True)
-        for nodeID, nodeValues in nodes.iterrows():
-            if nodeID in G.nodes:
-                G.nodes[nodeID]['X'] = nodeValues['XCoordinate']
-                G.nodes[nodeID]['Y'] = nodeValues['YCoordinate']
-            else:
-                pass
-                print('Node {} is not connected to any edge'.format(nodeID))
         self.NetworkX = G
+        self.routing = RoutingGraph(arcs['ID'], arcs['FromNodeID'], arcs['ToNodeID'], arcs['Length__m'])
+
+        if key is not None:
+            self.disk_cache.put_object(key, (self.NetworkX, self.routing))
         return self.NetworkX
 
     def networkx_findpath(self, nodeidstart, nodeidend):
-        """Find the path between two nodes
+        """Find the path between two nodes (shortest path by length, with scipy.sparse.csgraph)
         Returns list of nodes and edges
         """
         if not hasattr(self, 'NetworkX'):
             self.networkx_generate()
 
-        pathnodes = nx.dijkstra_path(
-            self.NetworkX, nodeidstart, nodeidend, weight='Length__m')
-        pathedges = []
-        for i in range(len(pathnodes) - 1):
-            pathedges.append(
-                self.NetworkX[pathnodes[i]][pathnodes[i + 1]]['ID'])
-        return pathnodes, pathedges
+        pathnodes, pathedges = self.routing.path(nodeidstart, nodeidend)
+        return pathnodes.tolist(), pathedges.tolist()
 
     def networkx_findpath_multiple(self, pathnodes):
         """
-        for each set of nodes, find the path between the nodes
+        for each set of nodes, find the path between the nodes (see networkx_findpath_batch)
 
         pathnodes={
         'Waal_Upstream':(6855,6799),
         'Waal_Downstream':(6799,7073)}
+
+        Returns a dictionary with a list of arc IDs per set of nodes (like networkx_findpath)
+        """
+        offsets, arcIDs, lengths = self.networkx_findpath_batch(list(pathnodes.values()))
+
+        pathedges = {}
+        for i, name in enumerate(pathnodes):
+            if np.isinf(lengths[i]):
+                nodes = pathnodes[name]
+                raise nx.NetworkXNoPath(f'No path between {nodes[0]} and {nodes[1]}')
+            pathedges[name] = arcIDs[offsets[i]:offsets[i + 1]].tolist()
+        return pathedges
+
+    def networkx_findpath_batch(self, pairs, max_workers=1):
         """
+        Shortest paths between many pairs of nodes, with one search per distinct start node
 
+        pairs: list or array of (nodeidstart, nodeidend)
+        max_workers: number of processes to spread the searches over
+
+        Returns offsets, arcIDs and lengths (in m): the arcs of pair i are arcIDs[offsets[i]:offsets[i + 1]]. Pairs
+        without a path have no arcs and an infinite length.
+        """
         if not hasattr(self, 'NetworkX'):
             self.networkx_generate()
 
-        pathedges = {}
-        for name, nodes in pathnodes.items():
-            _, pathedges[name] = self.networkx_findpath(nodes[0], nodes[1])
-        return pathedges
+        return self.routing.arc_paths(pairs, max_workers=max_workers)
 
 
 class pyBIVAS_v48(pyBIVAS):
@@ -1583,111 +3402,16 @@ class pyBIVAS_v48(pyBIVAS):
         df.set_index('ID', inplace=True)
 
         df['DateTime'] = pd.to_datetime(df['DateTime'])
-        df['Vaarrichting'] = df['Vaarrichting'].replace(to_replace=self.directions_dutch)
+        df = relabel(df, {'Vaarrichting': self.directions_dutch})
 
         return df
 
 
-    def countingpoint_timeseries(self, countingPointName, referenceSetId=None, trafficScenarioId=None, pivot='Vaarrichting',
-                                 param="Aantal Vaarbewegingen (-)"):
-        """
-        Create timeserie of all trips passing a countingpoint in the referenceset.
-        Possible to differentiate per direction, or have it combined
-
-        pivot: None, "Vaarrichting", "Bestemming", "Herkomst", "Scheepvaartklasse", "CEMT-klasse"
-        """
-        if referenceSetId is None:
-            referenceSetId = self.ReferenceTripSetID
-            
-        if trafficScenarioId is None:
-            trafficScenarioId = self.trafficScenario
-
-        sql_select = 'DATE(trips.DateTime) AS "Days"'
-        sql_leftjoin = ''
-        sql_groupby = '"Days"'
-        sql_where = ''
-
-
-        if pivot == 'Vaarrichting':
-            sql_select += ', directions.Label AS Vaarrichting'
-            sql_groupby += ', counting_points.DirectionID'
-            sql_leftjoin += 'LEFT JOIN directions on counting_points.DirectionID == directions.ID'
-        elif pivot == 'Bestemming':
-            zone_definition_id = 9
-            sql_leftjoin += 'LEFT JOIN zone_node_mapping AS znm_Destination ON trips.DestinationTripEndPointNodeID = znm_Destination.NodeID '
-            sql_leftjoin += 'LEFT JOIN zones AS zones_destination ON znm_Destination.ZoneID = zones_destination.ID '
-            sql_groupby += ', Bestemming'
-            sql_select += ', zones_destination.Name AS Bestemming'
-            sql_where += f' AND zones_destination.ZoneDefinitionID = {zone_definition_id} AND znm_Destination.ZoneDefinitionID = {zone_definition_id}'
-        elif pivot == 'Herkomst':
-            zone_definition_id = 9
-            sql_leftjoin += 'LEFT JOIN zone_node_mapping AS znm_Origin ON trips.OriginTripEndPointNodeID = znm_Origin.NodeID '
-            sql_leftjoin += 'LEFT JOIN zones AS zones_origin ON znm_Origin.ZoneID = zones_origin.ID '
-            sql_groupby += ', Herkomst'
-            sql_select += ', zones_origin.Name AS Herkomst'
-            sql_where += f' AND zones_origin.ZoneDefinitionID = {zone_definition_id} AND znm_Origin.ZoneDefinitionID = {zone_definition_id}'
-        elif pivot == 'Scheepvaartklasse':
-            sql_select += f"""
-                 , ship_types.Label AS Scheepvaartklasse
-                 """
-            sql_leftjoin += f"""
-                 LEFT JOIN ship_types ON trips.ShipTypeID = ship_types.ID
-                 LEFT JOIN cemt_class ON ship_types.CEMTTypeID = cemt_class.Id
-                 """
-            sql_groupby += ', Scheepvaartklasse'
-        elif pivot == 'CEMT-klasse':
-            sql_select += f"""
-                 , cemt_class.Description AS "CEMT-klasse"
-                 """
-            sql_leftjoin += f"""
-                 LEFT JOIN ship_types ON trips.ShipTypeID = ship_types.ID
-                 LEFT JOIN cemt_class ON ship_types.CEMTTypeID = cemt_class.Id
-                 """
-            sql_groupby += ', "CEMT-klasse"'
-        else:
-            pass
-
-
-        sql = f"""
-        SELECT
-        {sql_select},
-        SUM(trips.NumberOfTrips) AS "Aantal Vaarbewegingen (-)",
-        SUM(trips.TotalWeight__t * trips.NumberOfTrips) AS "Totale Vracht (ton)"
+    @staticmethod
+    def _countingpoint_trips_sql():
+        sql = """
         FROM reference_trip_set
         LEFT JOIN trips ON reference_trip_set.TripID == trips.ID
         LEFT JOIN counting_points ON reference_trip_set.CountingPointID == counting_points.ID
-        {sql_leftjoin}
-        WHERE ReferenceSetID = {referenceSetId}
-        AND counting_points.Name = "{countingPointName}"
-        AND trips.TrafficScenarioID = {trafficScenarioId}
-        AND trips.NumberOfTrips > 0
-        {sql_where}
-        GROUP BY {sql_groupby}
         """
-        df = self.sql(sql)
-
-        df['Days'] = pd.to_datetime(df['Days'])
-        df = df.set_index('Days')
-
-        # If not returning here, it will crash
-        if df.shape[0] == 0:
-            return None
-
-        if pivot is not None:
-            df = df.pivot(columns=pivot)
-            df.rename(mapper=self.directions_dutch, inplace=True, axis=1)
-
-        df = df[param]
-
-        # df = df.replace({0: np.nan}) add this to also exclude all empty vessels when processing vracht
-
-        if pivot == 'Scheepvaartklasse':
-            ordered_columns = self.shiptypes()['Label']
-            df = df.reindex(ordered_columns, axis=1).dropna(how='all', axis=1)
-        elif pivot == 'CEMT-klasse':
-            ordered_columns = self.CEMTclass()['Description']
-            df = df.reindex(ordered_columns, axis=1).dropna(how='all', axis=1)
-
-        fullyear = pd.date_range('01-01-{}'.format(df.index[0].year), '31-12-{}'.format(df.index[0].year))
-        df = df.reindex(fullyear, fill_value=0).fillna(0)
-        return df
\ No newline at end of file
+        return sql, 'ReferenceSetID'
\ No newline at end of file
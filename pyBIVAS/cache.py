@@ -0,0 +1,211 @@
+"""
+Caching of query results of pyBIVAS
+
+Jurjen de Jong, Deltares
+"""
+import re
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Tables that are read in a query
+_sql_tables = re.compile(r'\b(?:FROM|JOIN)\s+[`"\[]?([\w$]+)', flags=re.IGNORECASE)
+
+# Quoted strings or identifiers are kept as is, other whitespace is collapsed
+_sql_tokens = re.compile(r"""('[^']*'|"[^"]*"|`[^`]*`)|\s+""")
+
+
+def normalize_sql(sql):
+    """Remove layout from sql, so identical queries get an identical key"""
+    return _sql_tokens.sub(lambda m: m.group(1) or ' ', sql).strip()
+
+
+def sql_tables(sql):
+    """Names of the tables that are used in a query"""
+    return sorted(set(_sql_tables.findall(sql)))
+
+
+def is_select(sql):
+    """Only results of queries that read from the database can be cached"""
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+def copy_on_write(df):
+    """
+    Return a copy of df that can be modified without changing df.
+
+    With the copy-on-write mode of pandas a cheap shallow copy is sufficient, otherwise a deep copy is made.
+    """
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return df.copy(deep=False)
+
+    try:
+        copy_on_write_mode = pd.get_option('mode.copy_on_write') is True
+    except (KeyError, AttributeError):
+        copy_on_write_mode = False  # Option not available in older versions of pandas
+    return df.copy(deep=not copy_on_write_mode)
+
+
+class QueryCache:
+    """
+    In-memory cache of query results with LRU eviction
+
+    max_bytes: memory budget of all cached results together. The least recently used results are removed when the
+               budget is exceeded. Results larger than the budget are not cached.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'QueryCache: {len(self._results)} results, {self.nbytes / 1024 ** 2:.1f} MB, ' \
+               f'{self.hits} hits, {self.misses} misses'
+
+    def __len__(self):
+        return len(self._results)
+
+    @staticmethod
+    def key(sql, database):
+        """Key of a query on a database"""
+        return database, normalize_sql(sql)
+
+    def get(self, key):
+        """Return a copy of the cached result, or None if the query is not cached"""
+        with self._lock:
+            if key not in self._results:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._results.move_to_end(key)
+            df, _ = self._results[key]
+        return copy_on_write(df)
+
+    def put(self, key, df):
+        """Store result of query. The caller should not modify df afterwards"""
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            logger.debug(f'Result of {nbytes} bytes is too large for the query cache')
+            return
+
+        with self._lock:
+            if key in self._results:
+                self.nbytes -= self._results.pop(key)[1]
+            self._results[key] = (df, nbytes)
+            self.nbytes += nbytes
+
+            while self.nbytes > self.max_bytes:
+                _, (_, removed_nbytes) = self._results.popitem(last=False)
+                self.nbytes -= removed_nbytes
+
+    def invalidate(self, database=None):
+        """Remove all cached results, or only those of the given database"""
+        with self._lock:
+            if database is None:
+                self._results.clear()
+            else:
+                for key in [k for k in self._results if k[0] == database]:
+                    del self._results[key]
+            self.nbytes = sum(nbytes for _, nbytes in self._results.values())
+
+
+class DiskCache:
+    """
+    Cache of query results on disk, to reuse results in later sessions
+
+    Results are stored in cachedir as parquet files (if pyarrow is installed), or as pickle files otherwise. The key
+    of a result should contain everything that determines the result (like the query and a fingerprint of the
+    database), outdated results are never removed automatically. Use clear() to remove all results.
+    """
+
+    def __init__(self, cachedir):
+        self.cachedir = Path(cachedir)
+        self.cachedir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # For the counters, the cache can be used by the threads of sql_parallel
+
+        try:
+            import pyarrow
+            self.extension = '.parquet'
+        except ImportError:
+            self.extension = '.pkl'
+
+    def __repr__(self):
+        return f'DiskCache: {self.cachedir}, {self.hits} hits, {self.misses} misses'
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _filename(self, key):
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the stored result, or None if the key is not stored"""
+        filename = self._filename(key)
+        for extension in ['.parquet', '.pkl']:
+            file = self.cachedir / (filename + extension)
+            if file.exists():
+                self._count(hit=True)
+                if extension == '.parquet':
+                    return pd.read_parquet(file)
+                return pd.read_pickle(file)
+        self._count(hit=False)
+        return None
+
+    def put(self, key, df):
+        """Store result on disk"""
+        file = self.cachedir / (self._filename(key) + self.extension)
+        tempfile = file.with_name(f'{file.name}.{threading.get_ident()}.tmp')  # Unique per thread
+        if self.extension == '.parquet':
+            try:
+                df.to_parquet(tempfile)
+            except (ValueError, TypeError):
+                # Not all frames can be stored in parquet (for example with duplicate column names)
+                if tempfile.exists():
+                    tempfile.unlink()
+                file = file.with_suffix('.pkl')
+                df.to_pickle(tempfile)
+        else:
+            df.to_pickle(tempfile)
+        tempfile.replace(file)
+
+    def get_object(self, key):
+        """Return a stored object (like a graph of the network), or None if the key is not stored"""
+        file = self.cachedir / (self._filename(key) + '.pickle')
+        if not file.exists():
+            self._count(hit=False)
+            return None
+        self._count(hit=True)
+        with open(file, 'rb') as f:
+            return pickle.load(f)
+
+    def put_object(self, key, obj):
+        """Store an object on disk with pickle"""
+        file = self.cachedir / (self._filename(key) + '.pickle')
+        tempfile = file.with_name(f'{file.name}.{threading.get_ident()}.tmp')  # Unique per thread
+        with open(tempfile, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tempfile.replace(file)
+
+    def clear(self):
+        """Remove all stored results"""
+        for file in self.cachedir.glob('*'):
+            if file.suffix in ['.parquet', '.pkl', '.pickle']:
+                file.unlink()
@@ -0,0 +1,305 @@
+"""
+Translation of the SQLite dialect of the queries in pyBIVAS to other SQL engines
+
+The queries in pyBIVAS are written for SQLite, which accepts some syntax that other engines do not:
+
+- String literals in double quotes (like WHERE Name = "Lobith"). Other engines read these as identifiers.
+- Identifiers in backticks
+- Comparison with ==
+- DATE(...) to get the date of a datetime as text
+- Columns that are not grouped or aggregated in a query with GROUP BY (see _any_value_columns)
+
+SUM and AVG are computed by DuckDB with compensated summation (FSUM), which is far less sensitive to the order of the
+rows (and the number of threads) than SUM. SQLite (since version 3.43) also sums with compensation, but adds the rows
+in another order and with another variant of the algorithm, so sums of floats can still differ in the last bit.
+
+MySQL (without ANSI_QUOTES) reads double quoted identifiers (like GROUP BY "Days") as strings, these are quoted
+with backticks instead.
+
+Jurjen de Jong, Deltares
+"""
+import re
+
+_tokens = re.compile(r"""('(?:[^']|'')*')|("(?:[^"]|"")*")|(`[^`]*`)|([\w$.]+)|(\|\||==|<>|!=|<=|>=|\S)|(\s+)""")
+
+# Tokens after which a double quoted string is a value (and not an identifier)
+_literal_after = {'=', '==', '<>', '!=', '<', '>', '<=', '>=', '||', 'LIKE', 'IN', ',', '('}
+
+
+def tokenize(sql):
+    """Split sql in tokens: strings, identifiers, operators and whitespace"""
+    return [m.group(0) for m in _tokens.finditer(sql)]
+
+
+def _is_space(token):
+    return token.isspace()
+
+
+def _neighbour(tokens, i, step):
+    """Index of the previous (step=-1) or next (step=1) token that is not whitespace, or None"""
+    i += step
+    while 0 <= i < len(tokens):
+        if not _is_space(tokens[i]):
+            return i
+        i += step
+    return None
+
+
+def _is_literal(tokens, i):
+    """Whether the double quoted token i is used as a string literal"""
+    previous = _neighbour(tokens, i, -1)
+    following = _neighbour(tokens, i, 1)
+    if following is not None and tokens[following] == '||':
+        return True
+    if previous is None or tokens[previous].upper() not in _literal_after:
+        return False
+    if tokens[previous] in (',', '('):
+        # Only within a list of values, like IN ("a", "b")
+        depth = 0
+        for j in range(i - 1, -1, -1):
+            if tokens[j] == ')':
+                depth += 1
+            elif tokens[j] == '(':
+                if depth == 0:
+                    before = _neighbour(tokens, j, -1)
+                    return before is not None and tokens[before].upper() == 'IN'
+                depth -= 1
+        return False
+    return True
+
+
+def quote_literals(tokens, identifier_quote='"'):
+    """
+    Replace double quoted string literals by single quoted literals, and quote identifiers with identifier_quote
+    (double quotes in standard SQL, backticks in MySQL)
+    """
+    tokens = list(tokens)
+    for i, token in enumerate(tokens):
+        if token.startswith('"') and _is_literal(tokens, i):
+            value = token[1:-1].replace('""', '"')
+            tokens[i] = "'" + value.replace("'", "''") + "'"
+        elif token.startswith('"') or token.startswith('`'):
+            identifier = token[1:-1].replace('""', '"') if token.startswith('"') else token[1:-1]
+            tokens[i] = identifier_quote + identifier.replace(identifier_quote, 2 * identifier_quote) + identifier_quote
+        elif token == '==':
+            tokens[i] = '='
+    return tokens
+
+
+def _closing_parenthesis(tokens, i):
+    """Index of the parenthesis that closes the parenthesis at token i"""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j] == '(':
+            depth += 1
+        elif tokens[j] == ')':
+            depth -= 1
+            if depth == 0:
+                return j
+    raise ValueError('Unbalanced parentheses in sql')
+
+
+def _replace_date_function(tokens):
+    """DATE(x) to the text of the date, like in SQLite"""
+    result = []
+    i = 0
+    while i < len(tokens):
+        following = _neighbour(tokens, i, 1)
+        if tokens[i].upper() == 'DATE' and following is not None and tokens[following] == '(':
+            end = _closing_parenthesis(tokens, following)
+            argument = _replace_date_function(tokens[following + 1:end])
+            result += ['strftime(CAST(('] + argument + [") AS TIMESTAMP), '%Y-%m-%d')"]
+            i = end + 1
+        else:
+            result.append(tokens[i])
+            i += 1
+    return result
+
+
+def _main_clauses(tokens):
+    """Position of the first token of the clauses of the main query (not of subqueries)"""
+    clauses = {}
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 0 and token.upper() in ('SELECT', 'FROM', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', ';',
+                                              'UNION', 'EXCEPT', 'INTERSECT'):
+            clauses.setdefault(token.upper(), i)
+    return clauses
+
+
+def _split_expressions(tokens):
+    """Split a list of expressions (like the columns of SELECT or GROUP BY) on the commas that are not in parentheses"""
+    expressions = [[]]
+    depth = 0
+    for token in tokens:
+        if token == ',' and depth == 0:
+            expressions.append([])
+            continue
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        expressions[-1].append(token)
+    return expressions
+
+
+def _group_by_expressions(tokens, clauses):
+    """Expressions of the GROUP BY of the main query"""
+    start = _neighbour(tokens, clauses['GROUP'], 1) + 1  # After BY
+    end = min([clauses.get(c, len(tokens)) for c in ('HAVING', 'ORDER', 'LIMIT', ';', 'UNION', 'EXCEPT', 'INTERSECT')])
+    return _split_expressions(tokens[start:end])
+
+
+def _expression_key(tokens):
+    """Expression without layout, quotes of identifiers and case, to compare expressions"""
+    return ''.join(t[1:-1] if t.startswith('"') else t for t in tokens if not _is_space(t)).lower()
+
+
+_aggregates = {'SUM', 'FSUM', 'COUNT', 'AVG', 'MIN', 'MAX', 'TOTAL', 'GROUP_CONCAT', 'ANY_VALUE'}
+
+
+def _select_columns(tokens, clauses):
+    """Position of the first column of the SELECT of the main query, and the tokens of the columns"""
+    start = clauses['SELECT'] + 1
+    following = _neighbour(tokens, clauses['SELECT'], 1)
+    if tokens[following].upper() == 'DISTINCT':
+        start = following + 1
+    return start, _split_expressions(tokens[start:clauses['FROM']])
+
+
+def _replace_columns(tokens, clauses, start, columns):
+    """Replace the columns of the SELECT of the main query"""
+    select = []
+    for i, column in enumerate(columns):
+        select += ([','] if i else []) + column
+    return tokens[:start] + select + tokens[clauses['FROM']:]
+
+
+def _column_parts(column):
+    """Positions of the first and last token, the expression and the alias (or None) of a column of SELECT"""
+    words = [i for i, t in enumerate(column) if not _is_space(t)]
+    if len(words) >= 3 and column[words[-2]].upper() == 'AS':
+        return words[0], words[-1], column[words[0]:words[-2]], column[words[-1]]
+    return words[0], words[-1], column[words[0]:words[-1] + 1], None
+
+
+def _is_column_reference(text):
+    return re.fullmatch(r'[\w$]+(\.[\w$]+)?|[\w$]+\.\*|\*', text) is not None
+
+
+def _name_columns(tokens):
+    """
+    Name the expressions in the SELECT of the main query without an alias like SQLite does: with the text of the
+    expression (like "count(*)"). Other engines name them differently, and the translation changes the text.
+    """
+    clauses = _main_clauses(tokens)
+    if 'SELECT' not in clauses or 'FROM' not in clauses:
+        return tokens
+    start, columns = _select_columns(tokens, clauses)
+    for i, column in enumerate(columns):
+        if not any(not _is_space(t) for t in column):
+            continue
+        first, last, expression, alias = _column_parts(column)
+        text = ''.join(expression)
+        if alias is None and not _is_column_reference(text):
+            columns[i] = column[:last + 1] + [' AS "' + text.replace('"', '""') + '"'] + column[last + 1:]
+    return _replace_columns(tokens, clauses, start, columns)
+
+
+def _any_value_columns(tokens):
+    """
+    Wrap the columns of a query with GROUP BY that are not grouped or aggregated in ANY_VALUE(). SQLite returns the
+    value of an arbitrary row of the group for these columns, other engines do not accept them. Both give the same
+    result when the value is the same for all rows of the group (like trips.* when grouped by trips.ID).
+    """
+    clauses = _main_clauses(tokens)
+    if any(c not in clauses for c in ('SELECT', 'FROM', 'GROUP')) or \
+            any(c in clauses for c in ('UNION', 'EXCEPT', 'INTERSECT')):
+        return tokens
+
+    grouped = {_expression_key(e) for e in _group_by_expressions(tokens, clauses)}
+
+    start, columns = _select_columns(tokens, clauses)
+    for i, column in enumerate(columns):
+        if not any(not _is_space(t) for t in column):
+            continue
+        first, last, expression, alias = _column_parts(column)
+
+        aggregated = any(t.upper() in _aggregates and _neighbour(column, j, 1) is not None and
+                         column[_neighbour(column, j, 1)] == '(' for j, t in enumerate(column))
+        if aggregated or _expression_key(expression) in grouped or \
+                (alias is not None and _expression_key([alias]) in grouped):
+            continue
+
+        text = ''.join(expression).strip()
+        if text == '*' or text.endswith('.*'):
+            wrapped = f'ANY_VALUE(COLUMNS({text}))'  # Keeps the names of the columns
+        else:
+            if alias is None:
+                alias = '"' + text.split('.')[-1].strip('"') + '"'  # A column reference (see _name_columns)
+            wrapped = f'ANY_VALUE({text}) AS {alias}'
+        columns[i] = column[:first] + [wrapped] + column[last + 1:]
+    return _replace_columns(tokens, clauses, start, columns)
+
+
+def _order_by_groups(tokens):
+    """
+    Add ORDER BY on the groups to a query with a GROUP BY but without ORDER BY. SQLite returns the groups sorted,
+    and the code in pyBIVAS depends on that.
+    """
+    clauses = _main_clauses(tokens)
+    if 'GROUP' not in clauses or 'ORDER' in clauses:
+        return tokens
+
+    expressions = _group_by_expressions(tokens, clauses)
+
+    # After HAVING, but before LIMIT
+    insert = min([clauses.get(c, len(tokens)) for c in ('LIMIT', ';')])
+    while insert > 0 and _is_space(tokens[insert - 1]):
+        insert -= 1
+
+    orderby = ', '.join(''.join(e).strip() + ' NULLS FIRST' for e in expressions)
+    return tokens[:insert] + ['\nORDER BY ' + orderby] + tokens[insert:]
+
+
+def _compensated_sums(tokens):
+    """SUM(x) to FSUM(x) and AVG(x) to FSUM(x) / COUNT(x), with compensated summation"""
+    result = []
+    i = 0
+    while i < len(tokens):
+        following = _neighbour(tokens, i, 1)
+        function = tokens[i].upper()
+        if function in ('SUM', 'AVG') and following is not None and tokens[following] == '(':
+            end = _closing_parenthesis(tokens, following)
+            argument = ''.join(_compensated_sums(tokens[following + 1:end]))
+            result.append(f'FSUM({argument})' if function == 'SUM' else f'(FSUM({argument}) / COUNT({argument}))')
+            i = end + 1
+        else:
+            result.append(tokens[i])
+            i += 1
+    return result
+
+
+def to_duckdb(sql, compensated=True):
+    """
+    Translate a query in the SQLite dialect of pyBIVAS to DuckDB
+
+    compensated: compute SUM and AVG with compensated summation (see _compensated_sums). The results of sums of
+                 integers are floats then.
+    """
+    tokens = quote_literals(_name_columns(tokenize(sql)))
+    tokens = tokenize(''.join(_replace_date_function(tokens)))
+    if compensated:
+        tokens = tokenize(''.join(_compensated_sums(tokens)))
+    tokens = _any_value_columns(tokens)
+    tokens = _order_by_groups(tokens)
+    return ''.join(tokens)
+
+
+def to_mysql(sql):
+    """Translate a query in the SQLite dialect of pyBIVAS to MySQL"""
+    return ''.join(quote_literals(tokenize(sql), identifier_quote='`'))
@@ -0,0 +1,81 @@
+"""
+Memory-compact dtypes for the query results of pyBIVAS
+
+Jurjen de Jong, Deltares
+"""
+import numpy as np
+import pandas as pd
+
+# Columns with descriptions from lookup tables (like ship_types or nstr_mapping), which repeat for every trip
+lookup_columns = {
+    'Label', 'Description',
+    'ship_types_Label', 'ship_types_Description', 'ship_label', 'Scheepvaartklasse',
+    'cemt_class_Description', 'CEMT-klasse', 'CEMT_klasse',
+    'nstr_Description', 'nstr_description', 'NST2007', 'nst',
+    'appearance_types_Description', 'appear_description', 'Vorm',
+    'dangerous_goods_levels_Description', 'dangerous_description',
+    'Vaarrichting', 'Herkomst', 'Bestemming', 'Origin_Zone', 'Destination_Zone',
+}
+
+
+def compact_series(s, name=None):
+    """
+    Return s with a smaller dtype, or s itself if that is not possible without loss of information
+
+    - Lookup strings (see lookup_columns) become categoricals, when the values repeat
+    - Integers are downcast to the smallest integer type
+    - Floats become float32 when all values can be represented exactly
+    """
+    if name is None:
+        name = s.name
+
+    if name in lookup_columns and (pd.api.types.is_object_dtype(s.dtype) or pd.api.types.is_string_dtype(s.dtype)):
+        if s.nunique(dropna=True) <= len(s) / 2:
+            return s.astype('category')
+    elif pd.api.types.is_integer_dtype(s.dtype) and isinstance(s.dtype, np.dtype):
+        return pd.to_numeric(s, downcast='integer')
+    elif s.dtype == np.float64:
+        values = s.to_numpy()
+        compact = values.astype(np.float32)
+        if np.array_equal(compact.astype(np.float64), values, equal_nan=True):
+            return pd.Series(compact, index=s.index, name=s.name)
+    return s
+
+
+def compact_dtypes(df):
+    """
+    Convert all columns of df to memory-compact dtypes (see compact_series)
+
+    Note that arithmetic on downcast integer columns can overflow. Aggregations like sum are computed with 64 bit
+    integers by pandas.
+    """
+    df = df.copy(deep=False)
+    for i, column in enumerate(df.columns):
+        # By position, because query results can have duplicate column names
+        s = df.iloc[:, i]
+        compact = compact_series(s, name=column)
+        if compact is not s:
+            df.isetitem(i, compact)
+    return df
+
+
+def relabel(df, mappings):
+    """
+    Replace values in columns of df, like df.replace({column: mapping}), but also for categorical columns
+
+    mappings: dictionary with a mapping of old to new values per column. Columns not in df are ignored.
+    """
+    df = df.copy(deep=False)
+    for column, mapping in mappings.items():
+        if column not in df.columns:
+            continue
+        s = df[column]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            s = s.map(lambda value: mapping.get(value, value))
+            if isinstance(s.dtype, pd.CategoricalDtype) and not s.cat.ordered:
+                # Keep the categories sorted, so sorting gives the same order as for strings
+                s = s.cat.reorder_categories(sorted(s.cat.categories))
+            df[column] = s
+        else:
+            df[column] = s.replace(mapping)
+    return df
@@ -0,0 +1,142 @@
+"""
+Registry of the small lookup tables of BIVAS (like ship_types and nstr_mapping)
+
+The tables are read once per connection. Queries on trips only return the keys (like ShipTypeID), and the
+descriptions are added to the result in pandas, instead of sending them with every row from the database.
+
+Jurjen de Jong, Deltares
+"""
+import threading
+import numpy as np
+import pandas as pd
+
+# Per lookup table: column in trips with the key, key column of the table, and the lookup table and column that are
+# in between (cemt_class is found through ship_types)
+lookup_keys = {
+    'ship_types': ('ShipTypeID', 'ID', None),
+    'cemt_class': ('ShipTypeID', 'Id', ('ship_types', 'CEMTTypeID')),
+    'nstr_mapping': ('NstrGoodsClassification', 'GroupCode', None),
+    'nst2007_mapping': ('Nst2007GoodsClassification', 'Id', None),
+    'appearance_types': ('AppearanceTypeID', 'ID', None),
+    'dangerous_goods_levels': ('DangerousGoodsLevelID', 'ID', None),
+    'load_types': ('LoadTypeID', 'ID', None),
+}
+
+
+def _column(df, column):
+    """Column of df, with case-insensitive names like in SQL"""
+    if column in df.columns:
+        return column
+    for c in df.columns:
+        if c.lower() == column.lower():
+            return c
+    raise KeyError(column)
+
+
+class LookupTables:
+    """
+    Lookup tables of a database, indexed by their key
+
+    read_sql: function that executes a query and returns a dataframe
+    """
+
+    def __init__(self, read_sql):
+        self._read_sql = read_sql
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'LookupTables: {", ".join(self._tables) or "none loaded"}'
+
+    def __getitem__(self, table):
+        """Lookup table indexed by its key, read from the database on first use"""
+        if table not in lookup_keys:
+            raise KeyError(f'Not a lookup table: {table}. Choose from: {", ".join(lookup_keys)}')
+        with self._lock:
+            if table not in self._tables:
+                df = self._read_sql(f'SELECT * FROM {table}')
+                # Without index name, because it would be ambiguous with the key column
+                df = df.set_axis(pd.Index(df[_column(df, lookup_keys[table][1])].to_numpy()), axis=0)
+                # Like a LEFT JOIN on a unique key
+                self._tables[table] = df[~df.index.duplicated()]
+            return self._tables[table]
+
+    def invalidate(self):
+        """Read the tables again on next use, required when connecting to another database"""
+        with self._lock:
+            self._tables = {}
+
+    def columns(self, table):
+        return list(self[table].columns)
+
+    def trips_key(self, table):
+        """Column of trips with the key of the lookup table"""
+        return lookup_keys[table][0]
+
+    def _codes(self, table, keys):
+        """Position of the row in the lookup table for every key in trips (-1 if missing)"""
+        via = lookup_keys[table][2]
+        if via is not None:
+            parent, parent_column = via
+            positions = self._codes(parent, keys)
+            parent_keys = self[parent][_column(self[parent], parent_column)].to_numpy()
+            keys = np.where(positions >= 0, parent_keys[np.maximum(positions, 0)], np.nan)
+        return self[table].index.get_indexer(np.asarray(keys))
+
+    def map(self, table, column, keys, categorical=False):
+        """
+        Values of column of the lookup table for the keys in trips (like trips.ShipTypeID), like a LEFT JOIN
+
+        categorical: return a categorical instead of an array with the dtype of the column
+        """
+        positions = self._codes(table, keys)
+        values = self[table][_column(self[table], column)]
+        categories = pd.Index(values.dropna().unique())
+        value_codes = categories.get_indexer(values)
+        codes = np.where(positions >= 0, value_codes[np.maximum(positions, 0)], -1)
+        if len(values) == 0:
+            codes = np.full(len(positions), -1)
+
+        if categorical:
+            return pd.Categorical.from_codes(codes, categories)
+        s = pd.Series(categories.take(np.maximum(codes, 0)) if len(categories) else np.full(len(codes), np.nan))
+        if (codes < 0).any():
+            s = s.where(codes >= 0)
+        return s.to_numpy()
+
+    def join(self, df, columns, categorical=False):
+        """
+        Add columns of lookup tables to df, using the key columns of trips in df
+
+        columns: dictionary with per new column the lookup table and column, like
+                 {'ship_types_Label': ('ship_types', 'Label')}
+        """
+        df = df.copy(deep=False)
+        for name, (table, column) in columns.items():
+            keys = df[self.trips_key(table)].to_numpy()
+            df[name] = self.map(table, column, keys, categorical=categorical)
+        return df
+
+    def groupby_field(self, field, sort):
+        """
+        Lookup table, column and sort columns of a field like 'nstr_mapping.GroupCode' with sort columns like
+        'CEMTTypeID, ship_types.ID', or None if these are not all in one lookup table
+        """
+        columns = [c.strip() for c in [field] + sort.split(',')]
+        table = field.split('.')[0]
+        if table not in lookup_keys or any(c.count('.') > 1 or '.' in c and c.split('.')[0] != table for c in columns):
+            return None
+        try:
+            columns = [_column(self[table], c.split('.')[-1]) for c in columns]
+        except KeyError:
+            return None
+        return table, columns[0], columns[1:]
+
+    def sorted_labels(self, table, column, sort_columns, labels):
+        """Order of the labels when sorted by the sort columns, with a missing label first like in SQLite"""
+        df = self[table]
+        labels = set(labels)
+        ordered = df.sort_values(sort_columns, kind='stable')[column].drop_duplicates()
+        ordered = [label for label in ordered if label in labels]
+        missing = [label for label in labels if pd.isna(label)]
+        return missing[:1] + ordered
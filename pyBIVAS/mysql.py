@@ -0,0 +1,80 @@
+"""
+Streaming of query results from the MySQL backend of pyBIVAS
+
+pd.read_sql fetches the complete result into memory as a list of dictionaries (with the DictCursor of the connection)
+before the dataframe is created. Here the rows are streamed from the server with an unbuffered cursor, and every batch
+of rows is converted to an array per column.
+
+Jurjen de Jong, Deltares
+"""
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+
+
+def _column_array(values):
+    """
+    Array of the values of one column in a batch, with the dtype pd.read_sql would give:
+    Decimal (like the result of SUM) becomes float and integers with NULL become float with NaN
+    """
+    s = pd.Series(list(values))
+    if s.dtype == object and any(isinstance(v, Decimal) for v in values):
+        s = pd.to_numeric(s.astype(float))
+    return s.to_numpy()
+
+
+def _concatenate(arrays):
+    """Concatenate the arrays of one column, and infer the dtype again when the batches have different dtypes"""
+    if len(arrays) == 1:
+        return arrays[0]
+    if len({a.dtype for a in arrays}) == 1:
+        return np.concatenate(arrays)
+    return _column_array(np.concatenate([a.astype(object) for a in arrays]).tolist())
+
+
+def _frame(columns, arrays):
+    """Dataframe of column arrays, with support for duplicate column names"""
+    df = pd.DataFrame({i: array for i, array in enumerate(arrays)})
+    df.columns = columns
+    return df
+
+
+def _execute(connection, sql):
+    import pymysql
+
+    cursor = connection.cursor(pymysql.cursors.SSCursor)
+    cursor.execute(sql)
+    columns = [d[0] for d in cursor.description] if cursor.description else []
+    return cursor, columns
+
+
+def read_sql(connection, sql, batchsize=10000):
+    """Execute sql with an unbuffered cursor and return the result as dataframe"""
+    cursor, columns = _execute(connection, sql)
+    try:
+        arrays = [[] for _ in columns]
+        while True:
+            rows = cursor.fetchmany(batchsize)
+            if not rows:
+                break
+            for i, values in enumerate(zip(*rows)):
+                arrays[i].append(_column_array(values))
+    finally:
+        cursor.close()
+
+    empty = np.array([], dtype=object)
+    return _frame(columns, [_concatenate(a) if a else empty for a in arrays])
+
+
+def read_sql_chunks(connection, sql, chunksize=100000):
+    """Execute sql with an unbuffered cursor and yield the result as dataframes of at most chunksize rows"""
+    cursor, columns = _execute(connection, sql)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                break
+            yield _frame(columns, [_column_array(values) for values in zip(*rows)])
+    finally:
+        # Closing an unbuffered cursor reads the remaining rows, the connection can be used again afterwards
+        cursor.close()
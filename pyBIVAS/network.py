@@ -0,0 +1,185 @@
+"""
+Routing over the network of arcs and nodes of BIVAS with scipy.sparse.csgraph
+
+The network is stored as a sparse matrix of the lengths of the arcs, shortest paths are computed in compiled code.
+Like the graph of NetworkX in pyBIVAS.networkx_generate, the network is undirected and of parallel arcs between the
+same nodes only the last one is used.
+
+Jurjen de Jong, Deltares
+"""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import networkx as nx
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+
+
+class RoutingGraph:
+    """
+    Undirected graph of the arcs for shortest path queries
+
+    arcIDs, from_nodes, to_nodes, lengths: arrays with per arc the ID, node IDs and length
+    """
+
+    def __init__(self, arcIDs, from_nodes, to_nodes, lengths):
+        arcIDs = np.asarray(arcIDs)
+        if len(arcIDs) and np.iinfo(np.int32).min <= arcIDs.min() and arcIDs.max() <= np.iinfo(np.int32).max:
+            arcIDs = arcIDs.astype(np.int32)
+        from_nodes = np.asarray(from_nodes)
+        to_nodes = np.asarray(to_nodes)
+        lengths = np.asarray(lengths, dtype=np.float64)
+
+        self.nodeIDs, positions = np.unique(np.concatenate([from_nodes, to_nodes]), return_inverse=True)
+        i, j = positions[:len(from_nodes)], positions[len(from_nodes):]
+
+        # Of parallel arcs (in any direction) the last one is used, like in NetworkX
+        lower, upper = np.minimum(i, j), np.maximum(i, j)
+        n = len(self.nodeIDs)
+        _, last = np.unique((lower * n + upper)[::-1], return_index=True)
+        last = len(lower) - 1 - last
+        last = last[lower[last] != upper[last]]  # Loops are never part of a shortest path
+
+        rows = np.concatenate([lower[last], upper[last]])
+        columns = np.concatenate([upper[last], lower[last]])
+        self.lengths = sparse.csr_matrix((np.concatenate([lengths[last]] * 2), (rows, columns)), shape=(n, n))
+        self.arcs = sparse.csr_matrix((np.concatenate([arcIDs[last]] * 2), (rows, columns)), shape=(n, n))
+
+    def __repr__(self):
+        return f'RoutingGraph: {len(self.nodeIDs)} nodes, {self.lengths.nnz // 2} arcs'
+
+    def positions(self, nodeIDs):
+        """Positions of the nodes in the matrices"""
+        nodeIDs = np.atleast_1d(nodeIDs)
+        positions = np.searchsorted(self.nodeIDs, nodeIDs)
+        positions = np.minimum(positions, len(self.nodeIDs) - 1)
+        missing = self.nodeIDs[positions] != nodeIDs
+        if missing.any():
+            raise nx.NodeNotFound(f'Node {nodeIDs[missing][0]} is not in the network')
+        return positions
+
+    def shortest_paths(self, sources):
+        """Distances and predecessors from each of the source nodes to all nodes (one row per source)"""
+        distances, predecessors = dijkstra(self.lengths, directed=False, indices=self.positions(sources),
+                                           return_predecessors=True)
+        return distances, predecessors
+
+    def _path(self, predecessors, source, target):
+        """Positions of the nodes on the path from source to target, using a row of predecessors"""
+        path = [target]
+        while path[-1] != source:
+            previous = predecessors[path[-1]]
+            if previous < 0:
+                raise nx.NetworkXNoPath(f'No path between {self.nodeIDs[source]} and {self.nodeIDs[target]}')
+            path.append(previous)
+        return np.array(path[::-1])
+
+    def _arcs_on_path(self, path):
+        """IDs of the arcs between the nodes on the path"""
+        if len(path) < 2:
+            return np.array([], dtype=self.arcs.dtype)
+        return np.asarray(self.arcs[path[:-1], path[1:]]).ravel()
+
+    def path(self, source, target):
+        """Node IDs and arc IDs of the shortest path between two nodes"""
+        source, target = self.positions([source, target])
+        _, predecessors = dijkstra(self.lengths, directed=False, indices=source, return_predecessors=True)
+        path = self._path(predecessors, source, target)
+        return self.nodeIDs[path], self._arcs_on_path(path)
+
+    def paths(self, pairs):
+        """
+        Node IDs and arc IDs of the shortest paths between pairs of nodes, with one search per distinct source
+
+        pairs: list of (source, target)
+        """
+        pairs = np.asarray(pairs).reshape(-1, 2)
+        sources, rows = np.unique(pairs[:, 0], return_inverse=True)
+        _, predecessors = self.shortest_paths(sources)
+        source_positions = self.positions(pairs[:, 0])
+        target_positions = self.positions(pairs[:, 1])
+
+        result = []
+        for row, source, target in zip(rows.ravel(), source_positions, target_positions):
+            path = self._path(predecessors[row], source, target)
+            result.append((self.nodeIDs[path], self._arcs_on_path(path)))
+        return result
+
+    def _arc_paths_of_sources(self, sources, targets):
+        """
+        Arc IDs and length of the paths from each source to its targets (an array of target positions per source),
+        with one search for all sources. Paths that do not exist are empty, with an infinite length.
+        """
+        distances, predecessors = dijkstra(self.lengths, directed=False, indices=sources, return_predecessors=True)
+        paths = []
+        lengths = []
+        for row, (source, source_targets) in enumerate(zip(sources, targets)):
+            for target in source_targets:
+                lengths.append(distances[row, target])
+                if np.isinf(lengths[-1]):
+                    paths.append(np.array([target]))
+                else:
+                    paths.append(self._path(predecessors[row], source, target))
+
+        # The arcs of all paths with one lookup in the sparse matrix
+        counts = np.array([len(path) - 1 for path in paths], dtype=np.int64)
+        if counts.sum() == 0:
+            return [(np.array([], dtype=self.arcs.dtype), length) for length in lengths]
+        a = np.concatenate([path[:-1] for path in paths])
+        b = np.concatenate([path[1:] for path in paths])
+        arcIDs = np.asarray(self.arcs[a, b]).ravel().astype(self.arcs.dtype)
+        return list(zip(np.split(arcIDs, np.cumsum(counts)[:-1]), lengths))
+
+    def arc_paths(self, pairs, max_workers=1, sources_per_task=64):
+        """
+        Shortest paths between many pairs of nodes, as arc IDs in one compact array
+
+        The pairs are grouped by source, with one search per distinct source. With max_workers > 1 the searches are
+        spread over a pool of processes, in tasks of sources_per_task sources.
+
+        pairs: list or array of (source, target)
+
+        Returns offsets, arcIDs and lengths: the arcs of pair i are arcIDs[offsets[i]:offsets[i + 1]]. Pairs without
+        a path have no arcs and an infinite length.
+        """
+        pairs = np.asarray(pairs).reshape(-1, 2)
+        source_positions = self.positions(pairs[:, 0]) if len(pairs) else np.array([], dtype=int)
+        target_positions = self.positions(pairs[:, 1]) if len(pairs) else np.array([], dtype=int)
+
+        # Indices of the pairs per source
+        order = np.argsort(source_positions, kind='stable')
+        sources, starts = np.unique(source_positions[order], return_index=True)
+        groups = np.split(order, starts[1:]) if len(order) else []
+
+        tasks = []
+        for start in range(0, len(sources), sources_per_task):
+            task_groups = groups[start:start + sources_per_task]
+            tasks.append((sources[start:start + sources_per_task], [target_positions[g] for g in task_groups]))
+
+        if max_workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(self,)) as pool:
+                results = list(pool.map(_worker_arc_paths, tasks))
+        else:
+            results = [self._arc_paths_of_sources(*task) for task in tasks]
+
+        paths = [None] * len(pairs)
+        for indices, path in zip(np.concatenate(groups) if groups else [], (p for r in results for p in r)):
+            paths[indices] = path
+
+        lengths = np.array([p[1] for p in paths], dtype=np.float64)
+        offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+        np.cumsum([len(p[0]) for p in paths], out=offsets[1:])
+        arcIDs = np.concatenate([p[0] for p in paths]) if paths else np.array([], dtype=self.arcs.dtype)
+        return offsets, arcIDs, lengths
+
+
+# Graph of the processes of RoutingGraph.arc_paths, sent once per process
+_worker_graph = None
+
+
+def _init_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _worker_arc_paths(task):
+    return _worker_graph._arc_paths_of_sources(*task)
@@ -0,0 +1,71 @@
+"""
+Origin-destination matrices of the trips between the zones of a zone definition (like BasGoed 2018)
+
+The trips are summed per origin and destination zone (and optionally per category, like the day or NSTR class) once.
+This sparse table is kept, and dense or sparse zone x zone matrices are created from it on request.
+
+Jurjen de Jong, Deltares
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class ODMatrix:
+    """
+    Sums of measures (like the number of trips) per origin zone, destination zone and category
+
+    zones: names of the zones, in the order of the rows and columns of the matrices
+    origins, destinations: arrays with per row of values the position of the zones
+    values: dataframe with the measures per row
+    categories, codes: labels of the categories (like days) and the position of the category per row, or None
+    """
+
+    def __init__(self, zones, origins, destinations, values, categories=None, codes=None):
+        self.zones = pd.Index(zones)
+        self.origins = np.asarray(origins)
+        self.destinations = np.asarray(destinations)
+        self.values = values.reset_index(drop=True)
+        self.categories = pd.Index(categories) if categories is not None else None
+        self.codes = np.asarray(codes) if codes is not None else None
+
+    def __repr__(self):
+        categories = f', {len(self.categories)} categories' if self.categories is not None else ''
+        return f'ODMatrix: {len(self.zones)} zones{categories}, measures: {", ".join(self.measures)}'
+
+    @property
+    def measures(self):
+        return list(self.values.columns)
+
+    def _rows(self, category):
+        """Rows of the category, or all rows"""
+        if category is None:
+            return np.ones(len(self.values), dtype=bool)
+        if self.categories is None:
+            raise ValueError('The matrix has no categories')
+        return self.codes == self.categories.get_loc(category)
+
+    def sparse(self, measure, category=None):
+        """Zone x zone matrix of the measure (summed over all categories, or of one category) as csr_matrix"""
+        rows = self._rows(category)
+        n = len(self.zones)
+        return sparse.csr_matrix((self.values[measure].to_numpy(dtype=np.float64)[rows],
+                                  (self.origins[rows], self.destinations[rows])), shape=(n, n))
+
+    def dense(self, measure, category=None):
+        """Zone x zone array of the measure (see sparse)"""
+        return self.sparse(measure, category).toarray()
+
+    def frame(self, measure, category=None):
+        """Zone x zone dataframe of the measure, with the origins as index and the destinations as columns"""
+        return pd.DataFrame(self.dense(measure, category), index=self.zones, columns=self.zones)
+
+    def cube(self, measure):
+        """Category x zone x zone array of the measure"""
+        if self.categories is None:
+            raise ValueError('The matrix has no categories')
+        n = len(self.zones)
+        index = (self.codes * n + self.origins) * n + self.destinations
+        cube = np.bincount(index, weights=self.values[measure].to_numpy(dtype=np.float64),
+                           minlength=len(self.categories) * n * n)
+        return cube.reshape(len(self.categories), n, n)
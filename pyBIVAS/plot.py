@@ -3,6 +3,7 @@ This function contains generic plotting functions to go with the module pyBIVAS
 """
 
 from pyBIVAS.SQL import pyBIVAS
+from pyBIVAS.dtypes import relabel
 
 import matplotlib.pyplot as plt
 from pathlib import Path
@@ -64,37 +65,62 @@ class pyBIVAS_plot(pyBIVAS):
         self.outputdir = Path('.')
 
 
+    def _arcs_tripdetails_per_arc(self, arcIDs, **kwargs):
+        """
+        Request the trip details of all arcs in one query, and split the result per arc
+        """
+        df = self.arcs_tripdetails(arcIDs, **kwargs)
+        arcs_in_result = set(df.index.get_level_values('ArcID'))
+        trips_on_arcs = {}
+        for arcID in arcIDs:
+            if arcID in arcs_in_result:
+                trips_on_arcs[arcID] = df.xs(arcID, level='ArcID')
+            else:
+                trips_on_arcs[arcID] = df.iloc[:0].droplevel('ArcID')
+        return trips_on_arcs
+
     def plot_Trips_Arc_all(self):
+        trips_on_arcs = self._arcs_tripdetails_per_arc(list(self.Arcs.values()))
         for label, arcID in self.Arcs.items():
-            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vaarkosten (EUR)', stacking='NSTR')
-            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vracht (ton)', stacking='NSTR')
-            self.plot_Trips_Arc(arcID, label, y_unit='Aantal Vaarbewegingen (-)', stacking='NSTR')
-
-            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vaarkosten (EUR)', stacking='appearance_types_Description')
-            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vracht (ton)', stacking='appearance_types_Description')
+            kwargs = {'trips_on_arc': trips_on_arcs[arcID]}
+            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vaarkosten (EUR)', stacking='NSTR', **kwargs)
+            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vracht (ton)', stacking='NSTR', **kwargs)
+            self.plot_Trips_Arc(arcID, label, y_unit='Aantal Vaarbewegingen (-)', stacking='NSTR', **kwargs)
+
+            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vaarkosten (EUR)', stacking='appearance_types_Description',
+                                **kwargs)
+            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vracht (ton)', stacking='appearance_types_Description',
+                                **kwargs)
             self.plot_Trips_Arc(arcID, label, y_unit='Aantal Vaarbewegingen (-)',
-                                stacking='appearance_types_Description')
+                                stacking='appearance_types_Description', **kwargs)
 
-            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vaarkosten (EUR)', stacking='cemt_class_Description')
-            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vracht (ton)', stacking='cemt_class_Description')
-            self.plot_Trips_Arc(arcID, label, y_unit='Aantal Vaarbewegingen (-)', stacking='cemt_class_Description')
+            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vaarkosten (EUR)', stacking='cemt_class_Description',
+                                **kwargs)
+            self.plot_Trips_Arc(arcID, label, y_unit='Totale Vracht (ton)', stacking='cemt_class_Description',
+                                **kwargs)
+            self.plot_Trips_Arc(arcID, label, y_unit='Aantal Vaarbewegingen (-)', stacking='cemt_class_Description',
+                                **kwargs)
 
             # Individuele klassen niet te onderscheiden, dus deze figuren voegen niets toe
             # self.plot_Trips_Arc(arcID, label, y_unit='Totale Vaarkosten (EUR)', stacking='ship_types_Label')
             # self.plot_Trips_Arc(arcID, label, y_unit='Totale Vracht (ton)', stacking='ship_types_Label')
             # self.plot_Trips_Arc(arcID, label, y_unit='Aantal Vaarbewegingen (-)', stacking='ship_types_Label')
 
-    def plot_Trips_Arc(self, arcID, label, y_unit='Totale Vaarkosten (EUR)', stacking='NSTR'):
+    def plot_Trips_Arc(self, arcID, label, y_unit='Totale Vaarkosten (EUR)', stacking='NSTR', trips_on_arc=None):
         """
         This function creates multiple barplots of trips passing a given arc as as function on the draft
 
+        :param trips_on_arc: Result of arc_tripdetails(arcID), requested from the database if not given
         :return:
         """
         figdir = self.outputdir / 'figures_Histogram_Diepgang'
         if not figdir.exists():
             figdir.mkdir()
 
-        trips_on_arc = self.arc_tripdetails(arcID)
+        if trips_on_arc is None:
+            trips_on_arc = self.arc_tripdetails(arcID)
+        else:
+            trips_on_arc = trips_on_arc.copy()
 
         # Create pivot table
         bins = np.arange(0, 5, 0.5)
@@ -222,8 +248,9 @@ class pyBIVAS_plot(pyBIVAS):
 
         # SQL kosten en trips voor alle trips die langs een opgegeven Arc komen
         dfArcs = {}
+        trips_on_arcs = self._arcs_tripdetails_per_arc(list(self.Arcs.values()), group_by='NSTR')
         for ArcName, ArcID in self.Arcs.items():
-            df = self.arc_tripdetails(ArcID, group_by='NSTR')
+            df = trips_on_arcs[ArcID]
             dfArcs[ArcName] = df[["Totale Vaarkosten (EUR)", "Totale Vracht (ton)", "Aantal Vaarbewegingen (-)"]]
 
         # Reset settings
@@ -298,7 +325,7 @@ class pyBIVAS_plot(pyBIVAS):
         ORDER BY TrafficScenarioID
         """
         df = self.sql(sql)
-        df = df.replace({'NSTR': self.NSTR_shortnames})
+        df = relabel(df, {'NSTR': self.NSTR_shortnames})
 
         trafficScenarios_table = self.trafficscenario_numberoftrips()
         trafficScenarios_names = trafficScenarios_table['Description'].loc[trafficScenarios]
@@ -334,15 +361,19 @@ class pyBIVAS_plot(pyBIVAS):
         plt.close()
 
     def plot_Beladingsgraad_all(self, **kwargs):
+        trips_on_arcs = self._arcs_tripdetails_per_arc(list(self.Arcs.values()))
         for label, arcID in self.Arcs.items():
-            self.plot_Beladingsgraad(arcID, label, **kwargs)
+            self.plot_Beladingsgraad(arcID, label, trips_on_arc=trips_on_arcs[arcID], **kwargs)
 
-    def plot_Beladingsgraad(self, arcID, label, limit_to_1=True):
+    def plot_Beladingsgraad(self, arcID, label, limit_to_1=True, trips_on_arc=None):
         figdir = self.outputdir / 'figures_Beladingsgraad'
         if not figdir.exists():
             figdir.mkdir()
 
-        df = self.arc_tripdetails(arcID)
+        if trips_on_arc is None:
+            df = self.arc_tripdetails(arcID)
+        else:
+            df = trips_on_arc.copy()
         df['Beladingsgraad'] = df['TotalWeight__t'] / df['LoadCapacity__t']
         if limit_to_1:
             df['Beladingsgraad'].loc[df['Beladingsgraad'] > 1] = 1
@@ -440,10 +471,11 @@ class pyBIVAS_plot(pyBIVAS):
         plt.savefig(figdir / f'Tijdserie_shipping_types_{label}_normalised.png', dpi=300, bbox_inches='tight')
 
     def plot_Vlootopbouw_all(self):
+        trips_on_arcs = self._arcs_tripdetails_per_arc(list(self.Arcs.values()))
         for label, arcID in self.Arcs.items():
-            self.plot_Vlootopbouw(arcID, label)
+            self.plot_Vlootopbouw(arcID, label, trips_on_arc=trips_on_arcs[arcID])
 
-    def plot_Vlootopbouw(self, arcID, label, userealtrips=True):
+    def plot_Vlootopbouw(self, arcID, label, userealtrips=True, trips_on_arc=None):
         """
 
 
@@ -451,6 +483,7 @@ class pyBIVAS_plot(pyBIVAS):
         :param arcID:
         :param label:
         :param userealtrips: Either use the number of tracks in the database (so real trips) or the NumberOfTrips of the BIVAS result
+        :param trips_on_arc: Result of arc_tripdetails(arcID), requested from the database if not given
         :return:
         """
 
@@ -458,7 +491,10 @@ class pyBIVAS_plot(pyBIVAS):
         if not figdir.exists():
             figdir.mkdir()
 
-        df = self.arc_tripdetails(arcID)
+        if trips_on_arc is None:
+            df = self.arc_tripdetails(arcID)
+        else:
+            df = trips_on_arc.copy()
         ship_types = self.shiptypes()
 
         ordered_ship_types, data_merge_small_ships = self.remove_small_ships(df)
@@ -507,9 +543,10 @@ class IVS90_analyse(pyBIVAS_plot):
                  databasefile=None,
                  traffic_scenario_ids=None,
                  traffic_scenario_labels=[2011, 2013, 2014, 2016, 2017, 2018],
-                 reference_trip_ids=[1, 2, 3, 4, 5, 6]
+                 reference_trip_ids=[1, 2, 3, 4, 5, 6],
+                 profile='default'
                  ):
-        super().__init__(databasefile=databasefile)
+        super().__init__(databasefile=databasefile, profile=profile)
 
         sql = """SELECT * FROM traffic_scenarios"""
         traffic_scenarios = self.sql(sql)
@@ -536,6 +573,27 @@ class IVS90_analyse(pyBIVAS_plot):
         self.cemt_order = self.CEMTclass()['Description']
         self.ship_types_order = self.shiptypes()['Description']
 
+        # Timeseries of all counting points and years per pivot (see countingpoint_timeseries_year)
+        self._countingpoints_timeseries = {}
+
+        # Timeseries and statistics of all nodes per traffic scenario (see node_timeseries_year)
+        self._nodes_timeseries = {}
+        self._nodes_statistics = {}
+
+    def countingpoint_timeseries_year(self, telpunt, jaar, pivot='Vaarrichting', param="Aantal Vaarbewegingen (-)"):
+        """
+        Timeseries of a counting point in a year (see countingpoint_timeseries). The timeseries of all counting points
+        and years are queried at once on first use of a pivot.
+        """
+        if pivot not in self._countingpoints_timeseries:
+            scenarios = list(zip(self.traffic_scenarios['reference_trips_sets_id'], self.traffic_scenarios['ID']))
+            self._countingpoints_timeseries[pivot] = self.countingpoints_timeseries(pivot=pivot, scenarios=scenarios)
+
+        referenceSetId = self.traffic_scenarios.loc[jaar, 'reference_trips_sets_id']
+        trafficScenarioId = self.traffic_scenarios.loc[jaar, 'ID']
+        return self.countingpoints_timeseries_slice(self._countingpoints_timeseries[pivot], telpunt, referenceSetId,
+                                                    trafficScenarioId, pivot=pivot, param=param)
+
 
     # Jaarlijkse variatie
     def plot_countingpoint_timeseries(self, telpunt='Prins Bernhardsluis', jaar=2018, param="Aantal Vaarbewegingen (-)"):
@@ -545,13 +603,8 @@ class IVS90_analyse(pyBIVAS_plot):
 
         logger.info(f'Plotting CountingPointsForYear voor telpunt: {telpunt}, jaar: {jaar}')
 
-        # Set variables
-        referenceSetId = self.traffic_scenarios.loc[jaar, 'reference_trips_sets_id']
-        trafficScenarioId = self.traffic_scenarios.loc[jaar, 'ID']
-        countingPointName = telpunt
-
         # Query data
-        df = self.countingpoint_timeseries(countingPointName, referenceSetId, trafficScenarioId, param=param)
+        df = self.countingpoint_timeseries_year(telpunt, jaar, param=param)
         if df is None:
             return 'No data'
 
@@ -601,14 +654,8 @@ class IVS90_analyse(pyBIVAS_plot):
 
         logger.info(f'Plotting CountingPointsForYear voor telpunt: {telpunt}, jaar: {jaar} ({param}, {opdeling}, {relatief})')
 
-        # Set variables
-        referenceSetId = self.traffic_scenarios.loc[jaar, 'reference_trips_sets_id']
-        trafficScenarioId = self.traffic_scenarios.loc[jaar, 'ID']
-        countingPointName = telpunt
-
         # Query data
-        df = self.countingpoint_timeseries(countingPointName, referenceSetId, trafficScenarioId, param=param,
-                                           pivot=opdeling)
+        df = self.countingpoint_timeseries_year(telpunt, jaar, pivot=opdeling, param=param)
         if df is None:
             return 'No data'
 
@@ -712,13 +759,8 @@ class IVS90_analyse(pyBIVAS_plot):
 
         dfs = {}
         for jaar in self.traffic_scenarios.index:
-            # Set variables
-            referenceSetId = self.traffic_scenarios.loc[jaar, 'reference_trips_sets_id']
-            trafficScenarioId = self.traffic_scenarios.loc[jaar, 'ID']
-            countingPointName = telpunt
-
             # Query data
-            df = self.countingpoint_timeseries(countingPointName, referenceSetId, trafficScenarioId, pivot=None)
+            df = self.countingpoint_timeseries_year(telpunt, jaar, pivot=None)
 
             if not len(df):
                 continue
@@ -799,6 +841,28 @@ class IVS90_analyse(pyBIVAS_plot):
 
 
 
+    def node_timeseries_year(self, NodeID, jaar):
+        """
+        Timeseries of a node in a year (see node_timeseries). The timeseries of all nodes are queried at once on
+        first use of a year.
+        """
+        trafficScenarioId = self.traffic_scenarios.loc[jaar, 'ID']
+        if trafficScenarioId not in self._nodes_timeseries:
+            self._nodes_timeseries[trafficScenarioId] = self.nodes_timeseries(trafficScenarioId)
+        return self.nodes_timeseries_slice(self._nodes_timeseries[trafficScenarioId], NodeID)
+
+    def node_statistics_year(self, NodeID, jaar, groupby_field, groupby_sort, directions):
+        """
+        Statistics of a node in a year (see node_statistics). The statistics of all nodes are queried at once on
+        first use of a year and grouping.
+        """
+        trafficScenarioId = self.traffic_scenarios.loc[jaar, 'ID']
+        key = (trafficScenarioId, groupby_field, groupby_sort, tuple(directions))
+        if key not in self._nodes_statistics:
+            self._nodes_statistics[key] = self.nodes_statistics(trafficScenarioId, groupby_field, groupby_sort,
+                                                                directions)
+        return self.nodes_statistics_slice(self._nodes_statistics[key], NodeID)
+
     def plot_node_timeseries(self, jaar=2011, NodeID=21639, label=None):
         """
         Create timeserie of the number of ships departing and arriving at given node in given year.
@@ -814,10 +878,8 @@ class IVS90_analyse(pyBIVAS_plot):
 
         logger.info(f'Plotting timeseries_node voor node: {NodeID}, jaar: {jaar}')
 
-        trafficScenarioId = self.traffic_scenarios.loc[jaar, 'ID']
-
         # Query data
-        df = self.node_timeseries(NodeID, trafficScenarioId)
+        df = self.node_timeseries_year(NodeID, jaar)
         if df is None:
             return 'No data'
 
@@ -914,8 +976,8 @@ class IVS90_analyse(pyBIVAS_plot):
         trafficScenarioId = self.traffic_scenarios.loc[jaar, 'ID']
 
         if NodeID is not None:
-            df = self.node_statistics(NodeID=NodeID, trafficScenarioId=trafficScenarioId, groupby_field=groupby_field,
-                                  groupby_sort=groupby_sort, directions=directions)
+            df = self.node_statistics_year(NodeID, jaar, groupby_field=groupby_field, groupby_sort=groupby_sort,
+                                           directions=directions)
 
             if not label:
                 label = self.node_label(NodeID)
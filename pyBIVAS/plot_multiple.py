@@ -3,6 +3,7 @@ import pandas as pd
 import geopandas
 import gc
 import random
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib.pyplot as plt
 from pathlib import Path
 import logging
@@ -14,24 +15,55 @@ logger.setLevel(logging.INFO)
 class pyBIVAS_plot_compare:
     Arcs = pyBIVAS.Arcs
 
-    def __init__(self, BIVAS_simulations: dict, scenarioID=None):
+    def __init__(self, BIVAS_simulations: dict, scenarioID=None, profile='default', max_workers=None):
         """
         scenarioID: integer if identical for all simulations. Dictionary if different ID per simulation.
                     Leave empty for auto assign scenario.
+        profile: profile of the connections to the databases, see pyBIVAS.connection_profiles
+        max_workers: number of databases that are queried at the same time (see map_connections). By default all.
         """
         self.BIVAS_simulations = BIVAS_simulations
         self.reference = list(BIVAS_simulations.keys())[0]
         self.scenarioID = scenarioID
+        self.profile = profile
+        self.max_workers = max_workers
 
         # Empty inits
         self.outputdir = Path('.')
         self.BIVAS_connection = {}
 
+    def _map(self, function, items):
+        """Apply function to the values of the dictionary items in a pool of threads, and return a dictionary"""
+        items = dict(items)
+        max_workers = self.max_workers or max(len(items), 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = pool.map(function, items.keys(), items.values())
+            return dict(zip(items.keys(), results))
+
+    def map_connections(self, function):
+        """
+        Apply function(BIVAS) to the connection of every simulation, with the databases queried at the same time.
+        Every thread uses a connection of its own (see pyBIVAS.thread_connection).
+
+        Returns a dictionary with the result per simulation
+        """
+        return self._map_connections(lambda name, BIVAS: function(BIVAS))
+
+    def _map_connections(self, function):
+        """Apply function(name, BIVAS) to the connection of every simulation (see map_connections)"""
+        def apply(name, BIVAS):
+            with BIVAS.thread_connection():
+                return function(name, BIVAS)
+
+        return self._map(apply, self.BIVAS_connection)
+
     def connect_all(self):
         for name, path in self.BIVAS_simulations.items():
-            BIVAS = pyBIVAS()
+            BIVAS = pyBIVAS(profile=self.profile)
             BIVAS.connectToSQLiteDatabase(path)
+            self.BIVAS_connection[name] = BIVAS
 
+        def set_scenario(name, BIVAS):
             # Connect to scenario
             if self.scenarioID:
                 if isinstance(self.scenarioID, int):
@@ -41,14 +73,15 @@ class pyBIVAS_plot_compare:
             else:
                 BIVAS.set_scenario()
 
-            self.BIVAS_connection[name] = BIVAS
+        self._map_connections(set_scenario)
 
     def plot_tijdseries(self, label, arcID, includeDischarge=False):
 
-        tripsPerDay = {}
-        for name, BIVAS in self.BIVAS_connection.items():
+        def getTripsPerDay(BIVAS):
             d = BIVAS.arc_tripdetails(arcID)
-            tripsPerDay[name] = d['NumberOfTrips'].groupby(d['DateTime']).sum()
+            return d['NumberOfTrips'].groupby(d['DateTime']).sum()
+
+        tripsPerDay = self.map_connections(getTripsPerDay)
 
         tripsPerDay = pd.concat(tripsPerDay, axis=1)
 
@@ -64,9 +97,7 @@ class pyBIVAS_plot_compare:
                 df = df.set_index('SeasonID')
                 return df['RateOfFlow__m3_s']
 
-            Q = {}
-            for name, BIVAS in self.BIVAS_connection.items():
-                Q[name] = getDischargeLobith(BIVAS)
+            Q = self.map_connections(getDischargeLobith)
             Q = pd.concat(Q, axis=1)
             Q = Q.iloc[:tripsPerDay.shape[0]]
             Q.index = tripsPerDay.index
@@ -116,9 +147,7 @@ class pyBIVAS_plot_compare:
         TODO: include option to only show one simulation, or more than 2
         """
 
-        for name, BIVAS in self.BIVAS_connection.items():
-            BIVAS.network_arcs()
-            BIVAS.network_nodes()
+        self.map_connections(lambda BIVAS: (BIVAS.network_arcs(), BIVAS.network_nodes()))
 
         BIVAS = self.BIVAS_connection[self.reference]
 
@@ -154,9 +183,8 @@ class pyBIVAS_plot_compare:
             all_routes = all_routes['TripID'].values
         elif routes == 'largestIncreaseDate':
             # Get all big trips on most changing day
-            routeStats = {}
-            for name, BIVAS in self.BIVAS_connection.items():
-                routeStats[name] = BIVAS.routestatistics_timeseries()["Totale Vaarkosten (EUR)"]
+            routeStats = self.map_connections(
+                lambda BIVAS: BIVAS.routestatistics_timeseries()["Totale Vaarkosten (EUR)"])
             routeStats = pd.concat(routeStats, axis=1)
             routeStatsDiff = routeStats.diff(axis=1).iloc[:, -1].abs()
 
@@ -172,21 +200,13 @@ class pyBIVAS_plot_compare:
             all_routes = self.BIVAS_connection[self.reference].sql(sql)
             all_routes = all_routes['TripID'].values
         elif routes == 'largestIncrease':
-            # Get largest changing trips
-            routeStats = {}
-            for name, BIVAS in self.BIVAS_connection.items():
-                sql = """
-                SELECT TripID, {1}
-                FROM route_statistics_{0} AS route_statistics
-                LEFT JOIN trips_{0} AS trips ON route_statistics.TripID = trips.ID
-                GROUP BY TripID
-                """.format(BIVAS.scenarioID, BIVAS.compute_route_statistics)
-                routeStats[name] = BIVAS.sql(sql)[["TripID", "Totale Vaarkosten (EUR)"]].set_index('TripID')
-
-            routeStats = pd.concat(routeStats, axis=1)
-            routeStatsDiff = routeStats.diff(axis=1).iloc[:, -1].abs()
-            all_routes = routeStatsDiff.sort_values(axis=0, ascending=False)
-            all_routes = all_routes.index.values
+            # Get largest changing trips between the last two simulations, computed in the database
+            names = list(self.BIVAS_connection.keys())
+            diff = self.BIVAS_connection[names[-2]].scenario_diff({names[-1]: self.BIVAS_connection[names[-1]]},
+                                                                  sort_by='Totale Vaarkosten (EUR)',
+                                                                  limit=None if shuffle else limit,
+                                                                  route_change=False)
+            all_routes = diff.index.get_level_values('TripID').values
 
         else:
             if isinstance(routes, list):
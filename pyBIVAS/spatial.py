@@ -0,0 +1,93 @@
+"""
+Spatial index over the geometries of the arcs or nodes of BIVAS with shapely.STRtree
+
+Arcs and nodes can be found by location (nearest to a coordinate, within a polygon), without a scan of the whole
+network. Coordinates are in the coordinate system of the nodes in the database.
+
+Jurjen de Jong, Deltares
+"""
+import numpy as np
+import pandas as pd
+import shapely
+
+
+class SpatialIndex:
+    """
+    Spatial index of geometries with an ID (like the ArcID or NodeID)
+
+    IDs, geometries: arrays with per arc or node the ID and the (shapely) geometry
+    """
+
+    def __init__(self, IDs, geometries):
+        self.IDs = np.asarray(IDs)
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __repr__(self):
+        return f'SpatialIndex: {len(self.IDs)} geometries'
+
+    @staticmethod
+    def _points(x, y):
+        return shapely.points(np.atleast_1d(np.asarray(x, dtype=float)), np.atleast_1d(np.asarray(y, dtype=float)))
+
+    def _nearest(self, points, max_distance=None):
+        """Position of the nearest geometry for each point (-1 if none within max_distance) and the distance"""
+        (rows, positions), distances = self.tree.query_nearest(points, max_distance=max_distance,
+                                                               return_distance=True, all_matches=False)
+        nearest = np.full(len(points), -1, dtype=np.int64)
+        distance = np.full(len(points), np.inf)
+        nearest[rows] = positions
+        distance[rows] = distances
+        return nearest, distance
+
+    def nearest(self, x, y, max_distance=None):
+        """
+        ID of the nearest geometry to the point (x, y) and its distance
+
+        Returns None and an infinite distance when there is no geometry within max_distance
+        """
+        nearest, distance = self._nearest(self._points(x, y), max_distance=max_distance)
+        if nearest[0] < 0:
+            return None, np.inf
+        return self.IDs[nearest[0]], distance[0]
+
+    def snap(self, x, y, max_distance=None):
+        """
+        Snap many points (like positions from AIS) to the nearest geometry, with one query on the index
+
+        x, y: arrays with the coordinates of the points
+
+        Returns a dataframe with per point the ID of the nearest geometry, the distance and the coordinates of the
+        nearest location on that geometry. Points without a geometry within max_distance get no ID (NaN) and an
+        infinite distance.
+        """
+        points = self._points(x, y)
+        nearest, distance = self._nearest(points, max_distance=max_distance)
+        found = nearest >= 0
+
+        snapped = np.full((len(points), 2), np.nan)
+        if found.any():
+            lines = shapely.shortest_line(self.geometries[nearest[found]], points[found])
+            snapped[found] = shapely.get_coordinates(shapely.get_point(lines, 0))
+
+        IDs = pd.Series(self.IDs[np.maximum(nearest, 0)] if len(self.IDs) else np.zeros(len(points)))
+        return pd.DataFrame({
+            'ID': IDs.where(found),
+            'Distance': distance,
+            'X': snapped[:, 0],
+            'Y': snapped[:, 1],
+        })
+
+    def within(self, geometry, predicate='intersects'):
+        """
+        IDs of the geometries in a polygon (or any other shapely geometry), sorted
+
+        predicate: spatial predicate of shapely, like 'intersects' (partly inside) or 'contains' (completely inside)
+        """
+        positions = self.tree.query(geometry, predicate=predicate)
+        return np.sort(self.IDs[positions])
+
+    def within_distance(self, x, y, distance):
+        """IDs of the geometries within distance of the point (x, y), sorted"""
+        positions = self.tree.query(shapely.Point(x, y), predicate='dwithin', distance=distance)
+        return np.sort(self.IDs[positions])
@@ -5,6 +5,7 @@
 
 import unittest
 from pathlib import Path
+import pandas as pd
 from pyBIVAS.SQL import pyBIVAS
 
 
@@ -132,6 +133,10 @@ class test_pyBIVAS(unittest.TestCase):
         list_of_arcs = self.BIVAS.networkx_findpath(self.startNode, self.endNode)
         print(list_of_arcs)
 
+        offsets, arcIDs, lengths = self.BIVAS.networkx_findpath_batch([(self.startNode, self.endNode),
+                                                                       (self.endNode, self.startNode)])
+        print(arcIDs[offsets[0]:offsets[1]], lengths)
+
     def test_manualSql(self):
         sql = """SELECT * FROM ship_types"""
         ship_types = self.BIVAS.sql(sql)
@@ -153,6 +158,126 @@ class test_pyBIVAS(unittest.TestCase):
         df = self.BIVAS.arc_routes_on_network(self.arcIDs[:2], not_passing_arcID=self.arcIDs[-1])
         print(df.head(10).to_string())
 
+    def test_arcsTripdetails(self):
+        df = self.BIVAS.arcs_tripdetails(self.arcIDs)
+        print(df.head(10).to_string())
+        df = self.BIVAS.arcs_routestatistics(self.arcIDs)
+        print(df.head(10).to_string())
+
+    def test_chunks(self):
+        for df in self.BIVAS.routestatistics_advanced_chunks(group_by=['TripsID'], chunksize=10000):
+            print(df.head(10).to_string())
+            break
+        for df in self.BIVAS.arc_tripdetails_chunks(self.arcIDs[0], chunksize=1000):
+            print(df.head(10).to_string())
+            break
+
+    def test_readonlyProfile(self):
+        BIVAS = pyBIVAS(self.database_file, profile='readonly')
+        BIVAS.set_scenario()
+        df = BIVAS.routestatistics_advanced(group_by=['Vorm', 'NSTR'])
+        print(df.head(10).to_string())
+
+    def test_sqlParallel(self):
+        queries = {arcID: f'SELECT COUNT(*) FROM routes_{self.BIVAS.scenarioID} WHERE ArcID = {arcID}'
+                   for arcID in self.arcIDs}
+        dfs = self.BIVAS.sql_parallel(queries, max_workers=3)
+        for arcID, df in dfs.items():
+            print(arcID, df.to_string())
+        self.BIVAS.close_connection_pool()
+
+    def test_cube(self):
+        if self.skipSlowRuns:
+            self.skipTest('Skipping because this test takes very long')
+
+        self.BIVAS.enable_cube()
+        df = self.BIVAS.cube_rollup(['Days', 'NSTR'])
+        print(df.head(10).to_string())
+        df = self.BIVAS.cube_rollup(['ArcID', 'CEMT-klasse'], arcIDs=self.arcIDs)
+        print(df.head(10).to_string())
+        self.BIVAS.disable_cube()
+
+    def test_selectLink(self):
+        self.BIVAS.routes_incidence()  # Sparse matrix of trips and arcs, also used by arc_routes_on_network
+        df = self.BIVAS.select_link_network(passing_all=self.arcIDs[:2], passing_none=self.arcIDs[-1:])
+        print(df.head(10).to_string())
+        df = self.BIVAS.arc_routes_on_network(self.arcIDs[:2], not_passing_arcID=self.arcIDs[-1])
+        print(df.head(10).to_string())
+
+    def test_accelerationDatabase(self):
+        if self.skipSlowRuns:
+            self.skipTest('Skipping because this test takes very long')
+        self.BIVAS.build_acceleration_database()  # Copy of database with indexes, used automatically from now on
+        df = self.BIVAS.arc_routestatistics(self.arcID)
+        print(df.head(10).to_string())
+
+    def test_queryCache(self):
+        self.BIVAS.enable_query_cache()
+        for _ in range(2):
+            df = self.BIVAS.arc_tripdetails(self.arcID, extended=False)  # Second time from the cache
+        print(self.BIVAS.query_cache)
+        self.BIVAS.disable_query_cache()
+
+    def test_diskCache(self):
+        self.BIVAS.enable_disk_cache(self.exportdir / 'cache', min_seconds=0)
+        df = self.BIVAS.routestatistics_advanced()  # Stored on disk, a next session reads it from disk
+        print(self.BIVAS.disk_cache)
+        self.BIVAS.disk_cache.clear()
+        self.BIVAS.disable_disk_cache()
+
+    def test_scenarioTablesInMemory(self):
+        self.BIVAS.load_scenario_tables()  # Load trips, routes and route_statistics of the scenario in memory
+        df = self.BIVAS.routestatistics_advanced(group_by=['Days', 'Vorm', 'NSTR'])
+        print(df.head(10).to_string())
+        df = self.BIVAS.arc_tripdetails(self.arcID, extended=False)
+        print(df.head(10).to_string())
+        self.BIVAS.unload_scenario_tables()
+
+    def test_scenarioTablesCompactDtypes(self):
+        # Compact dtypes may not change the results computed from memory
+        self.BIVAS.load_scenario_tables()
+        expected = self.BIVAS.routestatistics_advanced(group_by=['Days', 'NSTR'])
+        self.BIVAS.enable_compact_dtypes()
+        self.BIVAS.load_scenario_tables()
+        df = self.BIVAS.routestatistics_advanced(group_by=['Days', 'NSTR'])
+        self.BIVAS.disable_compact_dtypes()
+        self.BIVAS.unload_scenario_tables()
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False, check_categorical=False)
+
+    def test_scenarioRelaxation(self):
+        per_trip, per_arc = self.BIVAS.scenario_relaxation()  # Relaxation penalties of all trips at once
+        print(per_trip.head(10).to_string())
+        print(per_arc.sort_values('Relaxation_penalty').tail(10).to_string())
+
+    def test_scenarioDiff(self):
+        case = pyBIVAS(self.database_file)
+        case.set_scenario()
+        df = self.BIVAS.scenario_diff({'case': case}, limit=100)  # Differences per trip, computed by SQLite
+        print(df.head(10).to_string())
+
+    def test_lookupTables(self):
+        self.BIVAS.enable_lookup_tables()  # Descriptions of ship types, NSTR classes etc. are added in pandas
+        df = self.BIVAS.arc_tripdetails(self.arcID)
+        print(df.head(10).to_string())
+        df = self.BIVAS.route_stats(self.routeID)
+        print(df.to_string())
+        self.BIVAS.disable_lookup_tables()
+
+    def test_zoneODMatrix(self):
+        od = self.BIVAS.zone_od_matrix(by='NSTR')  # All trips between all zones at once
+        print(od.frame('Totale Vracht (ton)').iloc[:10, :10].to_string())
+        print(od.cube('Aantal Vaarbewegingen (-)').shape)
+
+    def test_nodesStatistics(self):
+        trafficScenarioId = self.BIVAS.trafficScenario
+        dfs = self.BIVAS.nodes_timeseries(trafficScenarioId)  # All nodes at once
+        df = self.BIVAS.nodes_statistics(trafficScenarioId, 'nstr_mapping.GroupCode', 'nstr_mapping.GroupCode',
+                                         ['Origin', 'Destination'])
+        print(df.head(10).to_string())
+        NodeID = df.index[0]
+        print(self.BIVAS.nodes_timeseries_slice(dfs, NodeID).head(10).to_string())
+        print(self.BIVAS.nodes_statistics_slice(df, NodeID).to_string())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,30 @@
+from unittest import TestCase
+from pathlib import Path
+import sqlite3
+import tempfile
+from pyBIVAS.SQL import pyBIVAS
+
+
+class TestAccelerationDatabase(TestCase):
+
+    def build(self, columns):
+        """Indexes of the acceleration database of a database with only reference_trip_set"""
+        with tempfile.TemporaryDirectory() as directory:
+            databasefile = Path(directory) / 'bivas.db'
+            con = sqlite3.connect(databasefile)
+            con.execute('CREATE TABLE reference_trip_set ({})'.format(', '.join(columns)))
+            con.commit()
+            con.close()
+
+            BIVAS = pyBIVAS(databasefile)
+            BIVAS.build_acceleration_database()
+            indexes = BIVAS.sql("SELECT name FROM sqlite_master WHERE type='index'")['name'].tolist()
+            BIVAS.connection.close()
+        return indexes
+
+    def test_reference_trip_set(self):
+        # The columns of reference_trip_set differ between versions of BIVAS, each gets its own index
+        self.assertEqual(self.build(['ReferenceTripSet', 'Arc', 'Trip']),
+                         ['pyBIVAS_reference_trip_set_ReferenceTripSet_Arc_Trip'])
+        self.assertEqual(self.build(['ReferenceSetID', 'CountingPointID', 'TripID']),
+                         ['pyBIVAS_reference_trip_set_ReferenceSetID_CountingPointID_TripID'])
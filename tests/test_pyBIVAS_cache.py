@@ -0,0 +1,73 @@
+from unittest import TestCase
+import tempfile
+import pandas as pd
+from pyBIVAS.cache import QueryCache, DiskCache, normalize_sql, sql_tables
+
+
+class TestQueryCache(TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({'a': range(100), 'b': 1.5})
+        self.nbytes = self.df.memory_usage(deep=True).sum()
+
+    def test_normalize_sql(self):
+        self.assertEqual(normalize_sql('SELECT  *\n   FROM trips '), 'SELECT * FROM trips')
+        self.assertEqual(normalize_sql('SELECT * FROM zones WHERE Name = "a  b"'),
+                         'SELECT * FROM zones WHERE Name = "a  b"')
+
+    def test_sql_tables(self):
+        sql = 'SELECT * FROM trips_1 AS trips LEFT JOIN `branching$branch_sets` AS BS ON trips.ID = BS.Id'
+        self.assertEqual(sql_tables(sql), ['branching$branch_sets', 'trips_1'])
+
+    def test_hit_and_miss(self):
+        cache = QueryCache()
+        key = cache.key('SELECT * FROM trips', 'db')
+        self.assertIsNone(cache.get(key))
+        cache.put(key, self.df)
+        pd.testing.assert_frame_equal(cache.get(cache.key('SELECT *   FROM trips', 'db')), self.df)
+        self.assertIsNone(cache.get(cache.key('SELECT * FROM trips', 'other_db')))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_result_is_copy(self):
+        cache = QueryCache()
+        cache.put('key', self.df.copy())
+        df = cache.get('key')
+        df.loc[0, 'a'] = -1
+        self.assertEqual(cache.get('key').loc[0, 'a'], 0)
+
+    def test_eviction(self):
+        cache = QueryCache(max_bytes=2.5 * self.nbytes)
+        cache.put('key1', self.df)
+        cache.put('key2', self.df)
+        cache.get('key1')
+        cache.put('key3', self.df)
+        self.assertIsNone(cache.get('key2'))
+        self.assertIsNotNone(cache.get('key1'))
+        self.assertLessEqual(cache.nbytes, cache.max_bytes)
+
+    def test_invalidate(self):
+        cache = QueryCache()
+        cache.put(('db1', 'SELECT 1'), self.df)
+        cache.put(('db2', 'SELECT 1'), self.df)
+        cache.invalidate('db1')
+        self.assertEqual(len(cache), 1)
+        cache.invalidate()
+        self.assertEqual((len(cache), cache.nbytes), (0, 0))
+
+
+class TestDiskCache(TestCase):
+
+    def test_store_and_load(self):
+        df = pd.DataFrame({'a': range(10), 'b': 'text'}).set_index('a')
+        with tempfile.TemporaryDirectory() as cachedir:
+            cache = DiskCache(cachedir)
+            key = ('SELECT * FROM trips', (('trips', (10, 10)),))
+            self.assertIsNone(cache.get(key))
+            cache.put(key, df)
+
+            cache = DiskCache(cachedir)
+            pd.testing.assert_frame_equal(cache.get(key), df)
+            self.assertIsNone(cache.get(('SELECT * FROM trips', (('trips', (11, 11)),))))
+
+            cache.clear()
+            self.assertIsNone(cache.get(key))
@@ -0,0 +1,57 @@
+from unittest import TestCase
+from pyBIVAS.dialect import to_duckdb, to_mysql
+
+
+class TestDuckDBDialect(TestCase):
+
+    def test_literals(self):
+        sql = 'SELECT * FROM zones WHERE Name = "Lobith" AND Type IN ("a", "b") AND `Id` == 1'
+        self.assertEqual(to_duckdb(sql),
+                         """SELECT * FROM zones WHERE Name = 'Lobith' AND Type IN ('a', 'b') AND "Id" = 1""")
+
+    def test_identifiers(self):
+        sql = 'SELECT trips.ID AS "TripID", count(*) AS "Aantal" FROM trips_1 AS trips'
+        self.assertEqual(to_duckdb(sql), sql)
+
+    def test_date(self):
+        self.assertEqual(to_duckdb('SELECT DATE(trips.DateTime) AS "Days" FROM trips'),
+                         """SELECT strftime(CAST((trips.DateTime) AS TIMESTAMP), '%Y-%m-%d') AS "Days" FROM trips""")
+
+    def test_order_by_groups(self):
+        sql = 'SELECT NstrGoodsClassification, count(x) AS n FROM trips GROUP BY NstrGoodsClassification, ArcID'
+        self.assertEqual(to_duckdb(sql), sql + '\nORDER BY NstrGoodsClassification NULLS FIRST, ArcID NULLS FIRST')
+
+        sql = 'SELECT ArcID, count(*) AS n FROM trips GROUP BY ArcID ORDER BY ArcID'
+        self.assertEqual(to_duckdb(sql), sql)
+
+    def test_any_value(self):
+        sql = ('SELECT trips.*, nstr_mapping.GroupCode AS NSTR, DATE(DateTime) AS "Days", routes.OriginalArcDirection, '
+               'count(*) AS n FROM trips GROUP BY trips.ID, "Days" ORDER BY trips.ID')
+        self.assertEqual(to_duckdb(sql),
+                         "SELECT ANY_VALUE(COLUMNS(trips.*)), ANY_VALUE(nstr_mapping.GroupCode) AS NSTR, "
+                         "strftime(CAST((DateTime) AS TIMESTAMP), '%Y-%m-%d') AS \"Days\", "
+                         "ANY_VALUE(routes.OriginalArcDirection) AS \"OriginalArcDirection\", "
+                         "count(*) AS n FROM trips GROUP BY trips.ID, \"Days\" ORDER BY trips.ID")
+
+        sql = 'SELECT NstrGoodsClassification AS NSTR, count(*) AS n FROM trips GROUP BY NSTR ORDER BY NSTR'
+        self.assertEqual(to_duckdb(sql), sql)
+
+    def test_names(self):
+        # Expressions without alias get the name SQLite gives them
+        self.assertEqual(to_duckdb('SELECT ID, trips.Name, count(*) FROM trips'),
+                         'SELECT ID, trips.Name, count(*) AS "count(*)" FROM trips')
+
+    def test_compensated_sums(self):
+        sql = 'SELECT SUM(a * b) + SUM(c) AS s, AVG(a) FROM trips'
+        self.assertEqual(to_duckdb(sql),
+                         'SELECT FSUM(a * b) + FSUM(c) AS s, (FSUM(a) / COUNT(a)) AS "AVG(a)" FROM trips')
+        self.assertEqual(to_duckdb(sql, compensated=False),
+                         'SELECT SUM(a * b) + SUM(c) AS s, AVG(a) AS "AVG(a)" FROM trips')
+
+
+class TestMySQLDialect(TestCase):
+
+    def test_identifiers(self):
+        sql = 'SELECT DATE(DateTime) AS "Days", `Label` FROM trips WHERE Name == "a" GROUP BY "Days"'
+        self.assertEqual(to_mysql(sql),
+                         "SELECT DATE(DateTime) AS `Days`, `Label` FROM trips WHERE Name = 'a' GROUP BY `Days`")
@@ -0,0 +1,55 @@
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from pyBIVAS.dtypes import compact_dtypes, relabel
+
+
+class TestCompactDtypes(TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'ID': np.arange(1000, dtype=np.int64),
+            'Vorm': ['Droge bulk', 'Overig'] * 500,
+            'Length__m': np.tile([85.0, 110.0, np.nan, 135.0], 250),
+            'TotalWeight__t': np.linspace(0, 1, 1000),
+            'Name': ['a', 'b'] * 500,
+        })
+
+    def test_dtypes(self):
+        df = compact_dtypes(self.df)
+        self.assertEqual(df['ID'].dtype, np.int16)
+        self.assertIsInstance(df['Vorm'].dtype, pd.CategoricalDtype)
+        self.assertEqual(df['Length__m'].dtype, np.float32)
+        self.assertEqual(df['TotalWeight__t'].dtype, np.float64)  # Not exact in float32
+        self.assertFalse(isinstance(df['Name'].dtype, pd.CategoricalDtype))  # Not a lookup column
+        self.assertLess(df.memory_usage(deep=True).sum(), self.df.memory_usage(deep=True).sum())
+        pd.testing.assert_frame_equal(df.astype(self.df.dtypes), self.df)
+
+    def test_duplicate_columns(self):
+        df = pd.concat([self.df, self.df[['ID']]], axis=1)
+        df = compact_dtypes(df)
+        self.assertEqual(list(df.dtypes.iloc[[0, -1]]), [np.int16, np.int16])
+
+    def test_relabel(self):
+        df = compact_dtypes(self.df)
+        df = relabel(df, {'Vorm': {'Overig': 'Leeg'}, 'NSTR': {0: 'Landbouw'}})
+        self.assertEqual(list(df['Vorm'].cat.categories), ['Droge bulk', 'Leeg'])
+        self.assertEqual(relabel(self.df, {'Vorm': {'Overig': 'Leeg'}})['Vorm'].tolist(), df['Vorm'].tolist())
+
+    def test_aggregate_route_statistics(self):
+        from pyBIVAS.SQL import pyBIVAS
+
+        rng = np.random.default_rng(1)
+        df = pd.DataFrame({
+            'NumberOfTrips': rng.integers(1, 100, 20000),
+            'TwentyFeetEquivalentUnits': rng.integers(0, 2000, 20000),
+            'TotalWeight__t': rng.uniform(0, 3000, 20000).round(1),
+            'Distance__km': rng.uniform(0, 500, 20000).round(1),
+            'TravelTime__min': rng.uniform(0, 1000, 20000).round(),
+            'VariableTimeCosts__Eur': rng.uniform(0, 1000, 20000).round(),
+            'VariableDistanceCosts__Eur': rng.uniform(0, 1000, 20000).round(),
+            'FixedCosts__Eur': np.full(20000, 10.0),
+        })
+        expected = pyBIVAS._aggregate_route_statistics(df)
+        result = pyBIVAS._aggregate_route_statistics(compact_dtypes(df))
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
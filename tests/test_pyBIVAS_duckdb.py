@@ -0,0 +1,153 @@
+from unittest import TestCase
+from pathlib import Path
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+from pyBIVAS.SQL import pyBIVAS
+
+
+def sqlite_extension_available():
+    """Whether DuckDB can load its sqlite extension without installing it"""
+    try:
+        import duckdb
+        duckdb.connect().execute('LOAD sqlite')
+    except Exception:
+        return False
+    return True
+
+
+class TestDuckDBEngine(TestCase):
+    """
+    The query builders give the same results on DuckDB as on SQLite: the same columns, types, index and values. Sums
+    of floats may differ in the last bit, because the engines add the values in a different order.
+    """
+
+    def setUp(self):
+        if not sqlite_extension_available():
+            self.skipTest('The sqlite extension of DuckDB is not available')
+
+        rng = np.random.default_rng(1)
+        n = 400
+        trips = pd.DataFrame({
+            'ID': np.arange(1, n + 1),
+            'TrafficScenarioID': 1,
+            'DateTime': (pd.Timestamp('2018-01-01 08:00') +
+                         pd.to_timedelta(rng.integers(0, 20, n), unit='D')).astype(str),
+            'SeasonID': 1,
+            'ShipTypeID': rng.integers(1, 5, n),
+            'NstrGoodsClassification': rng.integers(-1, 4, n),  # 3 is not in nstr_mapping
+            'Nst2007GoodsClassification': rng.integers(1, 4, n),
+            'AppearanceTypeID': rng.integers(1, 4, n),
+            'DangerousGoodsLevelID': 1,
+            'LoadTypeID': rng.integers(1, 3, n),
+            'OriginTripEndPointNodeID': rng.integers(1, 6, n),
+            'DestinationTripEndPointNodeID': rng.integers(1, 6, n),
+            'NumberOfTrips': rng.integers(0, 3, n),
+            'TotalWeight__t': rng.uniform(0, 3000, n).round(1),
+            'TwentyFeetEquivalentUnits': pd.array(rng.integers(0, 50, n), dtype='Int64'),
+            'LoadCapacity__t': rng.uniform(3000, 4000, n).round(1),
+            'Length__m': rng.uniform(50, 135, n).round(1),
+            'Width__m': rng.uniform(6, 17, n).round(1),
+            'Depth__m': rng.uniform(2, 4, n).round(2),
+        })
+        # Integer sums over groups with and without NULL values
+        trips.loc[trips['NstrGoodsClassification'] == 2, 'TwentyFeetEquivalentUnits'] = pd.NA
+        trips.loc[trips.index % 7 == 0, 'TwentyFeetEquivalentUnits'] = pd.NA
+
+        route_statistics = pd.DataFrame({
+            'TripID': trips['ID'],
+            'TravelTime__min': rng.uniform(10, 1000, n).round(2),
+            'VariableTimeCosts__Eur': rng.uniform(10, 1000, n).round(2),
+            'VariableDistanceCosts__Eur': rng.uniform(10, 1000, n).round(2),
+            'FixedCosts__Eur': rng.uniform(10, 1000, n).round(2),
+            'Distance__km': rng.uniform(1, 300, n).round(2),
+        })
+        arcs = rng.random((n, 6)) < 0.4
+        tripIDs, arcIDs = np.nonzero(arcs)
+        routes = pd.DataFrame({'TripID': tripIDs + 1, 'ArcID': arcIDs + 1,
+                               'OriginalArcDirection': rng.integers(0, 2, len(tripIDs))})
+
+        tables = {
+            'trips_1': trips,
+            'trips': trips,
+            'route_statistics_1': route_statistics,
+            'routes_1': routes,
+            'reference_trip_set': routes.rename(columns={'TripID': 'Trip', 'ArcID': 'Arc'})
+                                        .drop(columns='OriginalArcDirection').assign(ReferenceTripSet=1),
+            'nstr_mapping': pd.DataFrame({'GroupCode': [-1, 0, 1, 2], 'Description': ['Leeg', 'a', 'b', 'c']}),
+            'nst2007_mapping': pd.DataFrame({'Id': [1, 2, 3], 'GroupCode': ['A', 'B', 'C'],
+                                             'Description': ['x', 'y', 'z']}),
+            'appearance_types': pd.DataFrame({'ID': [1, 2, 3], 'Description': ['Overig', 'Bulk', 'Container']}),
+            'ship_types': pd.DataFrame({'ID': [1, 2, 3, 4], 'Label': ['M1', 'M2', 'M3', 'M4'],
+                                        'Description': ['s1', 's2', 's3', 's4'], 'CEMTTypeID': [1, 1, 2, 3]}),
+            'cemt_class': pd.DataFrame({'Id': [1, 2, 3], 'Description': ['I', 'II', 'III']}),
+            'dangerous_goods_levels': pd.DataFrame({'ID': [1], 'Description': ['Geen']}),
+            'load_types': pd.DataFrame({'ID': [1, 2], 'Description': ['Leeg', 'Bulk']}),
+            'nodes': pd.DataFrame({'ID': [1, 2, 3, 4, 5], 'XCoordinate': [1.5, 2.5, 3.5, 4.5, 5.5],
+                                   'YCoordinate': [5.5, 4.5, 3.5, 2.5, 1.5]}),
+            'zones': pd.DataFrame({'ID': [1, 2, 3], 'Name': ['Noord', 'Zuid', 'West'], 'ZoneDefinitionID': 9}),
+            'zone_node_mapping': pd.DataFrame({'NodeID': [1, 2, 3, 4], 'ZoneID': [1, 1, 2, 3], 'ZoneDefinitionID': 9}),
+            'counting_points': pd.DataFrame({'ID': [1, 2], 'Name': ['Lobith', 'Lobith'], 'DirectionID': [1, 2]}),
+            'counting_point_arcs': pd.DataFrame({'ArcID': [1, 2], 'CountingPointID': [1, 2]}),
+            'directions': pd.DataFrame({'ID': [1, 2], 'Label': ['Upstream', 'Downstream']}),
+        }
+
+        self.directory = tempfile.TemporaryDirectory()
+        databasefile = Path(self.directory.name) / 'bivas.db'
+        con = sqlite3.connect(databasefile)
+        for name, df in tables.items():
+            df.to_sql(name, con, index=False)
+        con.close()
+
+        self.BIVAS = pyBIVAS(databasefile)
+        self.BIVAS.scenarioID = 1
+        self.BIVAS.trafficScenario = 1
+        self.BIVAS.ReferenceTripSetID = 1
+
+    def tearDown(self):
+        self.BIVAS.set_engine('sqlite')
+        self.BIVAS.connection.close()
+        self.directory.cleanup()
+
+    def assertEngineEqual(self, function):
+        """Result of function on SQLite and on DuckDB, where DuckDB must execute all queries itself"""
+        self.BIVAS.set_engine('sqlite')
+        expected = function()
+
+        self.BIVAS.set_engine('duckdb')
+        read_sql_duckdb = self.BIVAS._read_sql_duckdb
+
+        def _read_sql_duckdb(sql):
+            df = read_sql_duckdb(sql)
+            self.assertIsNotNone(df, f'DuckDB could not execute: {sql}')
+            return df
+
+        self.BIVAS._read_sql_duckdb = _read_sql_duckdb
+        try:
+            result = function()
+        finally:
+            del self.BIVAS._read_sql_duckdb
+
+        if isinstance(expected, pd.Series):
+            pd.testing.assert_series_equal(result, expected, check_exact=False, rtol=1e-12, atol=0)
+        else:
+            pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12, atol=0)
+
+    def test_routestatistics_advanced(self):
+        for group_by in [None, ['Days'], ['NSTR'], ['Vorm'], ['NST2007'], ['Vorm', 'NSTR'], ['Origin_Node'],
+                         ['Destination_Node'], ['Origin_Zone'], ['Destination_Zone'], ['TripsID']]:
+            with self.subTest(group_by=group_by):
+                self.assertEngineEqual(lambda: self.BIVAS.routestatistics_advanced(group_by=group_by))
+
+    def test_arc_tripdetails(self):
+        # Other groupings return the values of an arbitrary trip of the group, which differs between the engines
+        for extended, group_by in [(True, None), (False, None), (True, 'trips.ID')]:
+            with self.subTest(extended=extended, group_by=group_by):
+                self.assertEngineEqual(lambda: self.BIVAS.arc_tripdetails(1, extended=extended, group_by=group_by))
+
+    def test_countingpoint_timeseries(self):
+        for pivot in [None, 'Vaarrichting', 'Bestemming', 'Herkomst', 'Scheepvaartklasse', 'CEMT-klasse']:
+            with self.subTest(pivot=pivot):
+                self.assertEngineEqual(lambda: self.BIVAS.countingpoint_timeseries('Lobith', pivot=pivot))
+                self.assertEngineEqual(lambda: self.BIVAS.countingpoints_timeseries(pivot=pivot))
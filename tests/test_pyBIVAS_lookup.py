@@ -0,0 +1,52 @@
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from pyBIVAS.lookup import LookupTables
+
+
+class TestLookupTables(TestCase):
+
+    def setUp(self):
+        self.tables = {
+            'ship_types': pd.DataFrame({'ID': [1, 2, 3], 'Label': ['M1', 'M2', 'M3'], 'CEMTTypeID': [2, 1, 2]}),
+            'cemt_class': pd.DataFrame({'Id': [1, 2], 'Description': ['I', 'II']}),
+        }
+        self.queries = []
+
+        def read_sql(sql):
+            self.queries.append(sql)
+            return self.tables[sql.split()[-1]]
+
+        self.lookup = LookupTables(read_sql)
+
+    def test_map(self):
+        keys = np.array([3, 1, 4, 1])
+        labels = self.lookup.map('ship_types', 'Label', keys)
+        self.assertEqual(list(labels[[0, 1, 3]]), ['M3', 'M1', 'M1'])
+        self.assertTrue(pd.isna(labels[2]))
+
+        # Through ship_types, with a case-insensitive column name
+        self.assertEqual(list(self.lookup.map('cemt_class', 'description', keys)[[0, 1]]), ['II', 'II'])
+
+        categorical = self.lookup.map('ship_types', 'Label', keys, categorical=True)
+        self.assertIsInstance(categorical, pd.Categorical)
+        self.assertEqual(list(categorical.astype(object)[[0, 1]]), ['M3', 'M1'])
+
+    def test_read_once(self):
+        df = pd.DataFrame({'ShipTypeID': [1, 2]})
+        df = self.lookup.join(df, {'ship_types_Label': ('ship_types', 'Label'),
+                                   'CEMTTypeID': ('ship_types', 'CEMTTypeID')})
+        self.assertEqual(df['ship_types_Label'].tolist(), ['M1', 'M2'])
+        self.assertEqual(self.queries, ['SELECT * FROM ship_types'])
+
+        self.lookup.invalidate()
+        self.lookup['ship_types']
+        self.assertEqual(len(self.queries), 2)
+
+    def test_groupby_field(self):
+        self.assertEqual(self.lookup.groupby_field('ship_types.Label', 'CEMTTypeID, ship_types.ID'),
+                         ('ship_types', 'Label', ['CEMTTypeID', 'ID']))
+        self.assertIsNone(self.lookup.groupby_field('ship_types.Label', 'trips.ID'))
+        self.assertIsNone(self.lookup.groupby_field('zones.Name', 'zones.Name'))
+        self.assertEqual(self.lookup.sorted_labels('ship_types', 'Label', ['CEMTTypeID', 'ID'], ['M1', 'M2', 'M3']),
+                         ['M2', 'M1', 'M3'])
@@ -0,0 +1,68 @@
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+import networkx as nx
+from pyBIVAS.network import RoutingGraph
+from pyBIVAS.SQL import pyBIVAS
+
+
+class TestRoutingGraph(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        n = 300
+        self.arcs = pd.DataFrame({
+            'ID': np.arange(1, 4 * n + 1),
+            'FromNodeID': rng.integers(1000, 1000 + n, 4 * n),
+            'ToNodeID': rng.integers(1000, 1000 + n, 4 * n),
+            'Length__m': rng.uniform(10, 1000, 4 * n).round(),
+        })
+        self.G = nx.from_pandas_edgelist(self.arcs, 'FromNodeID', 'ToNodeID', edge_attr=True)
+        self.routing = RoutingGraph(self.arcs['ID'], self.arcs['FromNodeID'], self.arcs['ToNodeID'],
+                                    self.arcs['Length__m'])
+
+    def length(self, arcIDs):
+        return self.arcs.set_index('ID').loc[arcIDs, 'Length__m'].sum()
+
+    def test_path(self):
+        source, target = 1000, 1100
+        nodes, arcs = self.routing.path(source, target)
+        self.assertEqual((nodes[0], nodes[-1]), (source, target))
+        for a, b, arcID in zip(nodes[:-1], nodes[1:], arcs):
+            self.assertEqual(self.G[a][b]['ID'], arcID)  # Same arcs as NetworkX for parallel arcs
+        self.assertAlmostEqual(self.length(arcs), nx.dijkstra_path_length(self.G, source, target, weight='Length__m'))
+
+    def test_paths(self):
+        pairs = [(1000, 1100), (1000, 1200), (1050, 1000), (1100, 1100)]
+        for (source, target), (nodes, arcs) in zip(pairs, self.routing.paths(pairs)):
+            self.assertAlmostEqual(self.length(arcs),
+                                   nx.dijkstra_path_length(self.G, source, target, weight='Length__m'))
+        self.assertEqual(len(self.routing.paths(pairs)[-1][1]), 0)
+
+    def test_missing_node(self):
+        with self.assertRaises(nx.NodeNotFound):
+            self.routing.path(1000, 1)
+
+    def test_arc_paths(self):
+        pairs = [(1000, 1100), (1050, 1000), (1000, 1200), (1100, 1100), (1000, 1100)]
+        for max_workers in [1, 2]:
+            offsets, arcIDs, lengths = self.routing.arc_paths(pairs, max_workers=max_workers, sources_per_task=1)
+            self.assertEqual(len(offsets), len(pairs) + 1)
+            for i, (source, target) in enumerate(pairs):
+                arcs = arcIDs[offsets[i]:offsets[i + 1]]
+                np.testing.assert_array_equal(arcs, self.routing.path(source, target)[1])
+                self.assertAlmostEqual(lengths[i], self.length(arcs))
+
+
+class TestNodeLabels(TestCase):
+
+    def test_node_labels(self):
+        arcs = pd.DataFrame({
+            'ID': [4, 3, 2, 1],
+            'FromNodeID': [10, 11, 12, 13],
+            'ToNodeID': [11, 12, 13, 14],
+            'Name': ['Waal', 'Lek/Nederrijn', '', None],
+        })
+        labels = pyBIVAS._node_labels(arcs)
+        # The arc with the lowest named ID per node, empty and missing names are skipped
+        self.assertEqual(labels.to_dict(), {10: 'Waal', 11: 'Lek-Nederrijn', 12: 'Lek-Nederrijn'})
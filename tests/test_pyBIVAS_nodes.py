@@ -0,0 +1,61 @@
+from unittest import TestCase
+from pathlib import Path
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+from pyBIVAS.SQL import pyBIVAS
+
+
+class TestNodes(TestCase):
+    """The statistics of all nodes at once give the same result as the queries per node"""
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        n = 500
+        trips = pd.DataFrame({
+            'ID': np.arange(1, n + 1),
+            'TrafficScenarioID': 1,
+            'OriginTripEndPointNodeID': rng.integers(1, 6, n),
+            'DestinationTripEndPointNodeID': rng.integers(1, 6, n),
+            # Node 5 only has trips in 2019, the other nodes start in 2018
+            'DateTime': (pd.Timestamp('2018-01-01') + pd.to_timedelta(rng.integers(0, 540, n), unit='D')).astype(str),
+            'NumberOfTrips': rng.integers(0, 3, n),
+            'LoadTypeID': rng.integers(1, 4, n),
+        })
+        for column in ['ShipTypeID', 'NstrGoodsClassification', 'AppearanceTypeID', 'DangerousGoodsLevelID']:
+            trips[column] = 1
+        late = (trips['OriginTripEndPointNodeID'] == 5) | (trips['DestinationTripEndPointNodeID'] == 5)
+        trips.loc[late, 'DateTime'] = '2019-03-01 12:00:00'
+
+        self.directory = tempfile.TemporaryDirectory()
+        databasefile = Path(self.directory.name) / 'bivas.db'
+        con = sqlite3.connect(databasefile)
+        trips.to_sql('trips', con, index=False)
+        for table, columns in [('ship_types', 'ID, CEMTTypeID'), ('nstr_mapping', 'GroupCode'),
+                               ('cemt_class', 'Id'), ('appearance_types', 'ID'),
+                               ('dangerous_goods_levels', 'ID'), ('load_types', 'ID, Description')]:
+            con.execute(f'CREATE TABLE {table} ({columns})')
+        con.executemany('INSERT INTO load_types VALUES (?, ?)', [(1, 'Leeg'), (2, 'Bulk'), (3, 'Container')])
+        con.commit()
+        con.close()
+        self.BIVAS = pyBIVAS(databasefile)
+
+    def tearDown(self):
+        self.BIVAS.connection.close()
+        self.directory.cleanup()
+
+    def test_nodes_timeseries(self):
+        dfs = self.BIVAS.nodes_timeseries(1)
+        for NodeID in range(1, 6):
+            expected = self.BIVAS.node_timeseries(NodeID, 1)
+            pd.testing.assert_frame_equal(pyBIVAS.nodes_timeseries_slice(dfs, NodeID), expected, check_freq=False)
+        self.assertIsNone(pyBIVAS.nodes_timeseries_slice(dfs, 6))
+
+    def test_nodes_statistics(self):
+        args = ('load_types.Description', 'load_types.ID', ['Origin', 'Destination'])
+        df = self.BIVAS.nodes_statistics(1, *args)
+        for NodeID in range(1, 6):
+            expected = self.BIVAS.node_statistics(NodeID, 1, *args)
+            s = pyBIVAS.nodes_statistics_slice(df, NodeID)
+            pd.testing.assert_series_equal(s, expected[expected > 0].astype(s.dtype), check_names=False)
@@ -0,0 +1,38 @@
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from pyBIVAS.od import ODMatrix
+
+
+class TestODMatrix(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        n = 200
+        self.trips = pd.DataFrame({
+            'Origin': rng.integers(0, 5, n),
+            'Destination': rng.integers(0, 5, n),
+            'Category': rng.integers(0, 3, n),
+            'Aantal': rng.integers(1, 4, n).astype(float),
+        })
+        df = self.trips.groupby(['Origin', 'Destination', 'Category']).sum().reset_index()
+        self.od = ODMatrix(['A', 'B', 'C', 'D', 'E'], df['Origin'], df['Destination'], df[['Aantal']],
+                           categories=['x', 'y', 'z'], codes=df['Category'])
+
+    def expected(self, trips):
+        matrix = np.zeros((5, 5))
+        np.add.at(matrix, (trips['Origin'], trips['Destination']), trips['Aantal'])
+        return matrix
+
+    def test_dense(self):
+        np.testing.assert_allclose(self.od.dense('Aantal'), self.expected(self.trips))
+        np.testing.assert_allclose(self.od.dense('Aantal', category='y'),
+                                   self.expected(self.trips[self.trips['Category'] == 1]))
+        self.assertEqual(self.od.sparse('Aantal').shape, (5, 5))
+        self.assertEqual(list(self.od.frame('Aantal').index), ['A', 'B', 'C', 'D', 'E'])
+
+    def test_cube(self):
+        cube = self.od.cube('Aantal')
+        self.assertEqual(cube.shape, (3, 5, 5))
+        for i, category in enumerate(['x', 'y', 'z']):
+            np.testing.assert_allclose(cube[i], self.od.dense('Aantal', category=category))
@@ -70,6 +70,13 @@ class Test_IVS90_analyse(TestCase):
     def test_plot_CountingPointsForYear(self):
         self.BIVAS.plot_countingpoint_timeseries()
 
+    def test_countingpointsTimeseries(self):
+        df = self.BIVAS.countingpoints_timeseries(pivot='CEMT-klasse')  # All counting points at once
+        print(df.head(10).to_string())
+        name = df.index.get_level_values('Telpunt')[0]
+        series = self.BIVAS.countingpoints_timeseries_slice(df, name, pivot='CEMT-klasse')
+        self.assertTrue(series.equals(self.BIVAS.countingpoint_timeseries(name, pivot='CEMT-klasse')))
+
     def test_plot_CEMTclassesForYear(self):
         self.BIVAS.plot_countingpoint_piechart_CEMTclasses()
 
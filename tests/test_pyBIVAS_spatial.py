@@ -0,0 +1,45 @@
+from unittest import TestCase
+import numpy as np
+import shapely
+from pyBIVAS.spatial import SpatialIndex
+
+
+class TestSpatialIndex(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        n = 500
+        start = rng.uniform(0, 10000, (n, 2))
+        end = start + rng.uniform(-500, 500, (n, 2))
+        self.IDs = np.arange(1, n + 1) * 10
+        self.geometries = shapely.linestrings(np.stack([start, end], axis=1))
+        self.index = SpatialIndex(self.IDs, self.geometries)
+
+    def test_nearest(self):
+        ID, distance = self.index.nearest(5000, 5000)
+        distances = shapely.distance(self.geometries, shapely.Point(5000, 5000))
+        self.assertEqual(ID, self.IDs[np.argmin(distances)])
+        self.assertAlmostEqual(distance, distances.min())
+        self.assertEqual(self.index.nearest(-1e6, -1e6, max_distance=1), (None, np.inf))
+
+    def test_snap(self):
+        rng = np.random.default_rng(2)
+        x, y = rng.uniform(0, 10000, (2, 1000))
+        df = self.index.snap(x, y)
+        self.assertEqual(len(df), 1000)
+        for i in range(0, 1000, 100):
+            distances = shapely.distance(self.geometries, shapely.Point(x[i], y[i]))
+            self.assertAlmostEqual(df['Distance'][i], distances.min())
+            snapped = shapely.Point(df['X'][i], df['Y'][i])
+            self.assertAlmostEqual(shapely.distance(snapped, shapely.Point(x[i], y[i])), df['Distance'][i])
+
+        df = self.index.snap([-1e6], [-1e6], max_distance=1)
+        self.assertTrue(np.isnan(df['ID'][0]) and np.isinf(df['Distance'][0]))
+
+    def test_within(self):
+        polygon = shapely.box(2000, 2000, 4000, 4000)
+        expected = self.IDs[shapely.intersects(self.geometries, polygon)]
+        np.testing.assert_array_equal(self.index.within(polygon), np.sort(expected))
+
+        expected = self.IDs[shapely.distance(self.geometries, shapely.Point(5000, 5000)) <= 800]
+        np.testing.assert_array_equal(self.index.within_distance(5000, 5000, 800), np.sort(expected))